@@ -0,0 +1,292 @@
+"""
+In-process approximate nearest-neighbour index for the local vector backend.
+
+An IVF (inverted file) index with spherical k-means coarse centroids is kept
+per team, so a team_id-filtered query only probes that team's partition
+instead of scanning (or post-filtering) the whole namespace. Queries probe
+the ANN_NPROBE closest lists and the candidates are re-scored exactly by the
+caller.
+
+Partitions are trained in the background once a team has ANN_MIN_VECTORS
+vectors; until then (and for unfiltered queries) the caller does an exact
+scan. Vectors upserted by this process are assigned to their nearest list on
+the write path, and deletes are tombstoned there. Writes by other processes
+are picked up by a background sync, so queries never scan a team's rows to
+catch up. Once ANN_REBUILD_RATIO of a partition is dead, or the team has
+grown ANN_REGROW_FACTOR times since training, the partition is rebuilt in the
+background and swapped in.
+
+Knobs: ANN_NLIST (0 = sqrt(n)), ANN_NPROBE (more lists = better recall,
+slower queries), ANN_KMEANS_ITERS, ANN_TRAIN_SAMPLE.
+"""
+
+import os
+import math
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+from dotenv import load_dotenv
+
+import numpy as np
+
+load_dotenv()
+
+# Configuration
+ANN_ENABLED = os.getenv("ANN_ENABLED", "true").lower() in ("1", "true", "yes")
+ANN_MIN_VECTORS = int(os.getenv("ANN_MIN_VECTORS", "5000"))
+ANN_NLIST = int(os.getenv("ANN_NLIST", "0"))
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", "16"))
+ANN_KMEANS_ITERS = int(os.getenv("ANN_KMEANS_ITERS", "10"))
+ANN_TRAIN_SAMPLE = int(os.getenv("ANN_TRAIN_SAMPLE", "50000"))
+ANN_REBUILD_RATIO = float(os.getenv("ANN_REBUILD_RATIO", "0.2"))
+ANN_REGROW_FACTOR = float(os.getenv("ANN_REGROW_FACTOR", "4"))
+
+# Rows read from the vector store per step while training / assigning
+_LOAD_BATCH = 8192
+
+_builder = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ann-build")
+
+# load_vectors(positions) -> normalised float32 matrix for those column positions
+VectorLoader = Callable[[np.ndarray], np.ndarray]
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _load(load_vectors: VectorLoader, positions: np.ndarray) -> np.ndarray:
+    parts = [load_vectors(positions[start:start + _LOAD_BATCH]) for start in range(0, len(positions), _LOAD_BATCH)]
+    return np.concatenate(parts) if parts else np.empty((0, 0), dtype=np.float32)
+
+
+def kmeans(sample: np.ndarray, nlist: int, iters: int = ANN_KMEANS_ITERS, seed: int = 0) -> np.ndarray:
+    """Spherical k-means over normalised rows; returns normalised centroids."""
+    rng = np.random.default_rng(seed)
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(iters):
+        assign = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, sample)
+        empty = np.bincount(assign, minlength=nlist) == 0
+        if empty.any():
+            # Re-seed empty lists with random points
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+        centroids = _normalize_rows(sums)
+    return centroids.astype(np.float32)
+
+
+class IVFPartition:
+    """IVF lists for one team. Stores vector ids, not vectors."""
+
+    def __init__(self, centroids: np.ndarray):
+        self.centroids = centroids
+        self.lists: List[List[str]] = [[] for _ in range(len(centroids))]
+        self.assignment: Dict[str, int] = {}
+        self.dead = 0
+        self.trained_size = 0
+
+    @classmethod
+    def train(cls, ids: List[str], positions: np.ndarray, load_vectors: VectorLoader,
+              nlist: int = ANN_NLIST) -> "IVFPartition":
+        n = len(ids)
+        nlist = min(n, nlist or max(1, int(math.sqrt(n))))
+        rng = np.random.default_rng(0)
+        sample_size = min(n, max(nlist * 40, min(ANN_TRAIN_SAMPLE, n)))
+        sample = np.sort(rng.choice(n, sample_size, replace=False))
+        partition = cls(kmeans(_load(load_vectors, positions[sample]), nlist))
+        for start in range(0, n, _LOAD_BATCH):
+            batch = positions[start:start + _LOAD_BATCH]
+            partition.add(ids[start:start + _LOAD_BATCH], load_vectors(batch))
+        partition.trained_size = n
+        return partition
+
+    @property
+    def size(self) -> int:
+        return len(self.assignment)
+
+    def add(self, ids: List[str], vectors: np.ndarray):
+        if not ids:
+            return
+        assign = np.argmax(vectors @ self.centroids.T, axis=1)
+        for vid, list_no in zip(ids, assign.tolist()):
+            if vid not in self.assignment:
+                self.assignment[vid] = list_no
+                self.lists[list_no].append(vid)
+
+    def remove(self, ids: List[str]):
+        # Tombstone only: ids stay in their list until the next rebuild and
+        # are skipped by the caller because they no longer exist
+        for vid in ids:
+            if self.assignment.pop(vid, None) is not None:
+                self.dead += 1
+
+    def needs_rebuild(self) -> bool:
+        stored = self.size + self.dead
+        return bool(stored) and (
+            self.dead / stored > ANN_REBUILD_RATIO or self.size > ANN_REGROW_FACTOR * max(1, self.trained_size)
+        )
+
+    def probe(self, query: np.ndarray, nprobe: int = ANN_NPROBE) -> List[str]:
+        nprobe = max(1, min(nprobe, len(self.centroids)))
+        scores = self.centroids @ query
+        lists = np.argpartition(-scores, nprobe - 1)[:nprobe]
+        candidates = []
+        for list_no in lists.tolist():
+            candidates.extend(self.lists[list_no])
+        return candidates
+
+
+class PartitionedANN:
+    """Per-team IVF partitions for one namespace of the local vector store."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._partitions: Dict[str, IVFPartition] = {}
+        self._building = set()
+        self._syncing = False
+        self._synced_version = None
+        self._stats = {"builds": 0, "rebuilds": 0, "last_build_seconds": 0.0, "ann_queries": 0}
+
+    def sync(self, columns, version, load_vectors: VectorLoader):
+        """Bring partitions up to date with the namespace's current rows.
+
+        `columns` is the local store's columnar view (ids, team_id codes).
+        Called on the query path: when the version moved past what the
+        partitions reflect (another process wrote, or a partition needs
+        rebuilding), the update is queued on the builder thread and queries
+        keep using the current partitions meanwhile.
+        """
+        with self._lock:
+            if version == self._synced_version or self._syncing:
+                return
+            self._syncing = True
+        _builder.submit(self._sync, columns, version, load_vectors)
+
+    def _sync(self, columns, version, load_vectors: VectorLoader):
+        try:
+            team_column = columns.column["team_id"]
+            counts = np.bincount(team_column, minlength=len(columns.codes["team_id"]))
+            live_teams = set()
+            for team, code in columns.codes["team_id"].items():
+                if team is None or counts[code] == 0:
+                    continue
+                live_teams.add(team)
+                with self._lock:
+                    partition = self._partitions.get(team)
+                if partition is None and counts[code] < ANN_MIN_VECTORS:
+                    continue
+                positions = np.flatnonzero(team_column == code)
+                ids = [columns.ids[i] for i in positions]
+                if partition is None:
+                    self._schedule_build(team, ids, positions, load_vectors)
+                    continue
+                current = set(ids)
+                with self._lock:
+                    partition.remove([vid for vid in partition.assignment if vid not in current])
+                    added = [i for i, vid in enumerate(ids) if vid not in partition.assignment]
+                if added:
+                    vectors = _load(load_vectors, positions[added])
+                    with self._lock:
+                        partition.add([ids[i] for i in added], vectors)
+                if partition.needs_rebuild():
+                    self._schedule_build(team, ids, positions, load_vectors)
+            with self._lock:
+                for team in [team for team in self._partitions if team not in live_teams]:
+                    del self._partitions[team]
+                self._synced_version = version
+        except Exception as e:
+            # Compaction can move rows mid-sync; the next query retries
+            print(f"Warning: ANN sync of {self.name} failed: {e}")
+        finally:
+            with self._lock:
+                self._syncing = False
+
+    def apply_upsert(self, ids: List[str], team_ids: List[Optional[str]], vectors: np.ndarray, version: int):
+        """Assign rows this process just upserted (committed as `version`) to
+        their teams' partitions, so queries don't need a sync to see them."""
+        with self._lock:
+            in_sync = self._synced_version == version - 1
+            rows_by_team: Dict[Optional[str], List[int]] = {}
+            for row, team in enumerate(team_ids):
+                rows_by_team.setdefault(team, []).append(row)
+            for team, rows in rows_by_team.items():
+                partition = self._partitions.get(team)
+                if partition is None:
+                    # The sync decides whether the team is now large enough to build
+                    in_sync = in_sync and team is None
+                    continue
+                team_rows = [ids[row] for row in rows]
+                # Overwritten ids are re-assigned by their new vector
+                partition.remove(team_rows)
+                partition.add(team_rows, vectors[rows])
+                in_sync = in_sync and not partition.needs_rebuild()
+            if in_sync:
+                self._synced_version = version
+
+    def apply_delete(self, ids: List[str], version: int):
+        """Tombstone ids this process just deleted (committed as `version`)."""
+        with self._lock:
+            in_sync = self._synced_version == version - 1
+            for partition in self._partitions.values():
+                partition.remove(ids)
+                in_sync = in_sync and not partition.needs_rebuild()
+            if in_sync:
+                self._synced_version = version
+
+    def apply_compaction(self, version: int):
+        """Rows were moved without changing their ids (committed as `version`)."""
+        with self._lock:
+            if self._synced_version == version - 1:
+                self._synced_version = version
+
+    def _schedule_build(self, team: str, ids: List[str], positions: np.ndarray, load_vectors: VectorLoader):
+        if team in self._building:
+            return
+        self._building.add(team)
+        _builder.submit(self._build, team, ids, positions, load_vectors)
+
+    def _build(self, team: str, ids: List[str], positions: np.ndarray, load_vectors: VectorLoader):
+        started = time.perf_counter()
+        try:
+            partition = IVFPartition.train(ids, positions, load_vectors)
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                rebuilt = team in self._partitions
+                self._partitions[team] = partition
+                # Rows may have changed while training; the next query queues a sync
+                self._synced_version = None
+                self._stats["rebuilds" if rebuilt else "builds"] += 1
+                self._stats["last_build_seconds"] = round(elapsed, 3)
+            print(f"Built ANN partition {self.name}/{team}: {partition.size} vectors, "
+                  f"{len(partition.centroids)} lists in {elapsed:.2f}s")
+        except Exception as e:
+            # Compaction can move rows mid-build; the next sync retries
+            print(f"Warning: ANN build for {self.name}/{team} failed: {e}")
+            with self._lock:
+                self._synced_version = None
+        finally:
+            with self._lock:
+                self._building.discard(team)
+
+    def candidates(self, team: str, query: np.ndarray, nprobe: int = None) -> Optional[List[str]]:
+        """Candidate ids for a team query, or None if the team has no partition."""
+        with self._lock:
+            partition = self._partitions.get(team)
+            if partition is None:
+                return None
+            self._stats["ann_queries"] += 1
+            return partition.probe(query, nprobe or ANN_NPROBE)
+
+    def stats(self) -> dict:
+        with self._lock:
+            result = dict(self._stats)
+            result["partitions"] = {
+                team: {"vectors": p.size, "lists": len(p.centroids), "dead": p.dead}
+                for team, p in self._partitions.items()
+            }
+            result["building"] = sorted(self._building)
+        return result
@@ -0,0 +1,169 @@
+"""
+Per-team semantic answer cache.
+
+Stores (question embedding, answer, sources) per team and serves the cached
+answer when a new question's embedding is within ANSWER_CACHE_THRESHOLD
+cosine similarity of a cached one. Only the first question of a session is
+looked up or stored: a follow-up ("can you elaborate?") means something
+different in every conversation, so its answer is never shared. Each team has a
+document-set version that is bumped whenever /uploadFile or /deleteFile
+touches the team; entries from an older version are never served.
+Entries expire after ANSWER_CACHE_TTL seconds and each team keeps at most
+ANSWER_CACHE_MAX_PER_TEAM entries (least recently used evicted first).
+
+Cached answers live in each worker's memory, but the versions are kept in
+SQLite (ANSWER_CACHE_VERSION_DB) so an upload or delete handled by one
+worker invalidates the answers cached by every other worker.
+"""
+
+import os
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Sequence
+from dotenv import load_dotenv
+
+import numpy as np
+
+load_dotenv()
+
+# Configuration
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_MAX_PER_TEAM = int(os.getenv("ANSWER_CACHE_MAX_PER_TEAM", "256"))
+ANSWER_CACHE_VERSION_DB = os.getenv("ANSWER_CACHE_VERSION_DB", "answer_cache_versions.sqlite3")
+
+# Version row bumped by invalidate() without a team; part of every team's version
+_EPOCH = ""
+
+
+class CachedAnswer:
+    __slots__ = ("question", "vector", "answer", "sources", "version", "created_at")
+
+    def __init__(self, question: str, vector: np.ndarray, answer: str, sources: list, version: int):
+        self.question = question
+        self.vector = vector
+        self.answer = answer
+        self.sources = sources
+        self.version = version
+        self.created_at = time.monotonic()
+
+
+_lock = threading.Lock()
+_teams = {}
+_next_id = 0
+_local = threading.local()
+_stats = {"hits": 0, "misses": 0, "stores": 0, "invalidations": 0, "expired": 0, "evicted": 0}
+
+
+def _normalize(embedding: Sequence[float]) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def _connect() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(ANSWER_CACHE_VERSION_DB, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS team_versions (team_id TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+        conn.commit()
+        _local.conn = conn
+    return conn
+
+
+def _version(team_id: str) -> int:
+    row = _connect().execute(
+        "SELECT COALESCE(SUM(version), 0) FROM team_versions WHERE team_id IN (?, ?)", (team_id or _EPOCH, _EPOCH)
+    ).fetchone()
+    return row[0]
+
+
+def team_version(team_id: str) -> int:
+    """Current document-set version for the team; capture it before retrieval."""
+    return _version(team_id)
+
+
+def lookup(team_id: str, embedding: Sequence[float]) -> Optional[CachedAnswer]:
+    """Return the closest cached answer above the threshold, or None."""
+    if not ANSWER_CACHE_ENABLED:
+        return None
+    query = _normalize(embedding)
+    now = time.monotonic()
+    version = _version(team_id)
+    with _lock:
+        entries = _teams.get(team_id)
+        if entries:
+            for key in [key for key, entry in entries.items()
+                        if now - entry.created_at > ANSWER_CACHE_TTL or entry.version != version]:
+                del entries[key]
+                _stats["expired"] += 1
+        if not entries:
+            _stats["misses"] += 1
+            return None
+
+        keys = list(entries)
+        matrix = np.stack([entries[key].vector for key in keys])
+        scores = matrix @ query
+        best = int(np.argmax(scores))
+        if scores[best] < ANSWER_CACHE_THRESHOLD:
+            _stats["misses"] += 1
+            return None
+        entries.move_to_end(keys[best])
+        _stats["hits"] += 1
+        return entries[keys[best]]
+
+
+def store(team_id: str, question: str, embedding: Sequence[float], answer: str, sources: List[dict],
+          version: int):
+    """Cache an answer computed against document-set `version` of the team.
+
+    Dropped if the team's documents changed while the answer was generated.
+    """
+    global _next_id
+    if not ANSWER_CACHE_ENABLED or not answer:
+        return
+    entry = CachedAnswer(question, _normalize(embedding), answer, sources, version)
+    if _version(team_id) != version:
+        return
+    with _lock:
+        entries = _teams.setdefault(team_id, OrderedDict())
+        _next_id += 1
+        entries[_next_id] = entry
+        _stats["stores"] += 1
+        while len(entries) > ANSWER_CACHE_MAX_PER_TEAM:
+            entries.popitem(last=False)
+            _stats["evicted"] += 1
+
+
+def invalidate(team_id: str = None):
+    """Drop cached answers for the team (or all teams) and bump its version
+    for every worker."""
+    conn = _connect()
+    with conn:
+        conn.execute(
+            "INSERT INTO team_versions (team_id, version) VALUES (?, 1) "
+            "ON CONFLICT(team_id) DO UPDATE SET version = version + 1",
+            (_EPOCH if team_id is None else team_id,),
+        )
+    with _lock:
+        _stats["invalidations"] += 1
+        if team_id is None:
+            _teams.clear()
+        else:
+            _teams.pop(team_id, None)
+
+
+def stats() -> dict:
+    with _lock:
+        result = dict(_stats)
+        result["teams"] = len(_teams)
+        result["entries"] = sum(len(entries) for entries in _teams.values())
+    lookups = result["hits"] + result["misses"]
+    result["hit_rate"] = round(result["hits"] / lookups, 3) if lookups else 0.0
+    result["enabled"] = ANSWER_CACHE_ENABLED
+    result["threshold"] = ANSWER_CACHE_THRESHOLD
+    return result
@@ -1,64 +1,99 @@
-import os
 import json
 from dotenv import load_dotenv
-from flask import Flask, jsonify, request
-from supabase import create_client, Client
-import pinecone_file_upload as pfu
+from flask import Flask, Response, jsonify, request, stream_with_context
+import ingest_jobs
 import chat_ai as chat
 import pinecone_file_delete as pfd
+import components
+import model_readiness
+import embedding_engine
+import answer_cache
+import vector_backend
+import bm25_index
+import context_builder
+import concurrency
+import async_runtime
+import session_titles
+import llm_scheduler
+import reranker
+import connections
+import ingest_manifest
+import pdf_extract
 
 load_dotenv()
 app = Flask(__name__)
 
 @app.route('/health', methods=['GET'])
 def health_check():
-    return jsonify({"status": "ok"}), 200
+    return jsonify({"status": "ok", "models": model_readiness.status()}), 200
+
+@app.route('/health/connections', methods=['GET'])
+def connections_health():
+    # Probes Pinecone, Supabase and Ollama (cached for CONNECTION_PROBE_TTL seconds)
+    services = connections.health()
+    healthy = all(service["ok"] for service in services.values())
+    return jsonify({"status": "ok" if healthy else "degraded", "services": services}), 200 if healthy else 503
+
+@app.route('/stats', methods=['GET'])
+def stats_endpoint():
+    return jsonify({
+        "status": "success",
+        "embedding": embedding_engine.all_stats(),
+        "answer_cache": answer_cache.stats(),
+        "vector_store": vector_backend.stats(),
+        "bm25": bm25_index.stats(),
+        "context": context_builder.stats(),
+        "retrieval": reranker.stats(),
+        "concurrency": concurrency.stats(),
+        "background_tasks": async_runtime.stats(),
+        "session_titles": session_titles.stats(),
+        "llm_scheduler": llm_scheduler.stats(),
+        "connections": connections.stats(),
+        "pdf_extract": pdf_extract.stats(),
+    }), 200
 
 @app.route('/uploadFile', methods=['POST'])
+@concurrency.limit(concurrency.INGEST)
 def upload_file_endpoint():
     # Flask provides the request object from flask import request
     fileName: str = request.json.get('fileName')
     teamId: str = request.json.get('teamId')
     fileId: str = request.json.get('fileId')
-    # download the file from request from supabase storage
-    url: str = os.getenv("SUPABASE_URL", "").strip()
-    key: str = os.getenv("SUPABASE_KEY")
-
-    # Ensure storage endpoint has a trailing slash to avoid path join issues
-    if url and not url.endswith("/"):
-        url = url + "/"
-
-    supabase: Client = create_client(url, key)
-    print(f"Downloading file {fileName} from Supabase storage")
-    try:
-        response = supabase.storage.from_("files").download(fileName)
-    except Exception as e:
-        # Return a clear error if the storage call fails (404/400 etc.)
-        return jsonify({"status": "error", "message": f"Storage download failed: {str(e)}"}), 502
-
-    # response may be bytes, an httpx.Response-like object, or a file-like object
-    if isinstance(response, (bytes, bytearray)):
-        data = response
-    elif hasattr(response, "content"):
-        data = response.content
-    elif hasattr(response, "read"):
-        data = response.read()
-    else:
-        # Fallback: try to JSON-encode whatever was returned
-        try:
-            data = json.dumps(response).encode("utf-8")
-        except Exception:
-            return jsonify({"status": "error", "message": "Unable to read storage response"}), 502
-
-    with open(fileName, "wb") as f:
-        f.write(data)
+    # Re-uploads only embed chunks that changed unless incremental is false
+    incremental: bool = request.json.get('incremental', True) is not False
+    if not fileName:
+        return jsonify({"status": "error", "message": "fileName is required"}), 400
+    # Download and indexing run on the ingestion worker pool; poll /jobs/<jobId>
     try:
-        pfu.uploadFile(fileName, teamId, fileId)
-        return jsonify({"status": "success", "message": f"File {fileName} uploaded successfully."}), 200
+        job = ingest_jobs.submit(fileName, teamId, fileId, incremental)
+    except ingest_jobs.QueueFull as e:
+        return jsonify({"status": "error", "message": str(e)}), 503, {"Retry-After": "30"}
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
+    return jsonify({"status": "queued", "jobId": job["jobId"], "job": job, "message": f"File {fileName} queued for indexing."}), 202
+
+@app.route('/jobs', methods=['GET'])
+def list_jobs_endpoint():
+    team_id: str = request.args.get('teamId')
+    limit: int = request.args.get('limit', default=50, type=int)
+    return jsonify({"status": "success", "jobs": ingest_jobs.list_jobs(team_id, limit)}), 200
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job_endpoint(job_id: str):
+    job = ingest_jobs.get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": f"Job {job_id} not found"}), 404
+    return jsonify({"status": "success", "job": job}), 200
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job_endpoint(job_id: str):
+    job = ingest_jobs.cancel(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": f"Job {job_id} not found"}), 404
+    return jsonify({"status": "success", "job": job}), 200
 
 @app.route('/chat', methods=['POST'])
+@concurrency.limit(concurrency.CHAT)
 def char_endpoint():
     user_message: str = request.json.get('message')
     chat_session: str = request.json.get('sessionId')
@@ -67,17 +102,92 @@ def char_endpoint():
         response_message = chat.chat(user_message, chat_session, team_id)
         print(f"Chat response: {response_message}")
         return jsonify({"status": "success"}), 200
+    except model_readiness.ModelsWarmingUp as e:
+        return jsonify({"status": "warming_up", "message": str(e), "models": e.models}), 503, {"Retry-After": "10"}
+    except llm_scheduler.Overloaded as e:
+        return jsonify({"status": "busy", "message": str(e)}), 503, {"Retry-After": "5"}
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+def _sse(event: str, data) -> str:
+    """Format one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route('/chat/stream', methods=['POST'])
+@concurrency.limit(concurrency.CHAT)
+def chat_stream_endpoint():
+    user_message: str = request.json.get('message')
+    chat_session: str = request.json.get('sessionId')
+    team_id: str = request.json.get('teamId')
+    try:
+        events = chat.chat_stream(user_message, chat_session, team_id)
+    except model_readiness.ModelsWarmingUp as e:
+        return jsonify({"status": "warming_up", "message": str(e), "models": e.models}), 503, {"Retry-After": "10"}
+    except llm_scheduler.Overloaded as e:
+        return jsonify({"status": "busy", "message": str(e)}), 503, {"Retry-After": "5"}
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
+    def generate():
+        for event, data in events:
+            if event == "token":
+                yield _sse("token", {"token": data})
+            elif event == "done":
+                yield _sse("done", {"status": "success", **data})
+            else:
+                yield _sse("error", {"status": "error", "message": data})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @app.route('/deleteFile', methods=['DELETE'])
+@concurrency.limit(concurrency.INGEST)
 def delete_file_endpoint():
     file_id: str = request.json.get('fileId')
+    # Look the team up before the delete drops the file's manifest
+    team_id: str = request.json.get('teamId') or ingest_manifest.get_team(file_id)
     try:
-        pfd.delete_file_from_pinecone(file_id)
+        pfd.delete_file_from_pinecone(file_id, team_id)
+        # Unknown team: drop cached answers for every team to be safe
+        answer_cache.invalidate(team_id)
         return jsonify({"status": "success", "message": f"File with ID {file_id} deleted successfully."}), 200
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
+@app.route('/deleteFiles', methods=['DELETE'])
+@concurrency.limit(concurrency.INGEST)
+def delete_files_endpoint():
+    # Bulk delete: {"fileIds": [...], "teamIds": [...], "teamId": optional team of fileIds}
+    file_ids = request.json.get('fileIds') or []
+    team_ids = request.json.get('teamIds') or []
+    team_id: str = request.json.get('teamId')
+    if not isinstance(file_ids, list) or not isinstance(team_ids, list) or not (file_ids or team_ids):
+        return jsonify({"status": "error", "message": "fileIds and/or teamIds lists are required"}), 400
+    try:
+        # Look the teams up before the delete drops the manifests
+        teams = ingest_manifest.get_teams(file_ids)
+        if team_id:
+            teams.update({file_id: team_id for file_id in file_ids})
+        result = {"files": pfd.delete_files(file_ids, teams)}
+        if team_ids:
+            result["teams"] = pfd.delete_teams(team_ids)
+        affected = set(teams.values()) | set(team_ids)
+        if len(teams) < len(file_ids):
+            # Unknown team: drop cached answers for every team to be safe
+            answer_cache.invalidate(None)
+        for affected_team in affected:
+            answer_cache.invalidate(affected_team)
+        return jsonify({"status": "success", "message": f"Deleted {len(file_ids)} files and {len(team_ids)} teams.",
+                        **result}), 200
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+# Development server; production runs gunicorn -c gunicorn.conf.py app:app
 if __name__ == '__main__':
+    model_readiness.start()
+    ingest_jobs.recover_interrupted()
+    components.warm_up()
     app.run(host='0.0.0.0', port=8000)
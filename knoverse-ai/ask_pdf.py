@@ -1,17 +1,21 @@
 """
 RAG (Retrieval-Augmented Generation) Q&A System using Ollama and Pinecone
 Asks questions about your indexed PDF documents
+
+Usage: python ask_pdf.py [--team <team_id>] [question ...]
+Answers from one team's documents (--team, or TEAM_ID from the environment).
 """
 
 import os
 import sys
 from dotenv import load_dotenv
 from langchain_community.embeddings import OllamaEmbeddings
-from langchain_pinecone import PineconeVectorStore
 from langchain_community.llms import Ollama
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 
+import vector_backend
+
 load_dotenv()
 
 # Configuration
@@ -19,6 +23,7 @@ PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME", "knoverse-index")
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "nomic-embed-text")
 OLLAMA_LLM_MODEL = os.getenv("OLLAMA_LLM_MODEL", "llama3")  # For generation
 OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+TEAM_ID = os.getenv("TEAM_ID")
 
 # Example placeholder chat history; swap for DB-backed history later
 DEFAULT_CHAT_HISTORY = [
@@ -65,8 +70,18 @@ def format_chat_history(chat_history):
     return "\n".join(lines)
 
 
-def create_rag_chain():
-    """Create a retrieval-augmented Q&A chain."""
+def team_id_from_args(args):
+    """Team to search: `--team <id>` (removed from `args`) or TEAM_ID."""
+    if "--team" in args:
+        position = args.index("--team")
+        team_id = args[position + 1] if position + 1 < len(args) else None
+        del args[position:position + 2]
+        return team_id
+    return TEAM_ID
+
+
+def create_rag_chain(team_id: str):
+    """Create a retrieval-augmented Q&A chain over the team's documents."""
     print("Initializing embeddings model...", end=" ", flush=True)
     embeddings = OllamaEmbeddings(
         model=OLLAMA_MODEL,
@@ -74,14 +89,8 @@ def create_rag_chain():
     )
     print("✓")
     
-    print("Connecting to Pinecone vector store...", end=" ", flush=True)
-    vector_store = PineconeVectorStore(
-        index_name=PINECONE_INDEX_NAME,
-        embedding=embeddings,
-        namespace="pdf-documents"
-    )
-    # try to get with metadata fileId: id
-    # update the pinecone as well to match the fileId
+    print(f"Connecting to {vector_backend.VECTOR_BACKEND} vector store...", end=" ", flush=True)
+    vector_store = vector_backend.get_vector_store(embeddings, vector_backend.namespace_for(team_id))
     print("✓")
     
     print(f"Initializing {OLLAMA_LLM_MODEL} LLM for generation...", end=" ", flush=True)
@@ -93,7 +102,7 @@ def create_rag_chain():
     print("✓")
     
     # Create retriever
-    retriever = vector_store.as_retriever(search_kwargs={})
+    retriever = vector_store.as_retriever(search_kwargs=vector_backend.search_kwargs(team_id))
     
     # Create prompt template with chat history
     prompt = PromptTemplate.from_template(PROMPT_TEMPLATE)
@@ -140,13 +149,13 @@ def ask_question(rag_chain, retriever, question, chat_history):
             print(f"     {doc.page_content[:150]}...")
 
 
-def interactive_qa():
+def interactive_qa(team_id: str):
     """Interactive Q&A session."""
     print("="*60)
     print("PDF Question Answering System")
     print("="*60)
     
-    rag_chain, retriever = create_rag_chain()
+    rag_chain, retriever = create_rag_chain(team_id)
     # Start with example history; replace with DB fetch later
     chat_history = list(DEFAULT_CHAT_HISTORY)
     
@@ -186,13 +195,13 @@ def interactive_qa():
             continue
 
 
-def batch_qa(questions):
+def batch_qa(questions, team_id: str):
     """Answer multiple questions."""
     print("="*60)
     print("PDF Question Answering System - Batch Mode")
     print("="*60)
     
-    rag_chain, retriever = create_rag_chain()
+    rag_chain, retriever = create_rag_chain(team_id)
     # Shared placeholder history across batch
     chat_history = list(DEFAULT_CHAT_HISTORY)
     
@@ -202,10 +211,13 @@ def batch_qa(questions):
 
 
 if __name__ == "__main__":
-    if len(sys.argv) > 1:
+    args = sys.argv[1:]
+    team_id = team_id_from_args(args)
+    if not team_id:
+        sys.exit("Usage: python ask_pdf.py --team <team_id> [question ...] (or set TEAM_ID)")
+    if args:
         # Batch mode: answer provided questions
-        questions = sys.argv[1:]
-        batch_qa(questions)
+        batch_qa(args, team_id)
     else:
         # Interactive mode
-        interactive_qa()
+        interactive_qa(team_id)
@@ -0,0 +1,111 @@
+"""
+Per-worker asyncio runtime for the chat path.
+
+Flask views are synchronous, so each worker runs one event loop in a
+background thread. Views submit coroutines with run() and block only on
+their own result; independent steps inside a coroutine (history fetch,
+embedding, retrieval) run concurrently on the loop's blocking-call pool.
+
+spawn() schedules fire-and-forget work (message persistence, session
+titles) that must not delay the response. Failures are logged, and drain()
+waits for outstanding background tasks on shutdown.
+"""
+
+import os
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Configuration
+ASYNC_BLOCKING_THREADS = int(os.getenv("ASYNC_BLOCKING_THREADS", "16"))
+
+_lock = threading.Lock()
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_background = set()
+_stats = {"spawned": 0, "failed": 0}
+
+
+def _run_loop(loop: asyncio.AbstractEventLoop):
+    asyncio.set_event_loop(loop)
+    loop.run_forever()
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """The worker's event loop, started on first use."""
+    global _loop
+    if _loop is not None:
+        return _loop
+    with _lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            loop.set_default_executor(
+                ThreadPoolExecutor(max_workers=ASYNC_BLOCKING_THREADS, thread_name_prefix="async-blocking")
+            )
+            threading.Thread(target=_run_loop, args=(loop,), name="async-runtime", daemon=True).start()
+            _loop = loop
+        return _loop
+
+
+def run(coro: Awaitable, timeout: float = None):
+    """Run `coro` on the worker loop from synchronous code and return its result."""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop()).result(timeout)
+
+
+async def to_thread(func: Callable, *args, **kwargs):
+    """Run a blocking call on the loop's bounded blocking-call pool."""
+    return await asyncio.get_running_loop().run_in_executor(None, lambda: func(*args, **kwargs))
+
+
+def _done(task: asyncio.Task):
+    _background.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        _stats["failed"] += 1
+        print(f"Background task {task.get_name()} failed: {task.exception()}")
+
+
+def _schedule(coro: Awaitable, name: str):
+    task = asyncio.ensure_future(coro)
+    task.set_name(name)
+    _background.add(task)
+    _stats["spawned"] += 1
+    task.add_done_callback(_done)
+    return task
+
+
+def spawn(coro: Awaitable, name: str = "background"):
+    """Schedule `coro` in the background; callable from sync or async code."""
+    loop = get_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        return _schedule(coro, name)
+    loop.call_soon_threadsafe(_schedule, coro, name)
+    return None
+
+
+def drain(timeout: float) -> bool:
+    """Wait up to `timeout` seconds for background tasks; True if all finished."""
+    if _loop is None:
+        return True
+
+    async def wait():
+        # Tasks may spawn follow-ups (e.g. persistence after a title)
+        while _background:
+            await asyncio.wait(list(_background))
+
+    try:
+        run(wait(), timeout)
+        return True
+    except Exception:
+        print(f"Warning: {len(_background)} background tasks still pending at shutdown")
+        return False
+
+
+def stats() -> dict:
+    return {"pending": len(_background), **_stats}
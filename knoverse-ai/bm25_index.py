@@ -0,0 +1,329 @@
+"""
+BM25 keyword index, sharded per team.
+
+Dense retrieval misses exact identifiers (clause numbers, product codes), so
+every chunk is also indexed lexically during ingestion. Chunks are stored in
+SQLite (BM25_INDEX_DB) as integer term ids: a sorted uint32 array of the
+chunk's terms and a uint16 array of their counts, next to the chunk text and
+metadata. Term strings live once in a shared vocabulary table.
+
+At query time each team's shard is loaded into memory as CSR postings
+(term -> doc indices / term frequencies as NumPy arrays) and scored with
+vectorised BM25. When a team's chunks change its shard is rebuilt in the
+background (at most once every BM25_REFRESH_SECONDS) while the previous one
+keeps serving; hits deleted in the meantime are dropped.
+"""
+
+import os
+import re
+import json
+import math
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Tuple
+from dotenv import load_dotenv
+
+import numpy as np
+
+load_dotenv()
+
+# Configuration
+BM25_ENABLED = os.getenv("BM25_ENABLED", "true").lower() in ("1", "true", "yes")
+BM25_INDEX_DB = os.getenv("BM25_INDEX_DB", "bm25_index.sqlite3")
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+BM25_REFRESH_SECONDS = float(os.getenv("BM25_REFRESH_SECONDS", "2"))
+BM25_MAX_SHARDS = int(os.getenv("BM25_MAX_SHARDS", "64"))
+
+# Identifiers such as "4.2.1", "ABC-123" or "v2_final" stay one token; their
+# parts are indexed too so partial matches still score.
+_TOKEN = re.compile(r"[a-z0-9]+(?:[._/-][a-z0-9]+)*")
+_PART = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were will with".split()
+)
+_SQL_BATCH = 500
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for token in _TOKEN.findall((text or "").lower()):
+        if token in _STOPWORDS:
+            continue
+        tokens.append(token)
+        parts = _PART.findall(token)
+        if len(parts) > 1:
+            tokens.extend(part for part in parts if part not in _STOPWORDS)
+    return tokens
+
+
+_local = threading.local()
+
+
+def _connect() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(BM25_INDEX_DB, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS bm25_terms (term TEXT PRIMARY KEY, id INTEGER UNIQUE NOT NULL)")
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS bm25_docs (
+                vector_id TEXT PRIMARY KEY,
+                team_id TEXT,
+                file_id TEXT,
+                length INTEGER NOT NULL,
+                terms BLOB NOT NULL,
+                tfs BLOB NOT NULL,
+                text TEXT,
+                metadata TEXT
+            )"""
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS bm25_docs_team ON bm25_docs (team_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS bm25_docs_file ON bm25_docs (file_id)")
+        conn.execute("CREATE TABLE IF NOT EXISTS bm25_teams (team_id TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+        conn.commit()
+        _local.conn = conn
+    return conn
+
+
+# term -> id; ids never change once assigned, so every process can cache them
+_vocab: Dict[str, int] = {}
+
+
+def _term_ids(conn: sqlite3.Connection, terms: Iterable[str], create: bool) -> Dict[str, int]:
+    terms = set(terms)
+    ids = {term: _vocab[term] for term in terms if term in _vocab}
+    missing = [term for term in terms if term not in ids]
+    for start in range(0, len(missing), _SQL_BATCH):
+        batch = missing[start:start + _SQL_BATCH]
+        ids.update(conn.execute(
+            f"SELECT term, id FROM bm25_terms WHERE term IN ({','.join('?' * len(batch))})", batch
+        ).fetchall())
+    new_terms = {term for term in missing if term not in ids}
+    if create and new_terms:
+        next_id = conn.execute("SELECT COALESCE(MAX(id), -1) + 1 FROM bm25_terms").fetchone()[0]
+        new_ids = {term: next_id + i for i, term in enumerate(new_terms)}
+        conn.executemany("INSERT INTO bm25_terms (term, id) VALUES (?, ?)", list(new_ids.items()))
+        ids.update(new_ids)
+    # Only cache ids read back from the table; new ones are cached after commit
+    _vocab.update((term, ids[term]) for term in terms if term in ids and term not in new_terms)
+    return ids
+
+
+def _bump(conn: sqlite3.Connection, team_ids: Iterable[str]):
+    conn.executemany(
+        "INSERT INTO bm25_teams (team_id, version) VALUES (?, 1) "
+        "ON CONFLICT(team_id) DO UPDATE SET version = version + 1",
+        [(team_id,) for team_id in set(team_ids)],
+    )
+
+
+def add(chunks: List[Tuple[str, str, dict]]):
+    """Index (vector_id, text, metadata) chunks; metadata carries team_id/file_id."""
+    if not BM25_ENABLED or not chunks:
+        return
+    tokenized = [(vid, text, metadata, tokenize(text)) for vid, text, metadata in chunks]
+    conn = _connect()
+    with conn:
+        # BEGIN IMMEDIATE serialises vocabulary id allocation across processes
+        conn.execute("BEGIN IMMEDIATE")
+        ids = _term_ids(conn, (term for *_, tokens in tokenized for term in tokens), create=True)
+        rows = []
+        for vid, text, metadata, tokens in tokenized:
+            terms, counts = np.unique(np.asarray([ids[t] for t in tokens], dtype=np.uint32), return_counts=True)
+            rows.append((
+                vid, metadata.get("team_id"), metadata.get("file_id"), len(tokens),
+                terms.astype(np.uint32).tobytes(), np.minimum(counts, 65535).astype(np.uint16).tobytes(),
+                text, json.dumps(metadata),
+            ))
+        conn.executemany(
+            "INSERT OR REPLACE INTO bm25_docs (vector_id, team_id, file_id, length, terms, tfs, text, metadata) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        _bump(conn, (metadata.get("team_id") for _, _, metadata in chunks))
+    _vocab.update(ids)
+
+
+def _delete_where(column: str, values: List[str]) -> int:
+    if not values:
+        return 0
+    conn = _connect()
+    deleted = 0
+    with conn:
+        for start in range(0, len(values), _SQL_BATCH):
+            batch = values[start:start + _SQL_BATCH]
+            where = f"{column} IN ({','.join('?' * len(batch))})"
+            teams = [team for (team,) in conn.execute(f"SELECT DISTINCT team_id FROM bm25_docs WHERE {where}", batch)]
+            deleted += conn.execute(f"DELETE FROM bm25_docs WHERE {where}", batch).rowcount
+            _bump(conn, teams)
+    return deleted
+
+
+def delete_ids(vector_ids: List[str]) -> int:
+    return _delete_where("vector_id", list(vector_ids))
+
+
+def delete_file(file_id: str) -> int:
+    return _delete_where("file_id", [file_id])
+
+
+def delete_files(file_ids: List[str]) -> int:
+    return _delete_where("file_id", list(file_ids))
+
+
+def delete_teams(team_ids: List[str]) -> int:
+    return _delete_where("team_id", list(team_ids))
+
+
+class _Shard:
+    """In-memory CSR postings for one team."""
+
+    def __init__(self, version: int, rows: List[tuple]):
+        self.version = version
+        self.built_at = time.monotonic()
+        self.vector_ids = [row[0] for row in rows]
+        self.lengths = np.asarray([row[1] for row in rows], dtype=np.float32)
+        self.avgdl = float(self.lengths.mean()) if rows else 0.0
+
+        terms = [np.frombuffer(row[2], dtype=np.uint32) for row in rows]
+        tfs = [np.frombuffer(row[3], dtype=np.uint16) for row in rows]
+        if rows:
+            all_terms = np.concatenate(terms)
+            all_tfs = np.concatenate(tfs).astype(np.float32)
+            all_docs = np.repeat(np.arange(len(rows), dtype=np.int32), [len(t) for t in terms])
+        else:
+            all_terms = np.empty(0, dtype=np.uint32)
+            all_tfs = np.empty(0, dtype=np.float32)
+            all_docs = np.empty(0, dtype=np.int32)
+        order = np.argsort(all_terms, kind="stable")
+        all_terms = all_terms[order]
+        self.postings = all_docs[order]
+        self.tfs = all_tfs[order]
+        self.terms, starts = np.unique(all_terms, return_index=True)
+        self.offsets = np.append(starts, len(all_terms)).astype(np.int64)
+
+    def __len__(self):
+        return len(self.vector_ids)
+
+    def search(self, term_ids: List[int], k: int) -> List[Tuple[int, float]]:
+        n = len(self)
+        if not n or not term_ids:
+            return []
+        scores = np.zeros(n, dtype=np.float32)
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths / (self.avgdl or 1.0))
+        for term_id in term_ids:
+            i = np.searchsorted(self.terms, term_id)
+            if i >= len(self.terms) or self.terms[i] != term_id:
+                continue
+            lo, hi = self.offsets[i], self.offsets[i + 1]
+            docs, tf = self.postings[lo:hi], self.tfs[lo:hi]
+            idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            scores[docs] += idf * tf * (BM25_K1 + 1) / (tf + norm[docs])
+        hits = np.flatnonzero(scores)
+        if not len(hits):
+            return []
+        k = min(k, len(hits))
+        top = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        top = top[np.argsort(-scores[top])]
+        return [(int(i), float(scores[i])) for i in top]
+
+
+_lock = threading.Lock()
+_shards: "OrderedDict[str, _Shard]" = OrderedDict()
+_rebuilding = set()
+
+
+def _build_shard(team_id: str, version: int) -> _Shard:
+    rows = _connect().execute(
+        "SELECT vector_id, length, terms, tfs FROM bm25_docs WHERE team_id = ? ORDER BY rowid", (team_id,)
+    ).fetchall()
+    shard = _Shard(version, rows)
+    with _lock:
+        _shards[team_id] = shard
+        _shards.move_to_end(team_id)
+        while len(_shards) > BM25_MAX_SHARDS:
+            _shards.popitem(last=False)
+    return shard
+
+
+def _rebuild(team_id: str, version: int):
+    try:
+        _build_shard(team_id, version)
+    except Exception as e:
+        print(f"Warning: BM25 shard rebuild for team {team_id} failed: {e}")
+    finally:
+        with _lock:
+            _rebuilding.discard(team_id)
+
+
+def _shard(team_id: str) -> _Shard:
+    """The team's shard. The first load is synchronous; after that a stale
+    shard keeps serving while a fresh one is built in the background."""
+    row = _connect().execute("SELECT version FROM bm25_teams WHERE team_id = ?", (team_id,)).fetchone()
+    version = row[0] if row else 0
+    with _lock:
+        shard = _shards.get(team_id)
+        if shard is not None:
+            _shards.move_to_end(team_id)
+            if (shard.version == version or team_id in _rebuilding
+                    or time.monotonic() - shard.built_at < BM25_REFRESH_SECONDS):
+                return shard
+            _rebuilding.add(team_id)
+    if shard is None:
+        return _build_shard(team_id, version)
+    threading.Thread(target=_rebuild, args=(team_id, version), name="bm25-rebuild", daemon=True).start()
+    return shard
+
+
+def search(team_id: str, query: str, k: int = 10) -> List[Tuple[str, float, str, dict]]:
+    """Top-k BM25 hits for the team as (vector_id, score, text, metadata)."""
+    if not BM25_ENABLED:
+        return []
+    tokens = tokenize(query)
+    if not tokens:
+        return []
+    shard = _shard(team_id)
+    ids = _term_ids(_connect(), tokens, create=False)
+    hits = shard.search([ids[t] for t in dict.fromkeys(tokens) if t in ids], k)
+    if not hits:
+        return []
+
+    vector_ids = [shard.vector_ids[i] for i, _ in hits]
+    rows = {
+        vid: (text, json.loads(metadata) if metadata else {})
+        for vid, text, metadata in _connect().execute(
+            f"SELECT vector_id, text, metadata FROM bm25_docs WHERE vector_id IN ({','.join('?' * len(vector_ids))})",
+            vector_ids,
+        )
+    }
+    # Rows deleted since the shard was built are skipped
+    return [(vid, score, *rows[vid]) for vid, (_, score) in zip(vector_ids, hits) if vid in rows]
+
+
+def term_weights(team_id: str, tokens: List[str]) -> Tuple[Dict[str, float], float]:
+    """BM25 idf of each token within the team's shard, and the shard's average
+    chunk length (in terms). Tokens the team has never seen get the highest idf."""
+    if not BM25_ENABLED or not tokens:
+        return {}, 0.0
+    shard = _shard(team_id)
+    n = len(shard)
+    ids = _term_ids(_connect(), tokens, create=False)
+    weights = {}
+    for token in dict.fromkeys(tokens):
+        df = 0
+        term_id = ids.get(token)
+        if term_id is not None:
+            i = np.searchsorted(shard.terms, term_id)
+            if i < len(shard.terms) and shard.terms[i] == term_id:
+                df = int(shard.offsets[i + 1] - shard.offsets[i])
+        weights[token] = math.log(1 + (n - df + 0.5) / (df + 0.5))
+    return weights, shard.avgdl
+
+
+def stats() -> dict:
+    with _lock:
+        shards = {team: len(shard) for team, shard in _shards.items()}
+    return {"enabled": BM25_ENABLED, "loaded_shards": shards}
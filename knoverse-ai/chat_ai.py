@@ -1,256 +1,332 @@
-import os, requests
+import os
+import asyncio
+from typing import Optional
 from dotenv import load_dotenv
-from supabase import create_client, Client
+from supabase import Client
+import components
+import connections
+import model_readiness
+import answer_cache
+import async_runtime
+import context_builder
+import session_titles
+import llm_scheduler
+import chat_history as history
 
 """Chat interface that uses a RAG chain (Ollama embeddings + Pinecone) to answer
-user messages. Chat history is loaded from Supabase and formatted into turns.
+user messages. Chat history is loaded from Supabase (bounded and summarised,
+see chat_history.py) and formatted for the prompt.
 
 Design notes:
-- LangChain / Ollama imports are lazy (inside create_rag_chain) to keep module import
+- LangChain / Ollama imports are lazy (inside components.py) to keep module import
   fast and avoid heavy imports when the function isn't used.
+- Clients and chains are built once per worker and reused across requests.
+- The pipeline runs on the worker's event loop (async_runtime.py): history
+  fetch overlaps embedding + retrieval, and session naming / persistence
+  happen in background tasks after the answer is returned.
+- Ollama calls wait for a slot from llm_scheduler.py; a shed request raises
+  llm_scheduler.Overloaded, which the API turns into a 503.
 """
 
 
-def format_chat_history_from_supabase(rows):
-    """Convert Supabase rows (list of {role, content}) into a list of turns used by
-    the prompt: [{"question": ..., "answer": ...}, ...].
+def create_rag_chain(team_id: str):
+    """Return the cached RAG chain (rag_chain, retriever) for `team_id`.
 
-    We pair user messages with the following assistant message when possible.
+    The embedding model, vector store and LLM are shared per worker; see
+    components.py.
     """
-    if not rows:
-        return []
-
-    turns = []
-    # Ensure rows are in chronological order (oldest first). If Supabase returns
-    # differently, adjust the ordering here.
-    for row in rows:
-        role = (row.get("role") or "").lower()
-        content = row.get("content") or ""
-        if role == "user":
-            turns.append({"question": content, "answer": ""})
-        elif role in ("assistant", "bot"):
-            # Attach assistant content to the last user turn if present
-            if turns and turns[-1].get("answer") == "":
-                turns[-1]["answer"] = content
-            else:
-                # No preceding user message; append as an assistant-only turn
-                turns.append({"question": "", "answer": content})
-        else:
-            # Unknown role: record as user by default
-            turns.append({"question": content, "answer": ""})
-
-    return turns
+    return components.get_team_chain(team_id)
 
 
-def create_rag_chain(team_id: str):
-    """Lazily create and return a RAG chain (rag_chain, retriever).
+def session_name_gen(user_message: str) -> str:
+    """Generate a short, descriptive session name from the user's message using Ollama.
 
-    This imports the heavy dependencies only when needed.
+    Returns a concise title (max ~50 chars) suitable for display in a session list.
+    Falls back to an extractive keyword title if Ollama fails. The chat path
+    no longer calls this synchronously; see session_titles.py.
     """
-    # Local imports to avoid requiring heavy deps on module import
-    from langchain_community.embeddings import OllamaEmbeddings
-    from langchain_pinecone import PineconeVectorStore
-    from langchain_community.llms import Ollama
-    from langchain_core.prompts import PromptTemplate
-    from langchain_core.output_parsers import StrOutputParser
+    return session_titles.generate_llm_title(user_message) or session_titles.extractive_title(user_message)
 
+def _require_models():
     load_dotenv()
-    PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME", "knoverse-index")
-    OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "nomic-embed-text")
+    OLLAMA_EMBEDDING_MODEL = os.getenv("OLLAMA_EMBEDDING_MODEL", "nomic-embed-text")
     OLLAMA_LLM_MODEL = os.getenv("OLLAMA_LLM_MODEL", "gemma3:1b")
-    OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "ollama:11434")
 
-    PROMPT_TEMPLATE = """You are a helpful assistant for Q&A over PDFs.
-You must use the context and recent chat history to answer.
-If you don't know the answer, say you don't know.
+    # No HTTP calls once the models are known to be present; raises
+    # ModelsWarmingUp while a pull is still running.
+    model_readiness.require_ready([OLLAMA_EMBEDDING_MODEL, OLLAMA_LLM_MODEL])
 
-Chat history (most recent first):
-{chat_history}
 
-Context:
-{context}
+def _ensure_session_name(supabase: Client, chat_session: str, user_message: str):
+    """Instant extractive title for a new session; the LLM title is deferred."""
+    try:
+        session_titles.ensure_title(supabase, chat_session, user_message)
+    except Exception as e:
+        print(f"Warning: Failed to check/update session name: {e}")
 
-Question: {question}
 
-Answer:"""
+def _load_history(chat_session: str) -> Optional[str]:
+    """Prompt history of the session, or None if it couldn't be loaded."""
+    # Only the last few turns are fetched; older ones are summarised
+    try:
+        return connections.with_reconnect(
+            connections.SUPABASE, lambda: history.load_history(components.get_supabase(), chat_session)
+        )
+    except Exception as e:
+        # On failure to query history, proceed with empty history but log the error
+        print(f"Failed to load chat history from Supabase: {e}")
+        return None
 
-    embeddings = OllamaEmbeddings(model=OLLAMA_MODEL, base_url=OLLAMA_BASE_URL)
 
-    vector_store = PineconeVectorStore(
-        index_name=PINECONE_INDEX_NAME,
-        embedding=embeddings,
-        namespace="pdf-documents",
-    )
+def _retrieve(user_message: str, team_id: str):
+    """Retrieve the team's context documents for `user_message`."""
+    try:
+        with llm_scheduler.team(team_id):
+            return components.get_retriever(team_id).invoke(user_message)
+    except llm_scheduler.Overloaded:
+        raise
+    except Exception as e:
+        raise RuntimeError(f"Retrieval failed: {e}")
 
-    llm = Ollama(model=OLLAMA_LLM_MODEL, base_url=OLLAMA_BASE_URL, temperature=0.0)
 
-    retriever = vector_store.as_retriever(search_kwargs={
-        "filter": {
-            "team_id": team_id
-        }
-    })
+def _build_context(docs) -> str:
+    """Deduplicated, merged and budgeted prompt context (see context_builder.py)."""
+    context, report = context_builder.build_context(docs)
+    print(
+        f"Context: {report['chunks']} chunks -> {report['blocks']} blocks, "
+        f"{report['tokens_out']} tokens ({report['tokens_saved']} saved)"
+    )
+    return context
 
-    prompt = PromptTemplate.from_template(PROMPT_TEMPLATE)
 
-    def format_docs(docs):
-        return "\n\n".join(doc.page_content for doc in docs)
+def _persist_messages(chat_session: str, user_message: str, answer: str):
+    """Store the new user message and assistant response back to Supabase."""
+    rows = [
+        {"chat_session_id": chat_session, "role": "user", "content": user_message},
+        {"chat_session_id": chat_session, "role": "assistant", "content": answer},
+    ]
+    try:
+        connections.with_reconnect(
+            connections.SUPABASE, lambda: components.get_supabase().from_("chat_messages").insert(rows).execute()
+        )
+    except Exception as e:
+        print(f"Failed to persist chat messages to Supabase: {e}")
 
-    rag_chain = (
+
+def format_sources(docs) -> list:
+    """JSON-serialisable view of the retrieved chunks."""
+    return [
         {
-            "context": retriever | format_docs,
-            "question": lambda x: x["question"],
-            "chat_history": lambda x: x["chat_history"],
+            "id": getattr(doc, "id", None),
+            "content": doc.page_content,
+            "metadata": dict(doc.metadata or {}),
         }
-        | prompt
-        | llm
-        | StrOutputParser()
-    )
+        for doc in docs
+    ]
 
-    return rag_chain, retriever
 
+def _embed_question(user_message: str, team_id: str):
+    """Question embedding for the answer cache, or None.
 
-def session_name_gen(user_message: str) -> str:
-    """Generate a short, descriptive session name from the user's message using Ollama.
-
-    Returns a concise title (max ~50 chars) suitable for display in a session list.
-    Falls back to truncating the message if Ollama fails.
+    The embedding is reused by the retriever through the embedding cache, so
+    a cache miss costs no extra Ollama call.
     """
-    load_dotenv()
-    OLLAMA_LLM_MODEL = os.getenv("OLLAMA_LLM_MODEL", "gemma3:1b")
-    OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "ollama:11434")
-
+    if not answer_cache.ANSWER_CACHE_ENABLED:
+        return None
     try:
-        from langchain_community.llms import Ollama
-
-        llm = Ollama(model=OLLAMA_LLM_MODEL, base_url=OLLAMA_BASE_URL, temperature=0.3)
-
-        prompt = f"""Generate a very short, descriptive title (max 6 words) for a chat session that starts with this message.
-Return ONLY the title, nothing else. No quotes, no explanation, no punctuation at the end.
-
-User message: {user_message[:500]}
-
-Title:"""
-
-        response = llm.invoke(prompt)
-        # Clean up the response
-        title = response.strip().strip('"\'').strip()
-        # Remove trailing punctuation
-        title = title.rstrip(".,!?;:")
-        # Truncate if too long
-        if len(title) > 50:
-            title = title[:47] + "..."
-        if title:
-            return title
+        with llm_scheduler.team(team_id):
+            return components.get_embeddings().embed_query(user_message)
+    except llm_scheduler.Overloaded:
+        raise
     except Exception as e:
-        print(f"Warning: Ollama session name generation failed: {e}")
+        print(f"Warning: failed to embed question for the answer cache: {e}")
+        return None
 
-    # Fallback: truncate the user message
-    fallback = user_message.strip().splitlines()[0][:50].strip()
-    return fallback if fallback else "New Chat"
 
-def ensure_ollama_model(model: str):
-    
-    print(model)
-    load_dotenv()
-    OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "ollama:11434")
-    # Check installed models
-    tags = requests.get(f"{OLLAMA_BASE_URL}/api/tags").json().get("models", [])
-    print(tags)
-    installed = {m["name"] for m in tags}
-    # print(requests.get(f"{OLLAMA_BASE_URL}").json())
-    
-    if model in installed:
-        return
-
-    print(f"📥 Pulling Ollama model: {model}")
-    r = requests.post(
-        f"{OLLAMA_BASE_URL}/api/pull",
-        json={"name": model},
-        # stream=True,
-        timeout=None,
-    )
-    r.raise_for_status()
-    print(f"{OLLAMA_BASE_URL}/api/pull")
-    print(r.status_code)
+def _store_answer(team_id: str, user_message: str, question_vector, docs, answer: str, version: int):
+    answer_cache.store(team_id, user_message, question_vector, answer, format_sources(docs), version)
 
-def chat(user_message: str, chat_session: str, team_id: str) -> str:
-    """Main chat entrypoint.
 
-    - Loads chat history for `chat_session` from Supabase
-    - Builds a RAG chain lazily and invokes it with the user's question and history
-    - Returns the assistant's answer as a string
-    """
-    load_dotenv()
-    
-    OLLAMA_EMBEDDING_MODEL = os.getenv("OLLAMA_EMBEDDING_MODEL", "nomic-embed-text")
-    OLLAMA_LLM_MODEL = os.getenv("OLLAMA_LLM_MODEL", "gemma3:1b")
+def _generate(payload: dict, team_id: str) -> str:
+    with llm_scheduler.slot(components.OLLAMA_LLM_MODEL, llm_scheduler.CHAT, team_id):
+        return components.get_answer_chain().invoke(payload)
 
-    ensure_ollama_model(OLLAMA_EMBEDDING_MODEL)
-    ensure_ollama_model(OLLAMA_LLM_MODEL)
 
-    url: str = os.getenv("SUPABASE_URL", "").strip()
-    key: str = os.getenv("SUPABASE_KEY")
+class _Prepared:
+    __slots__ = ("chat_history", "question_vector", "cached", "version", "docs")
 
-    if url and not url.endswith("/"):
-        url = url + "/"
+    def __init__(self, chat_history, question_vector, cached, version=None, docs=None):
+        self.chat_history = chat_history
+        # Only set for a session's first question: nothing else is cached
+        self.question_vector = question_vector
+        self.cached = cached
+        self.version = version
+        self.docs = docs
 
-    supabase: Client = create_client(url, key)
 
-    # Check if session has a name, if null generate one using Ollama
-    try:
-        session_resp = supabase.from_("chat_sessions").select("session_name").eq("id", chat_session).maybe_single().execute()
-        session_row = getattr(session_resp, "data", None) or session_resp
-        current_name = None
-        if session_row and isinstance(session_row, dict):
-            current_name = session_row.get("session_name")
-        
-        # If session_name is null/empty, generate one and update DB
-        if not current_name or not str(current_name).strip():
-            generated_name = session_name_gen(user_message)
-            print(f"Generated session name: {generated_name}")
-            print(f"Updating session name in DB for session {chat_session}")
-            supabase.from_("chat_sessions").update({"session_name": generated_name}).eq("id", chat_session).execute()
-    except Exception as e:
-        print(f"Warning: Failed to check/update session name: {e}")
+async def _aprepare(user_message: str, chat_session: str, team_id: str) -> _Prepared:
+    """Everything the answer needs, with independent steps overlapped.
 
-    # Fetch chat messages for the session (role, content). We expect the table
-    # `chat_messages` to contain a `chat_session_id` column.
+    The history fetch, the question embedding and retrieval run concurrently;
+    session naming runs in the background. The answer cache is only consulted
+    for a session's first question (see answer_cache.py), and a hit drops the
+    retrieval result.
+    """
+    _require_models()
+    supabase: Client = components.get_supabase()
+
+    history_task = asyncio.ensure_future(async_runtime.to_thread(_load_history, chat_session))
+    # Read before retrieval starts, so a cached answer never outlives a newer ingest
+    version = answer_cache.team_version(team_id)
+    retrieve_task = asyncio.ensure_future(async_runtime.to_thread(_retrieve, user_message, team_id))
+    async_runtime.spawn(
+        async_runtime.to_thread(_ensure_session_name, supabase, chat_session, user_message), "session-name"
+    )
     try:
-        resp = supabase.from_("chat_messages").select("role", "content").eq("chat_session_id", chat_session).execute()
-        rows = resp.data if resp and hasattr(resp, "data") else []
-    except Exception as e:
-        # On failure to query history, proceed with empty history but log the error
-        print(f"Failed to load chat history from Supabase: {e}")
-        rows = []
-
-    chat_history = format_chat_history_from_supabase(rows)
-
-    # Build the RAG chain and retriever
-    rag_chain, retriever = create_rag_chain(team_id)
-
-    # The rag_chain expects a dict with keys question and chat_history
-    payload = {"question": user_message, "chat_history": chat_history}
+        question_vector = await async_runtime.to_thread(_embed_question, user_message, team_id)
+        if question_vector is not None:
+            chat_history = await history_task
+            if chat_history != history.NO_HISTORY:
+                question_vector = None
+            else:
+                cached = answer_cache.lookup(team_id, question_vector)
+                if cached is not None:
+                    retrieve_task.cancel()
+                    return _Prepared(chat_history, question_vector, cached)
+
+        docs = await retrieve_task
+        chat_history = await history_task
+    except BaseException:
+        history_task.cancel()
+        retrieve_task.cancel()
+        raise
+    if chat_history is None:
+        chat_history = history.NO_HISTORY
+    return _Prepared(chat_history, question_vector, None, version, docs)
+
+
+# session id -> [lock, users]; only touched from the event loop
+_session_locks = {}
+
+
+async def _apersist(chat_session: str, user_message: str, answer: str):
+    # Background persists of one session are written in order
+    entry = _session_locks.setdefault(chat_session, [asyncio.Lock(), 0])
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            await async_runtime.to_thread(_persist_messages, chat_session, user_message, answer)
+    finally:
+        entry[1] -= 1
+        if not entry[1]:
+            del _session_locks[chat_session]
+
+
+def _finish(prepared: _Prepared, chat_session: str, team_id: str, user_message: str, answer: str):
+    """Persist the turn and cache the answer off the critical path."""
+    async_runtime.spawn(_apersist(chat_session, user_message, answer), "persist")
+    if prepared.cached is None and prepared.question_vector is not None:
+        async_runtime.spawn(
+            async_runtime.to_thread(
+                _store_answer, team_id, user_message, prepared.question_vector, prepared.docs, answer,
+                prepared.version,
+            ),
+            "answer-cache",
+        )
+
+
+async def achat(user_message: str, chat_session: str, team_id: str) -> str:
+    """Async chat entrypoint; returns as soon as the answer is generated.
+
+    Persistence and session naming complete in the background.
+    """
+    prepared = await _aprepare(user_message, chat_session, team_id)
+    if prepared.cached is not None:
+        _finish(prepared, chat_session, team_id, user_message, prepared.cached.answer)
+        return prepared.cached.answer
+
+    # The answer chain expects a dict with keys context, question and chat_history
+    payload = {
+        "context": _build_context(prepared.docs),
+        "question": user_message,
+        "chat_history": prepared.chat_history,
+    }
 
     # Invoke the chain to get an answer
     try:
-        # answer = "hello"
-        answer = rag_chain.invoke(payload)
+        answer = await async_runtime.to_thread(_generate, payload, team_id)
+    except llm_scheduler.Overloaded:
+        raise
     except Exception as e:
         # Bubble up a readable error
         raise RuntimeError(f"RAG chain invocation failed: {e}")
 
-    # Optionally: store the new user message and assistant response back to Supabase
-    try:
-        supabase.from_("chat_messages").insert([
-            {"chat_session_id": chat_session, "role": "user", "content": user_message},
-            {"chat_session_id": chat_session, "role": "assistant", "content": answer},
-        ]).execute()
-    except Exception as e:
-        print(f"Failed to persist chat messages to Supabase: {e}")
-
+    _finish(prepared, chat_session, team_id, user_message, answer)
     return answer
 
 
+def chat(user_message: str, chat_session: str, team_id: str) -> str:
+    """Main chat entrypoint (synchronous wrapper around achat()).
+
+    - Loads chat history for `chat_session` from Supabase while the
+      team's context is retrieved
+    - Invokes the answer chain with the user's question and history
+    - Returns the assistant's answer as a string; the messages are
+      persisted in the background
+    """
+    return async_runtime.run(achat(user_message, chat_session, team_id))
+
+
+def chat_stream(user_message: str, chat_session: str, team_id: str):
+    """Streaming variant of chat().
+
+    Setup and retrieval run eagerly, so ModelsWarmingUp and retrieval errors
+    are raised before any output is produced. Returns a generator of
+    (event, data) tuples: one ("token", str) per generated chunk, then a
+    single ("done", {"answer", "sources"}) as soon as the answer is
+    complete (it is persisted in the background), or ("error", str) if
+    generation fails midway.
+    """
+    prepared = async_runtime.run(_aprepare(user_message, chat_session, team_id))
+
+    if prepared.cached is not None:
+        cached = prepared.cached
+
+        def cached_events():
+            yield "token", cached.answer
+            _finish(prepared, chat_session, team_id, user_message, cached.answer)
+            yield "done", {"answer": cached.answer, "sources": cached.sources, "cached": True}
+
+        return cached_events()
+
+    payload = {
+        "context": _build_context(prepared.docs),
+        "question": user_message,
+        "chat_history": prepared.chat_history,
+    }
+
+    def events():
+        parts = []
+        try:
+            # The slot is held until the last token (or the client goes away)
+            with llm_scheduler.slot(components.OLLAMA_LLM_MODEL, llm_scheduler.CHAT, team_id):
+                for token in components.get_answer_chain().stream(payload):
+                    parts.append(token)
+                    yield "token", token
+        except llm_scheduler.Overloaded as e:
+            yield "error", str(e)
+            return
+        except Exception as e:
+            yield "error", f"RAG chain invocation failed: {e}"
+            return
+
+        answer = "".join(parts)
+        _finish(prepared, chat_session, team_id, user_message, answer)
+        yield "done", {"answer": answer, "sources": format_sources(prepared.docs)}
+
+    return events()
+
+
 if __name__ == "__main__":
     # quick smoke test: ensure module imports and chat function are callable
     # print("chat callable:", callable(chat))
@@ -0,0 +1,229 @@
+"""
+Bounded chat history for the prompt.
+
+Instead of loading every message of a session, only the last
+HISTORY_MAX_TURNS turns are fetched with an ordered, limited query. Older
+turns are folded into a short rolling summary that is cached per session and
+updated incrementally: each request only folds the turns that have just
+fallen out of the window, so the summary never needs the full session. The
+summary is extractive (first sentences of each turn) to avoid an extra LLM
+call per message. The final prompt history is kept under
+HISTORY_TOKEN_BUDGET estimated tokens.
+"""
+
+import os
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import List, Optional, Tuple
+from dotenv import load_dotenv
+
+from token_budget import estimate_tokens, truncate_to_tokens
+
+load_dotenv()
+
+# Configuration
+HISTORY_MAX_TURNS = int(os.getenv("HISTORY_MAX_TURNS", "6"))
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500"))
+HISTORY_SUMMARY_TOKENS = int(os.getenv("HISTORY_SUMMARY_TOKENS", "300"))
+# Upper bound on older messages read when a session's summary isn't cached
+HISTORY_SUMMARY_BACKFILL = int(os.getenv("HISTORY_SUMMARY_BACKFILL", "100"))
+HISTORY_SUMMARY_CACHE_SIZE = int(os.getenv("HISTORY_SUMMARY_CACHE_SIZE", "1024"))
+
+# Prompt history of a session without earlier turns
+NO_HISTORY = "(no prior messages)"
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+_lock = threading.Lock()
+# session id -> (summary lines, boundary): every message created before the
+# boundary (the window start at the last update) is in the summary
+_summaries: "OrderedDict[str, Tuple[List[str], datetime]]" = OrderedDict()
+
+
+def format_chat_history_from_supabase(rows):
+    """Convert Supabase rows (list of {role, content}) into a list of turns used by
+    the prompt: [{"question": ..., "answer": ...}, ...].
+
+    We pair user messages with the following assistant message when possible.
+    """
+    if not rows:
+        return []
+
+    turns = []
+    # Rows must be in chronological order (oldest first).
+    for row in rows:
+        role = (row.get("role") or "").lower()
+        content = row.get("content") or ""
+        if role == "user":
+            turns.append({"question": content, "answer": ""})
+        elif role in ("assistant", "bot"):
+            # Attach assistant content to the last user turn if present
+            if turns and turns[-1].get("answer") == "":
+                turns[-1]["answer"] = content
+            else:
+                # No preceding user message; append as an assistant-only turn
+                turns.append({"question": "", "answer": content})
+        else:
+            # Unknown role: record as user by default
+            turns.append({"question": content, "answer": ""})
+
+    return turns
+
+
+def _parse_time(value) -> datetime:
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+
+
+def _first_sentence(text: str, max_tokens: int) -> str:
+    text = " ".join((text or "").split())
+    return truncate_to_tokens(_SENTENCE_END.split(text, 1)[0], max_tokens)
+
+
+def _summarise_turns(turns: List[dict]) -> List[str]:
+    lines = []
+    for turn in turns:
+        question = _first_sentence(turn.get("question", ""), 30)
+        answer = _first_sentence(turn.get("answer", ""), 40)
+        if question and answer:
+            lines.append(f"- User asked: {question} Assistant: {answer}")
+        elif question or answer:
+            lines.append(f"- {'User asked' if question else 'Assistant'}: {question or answer}")
+    return lines
+
+
+def _trim_summary(lines: List[str]) -> List[str]:
+    # Keep the most recent lines that fit the summary budget
+    kept, used = [], 0
+    for line in reversed(lines):
+        cost = estimate_tokens(line)
+        if used + cost > HISTORY_SUMMARY_TOKENS:
+            break
+        kept.append(line)
+        used += cost
+    return list(reversed(kept))
+
+
+def _select(supabase):
+    return supabase.from_("chat_messages").select("role", "content", "created_at")
+
+
+def _fetch_recent(supabase, chat_session: str, limit: int) -> List[dict]:
+    # Same-statement inserts share created_at; "assistant" < "user" keeps pairs
+    # in order once reversed.
+    resp = (
+        _select(supabase)
+        .eq("chat_session_id", chat_session)
+        .order("created_at", desc=True)
+        .order("role")
+        .limit(limit)
+        .execute()
+    )
+    rows = resp.data if resp and hasattr(resp, "data") else []
+    return list(reversed(rows or []))
+
+
+def _fetch_older(supabase, chat_session: str, before, since=None) -> List[dict]:
+    query = _select(supabase).eq("chat_session_id", chat_session).lt("created_at", before)
+    if since is not None:
+        query = query.gte("created_at", since.isoformat())
+        resp = query.order("created_at").order("role", desc=True).limit(HISTORY_SUMMARY_BACKFILL).execute()
+        return list(resp.data or [])
+    resp = query.order("created_at", desc=True).order("role").limit(HISTORY_SUMMARY_BACKFILL).execute()
+    return list(reversed(resp.data or []))
+
+
+def _update_summary(supabase, chat_session: str, overflow: List[dict], window_start) -> List[str]:
+    """Fold messages older than the window into the session's cached summary."""
+    with _lock:
+        cached = _summaries.get(chat_session)
+        if cached is not None:
+            _summaries.move_to_end(chat_session)
+
+    overflow_start = _parse_time(overflow[0]["created_at"])
+    if cached is None:
+        # No summary yet (new worker or evicted): rebuild from a bounded backfill
+        older = _fetch_older(supabase, chat_session, window_start)
+        lines = []
+    else:
+        lines, boundary = cached
+        if overflow_start <= boundary:
+            older = [row for row in overflow if _parse_time(row["created_at"]) >= boundary]
+        else:
+            # Turns fell out between requests (e.g. served by other workers); fetch the gap
+            older = _fetch_older(supabase, chat_session, window_start, since=boundary)
+
+    if older:
+        lines = _trim_summary(lines + _summarise_turns(format_chat_history_from_supabase(older)))
+    with _lock:
+        _summaries[chat_session] = (lines, _parse_time(window_start))
+        _summaries.move_to_end(chat_session)
+        while len(_summaries) > HISTORY_SUMMARY_CACHE_SIZE:
+            _summaries.popitem(last=False)
+    return lines
+
+
+def _fit_budget(turns: List[dict], summary_lines: List[str]) -> Tuple[List[dict], List[str]]:
+    """Drop the oldest window turns (into the summary) until the budget holds."""
+    max_message_tokens = max(1, HISTORY_TOKEN_BUDGET // 4)
+    turns = [
+        {
+            "question": truncate_to_tokens(turn.get("question", ""), max_message_tokens),
+            "answer": truncate_to_tokens(turn.get("answer", ""), max_message_tokens),
+        }
+        for turn in turns
+    ]
+
+    def cost():
+        return sum(estimate_tokens(line) for line in summary_lines) + sum(
+            estimate_tokens(turn["question"]) + estimate_tokens(turn["answer"]) for turn in turns
+        )
+
+    while turns and cost() > HISTORY_TOKEN_BUDGET:
+        summary_lines = _trim_summary(summary_lines + _summarise_turns(turns[:1]))
+        turns = turns[1:]
+    return turns, summary_lines
+
+
+def format_for_prompt(turns: List[dict], summary_lines: List[str]) -> str:
+    """Render history most recent first, followed by the older-turns summary."""
+    lines = []
+    for turn in reversed(turns):
+        if turn["question"]:
+            lines.append(f"User: {turn['question']}")
+        if turn["answer"]:
+            lines.append(f"Assistant: {turn['answer']}")
+    if summary_lines:
+        lines.append("Summary of earlier conversation:")
+        lines.extend(summary_lines)
+    return "\n".join(lines) if lines else NO_HISTORY
+
+
+def load_history(supabase, chat_session: str) -> str:
+    """Return the bounded, summarised chat history for the prompt."""
+    window_messages = HISTORY_MAX_TURNS * 2
+    # Two extra rows tell us whether anything older exists
+    rows = _fetch_recent(supabase, chat_session, window_messages + 2)
+
+    summary_lines: List[str] = []
+    if len(rows) > window_messages:
+        overflow, rows = rows[:-window_messages], rows[-window_messages:]
+        try:
+            summary_lines = _update_summary(supabase, chat_session, overflow, rows[0]["created_at"])
+        except Exception as e:
+            print(f"Warning: failed to update history summary for session {chat_session}: {e}")
+
+    turns, summary_lines = _fit_budget(format_chat_history_from_supabase(rows), summary_lines)
+    return format_for_prompt(turns, summary_lines)
+
+
+def forget(chat_session: Optional[str] = None):
+    """Drop the cached summary for a session (or all sessions)."""
+    with _lock:
+        if chat_session is None:
+            _summaries.clear()
+        else:
+            _summaries.pop(chat_session, None)
@@ -0,0 +1,235 @@
+"""
+Long-lived component registry for the chat path.
+
+Building the embedding model, the vector store (Pinecone or local), the Ollama LLM and the
+Supabase client is expensive (imports, client construction, TLS handshakes), so
+each worker builds them once and reuses them for every request. Per-team RAG
+chains are kept in a bounded LRU keyed by team_id.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+import connections
+
+load_dotenv()
+
+# Configuration
+PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME", "knoverse-index")
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "nomic-embed-text")
+OLLAMA_LLM_MODEL = os.getenv("OLLAMA_LLM_MODEL", "gemma3:1b")
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "ollama:11434")
+PINECONE_NAMESPACE = "pdf-documents"
+
+# Maximum number of per-team chains kept alive in this worker
+RAG_CHAIN_CACHE_SIZE = int(os.getenv("RAG_CHAIN_CACHE_SIZE", "128"))
+
+PROMPT_TEMPLATE = """You are a helpful assistant for Q&A over PDFs.
+You must use the context and recent chat history to answer.
+If you don't know the answer, say you don't know.
+
+Chat history (most recent first):
+{chat_history}
+
+Context:
+{context}
+
+Question: {question}
+
+Answer:"""
+
+_lock = threading.RLock()
+_singletons = {}
+_team_chains: "OrderedDict[str, tuple]" = OrderedDict()
+
+
+def _get_or_build(name: str, builder):
+    """Return the singleton `name`, building it with `builder` on first use."""
+    component = _singletons.get(name)
+    if component is not None:
+        return component
+    with _lock:
+        component = _singletons.get(name)
+        if component is None:
+            component = builder()
+            _singletons[name] = component
+        return component
+
+
+def _build_embeddings():
+    import embedding_engine
+
+    return embedding_engine.get_engine(OLLAMA_MODEL, OLLAMA_BASE_URL)
+
+
+def _build_vector_store():
+    import vector_backend
+
+    return vector_backend.get_vector_store(get_embeddings(), PINECONE_NAMESPACE)
+
+
+def _build_llm():
+    from langchain_community.llms import Ollama
+
+    return Ollama(model=OLLAMA_LLM_MODEL, base_url=OLLAMA_BASE_URL, temperature=0.0)
+
+
+def _build_prompt():
+    from langchain_core.prompts import PromptTemplate
+
+    return PromptTemplate.from_template(PROMPT_TEMPLATE)
+
+
+def get_embeddings():
+    """Shared Ollama embedding engine (see embedding_engine.py)."""
+    return _get_or_build("embeddings", _build_embeddings)
+
+
+def get_vector_store():
+    """Shared vector store for VECTOR_BACKEND (one client / index handle per worker)."""
+    return _get_or_build("vector_store", _build_vector_store)
+
+
+def get_llm():
+    """Shared Ollama LLM used for answering questions."""
+    return _get_or_build("llm", _build_llm)
+
+
+def get_prompt():
+    """Shared RAG prompt template."""
+    return _get_or_build("prompt", _build_prompt)
+
+
+def get_supabase():
+    """Shared Supabase client (see connections.py)."""
+    return connections.supabase()
+
+
+def format_docs(docs) -> str:
+    """Build the prompt context from retrieved documents (see context_builder.py)."""
+    import context_builder
+
+    return context_builder.build_context(docs)[0]
+
+
+def _build_answer_chain():
+    from langchain_core.output_parsers import StrOutputParser
+
+    return get_prompt() | get_llm() | StrOutputParser()
+
+
+def get_answer_chain():
+    """Shared prompt | llm | parser chain.
+
+    Takes {"context", "question", "chat_history"}; callers do the retrieval,
+    which lets them keep the source documents and stream the answer.
+    """
+    return _get_or_build("answer_chain", _build_answer_chain)
+
+
+def _build_team_chain(team_id: str):
+    import hybrid_search
+    import reranker
+
+    import vector_backend
+
+    # The team's namespace, plus a team_id filter when it is shared
+    search_kwargs = vector_backend.search_kwargs(team_id)
+    # Over-fetch cheaply when reranking; the rerank stage keeps the team's best k
+    rerank = reranker.team_settings(team_id) if reranker.RERANK_ENABLED else None
+    fetch_k = rerank["fetch_k"] if rerank else hybrid_search.HYBRID_FETCH_K
+    if rerank or hybrid_search.HYBRID_SEARCH_ENABLED:
+        search_kwargs["k"] = fetch_k
+    retriever = get_vector_store().as_retriever(search_kwargs=search_kwargs)
+    if hybrid_search.HYBRID_SEARCH_ENABLED:
+        # Dense results fused with the team's BM25 shard (see hybrid_search.py)
+        retriever = hybrid_search.HybridRetriever(
+            dense=retriever, team_id=team_id, fetch_k=fetch_k, k=fetch_k if rerank else hybrid_search.HYBRID_K
+        )
+    if rerank:
+        retriever = reranker.RerankingRetriever(candidates=retriever, team_id=team_id, k=rerank["k"])
+
+    rag_chain = (
+        {
+            "context": retriever | format_docs,
+            "question": lambda x: x["question"],
+            "chat_history": lambda x: x["chat_history"],
+        }
+        | get_answer_chain()
+    )
+    return rag_chain, retriever
+
+
+def get_team_chain(team_id: str):
+    """Return (rag_chain, retriever) for `team_id` from the bounded LRU."""
+    with _lock:
+        entry = _team_chains.get(team_id)
+        if entry is not None:
+            _team_chains.move_to_end(team_id)
+            return entry
+
+    # Build outside the lock; the shared components are built at most once.
+    entry = _build_team_chain(team_id)
+
+    with _lock:
+        existing = _team_chains.get(team_id)
+        if existing is not None:
+            _team_chains.move_to_end(team_id)
+            return existing
+        _team_chains[team_id] = entry
+        while len(_team_chains) > RAG_CHAIN_CACHE_SIZE:
+            _team_chains.popitem(last=False)
+        return entry
+
+
+def get_retriever(team_id: str):
+    """Return the cached retriever for `team_id`."""
+    return get_team_chain(team_id)[1]
+
+
+def invalidate(team_id: str = None):
+    """Drop the cached chain for `team_id`, or every team chain when omitted."""
+    with _lock:
+        if team_id is None:
+            _team_chains.clear()
+        else:
+            _team_chains.pop(team_id, None)
+
+
+def reset():
+    """Drop every cached component so the next request rebuilds them."""
+    with _lock:
+        _team_chains.clear()
+        _singletons.clear()
+
+
+def _drop_vector_store():
+    # The store and team retrievers hold the old index handle
+    with _lock:
+        _singletons.pop("vector_store", None)
+        _team_chains.clear()
+
+
+connections.on_reset(connections.PINECONE, _drop_vector_store)
+
+
+def warm_up():
+    """Build the shared components up front so the first request doesn't pay for it.
+
+    Failures are logged and left for the first request to retry.
+    """
+    for name, getter in (
+        ("embeddings", get_embeddings),
+        ("vector store", get_vector_store),
+        ("llm", get_llm),
+        ("prompt", get_prompt),
+        ("answer chain", get_answer_chain),
+        ("supabase", get_supabase),
+    ):
+        try:
+            getter()
+            print(f"Warmed up {name}")
+        except Exception as e:
+            print(f"Warning: failed to warm up {name}: {e}")
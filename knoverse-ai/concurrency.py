@@ -0,0 +1,106 @@
+"""
+Per-route-class concurrency limits and graceful drain for the web workers.
+
+Each worker admits at most CHAT_MAX_CONCURRENCY chat requests (/chat,
+/chat/stream) and INGEST_MAX_CONCURRENCY ingestion requests (/uploadFile,
+/deleteFile) at a time, so a burst of uploads or deletes can never occupy
+every request thread and starve chat. A request that can't get a slot within
+CONCURRENCY_QUEUE_TIMEOUT seconds is rejected with 503 and Retry-After.
+
+Streaming responses hold their slot until the stream is closed.
+
+On shutdown the worker calls begin_drain(): new limited requests are
+rejected with 503 while in-flight ones finish (see gunicorn.conf.py).
+"""
+
+import os
+import time
+import threading
+from functools import wraps
+from dotenv import load_dotenv
+from flask import jsonify, make_response
+
+load_dotenv()
+
+# Configuration
+CHAT_MAX_CONCURRENCY = int(os.getenv("CHAT_MAX_CONCURRENCY", "6"))
+INGEST_MAX_CONCURRENCY = int(os.getenv("INGEST_MAX_CONCURRENCY", "2"))
+CONCURRENCY_QUEUE_TIMEOUT = float(os.getenv("CONCURRENCY_QUEUE_TIMEOUT", "5"))
+
+CHAT = "chat"
+INGEST = "ingest"
+
+_limits = {CHAT: CHAT_MAX_CONCURRENCY, INGEST: INGEST_MAX_CONCURRENCY}
+_semaphores = {name: threading.BoundedSemaphore(limit) for name, limit in _limits.items()}
+_lock = threading.Condition()
+_in_flight = {name: 0 for name in _limits}
+_rejected = {name: 0 for name in _limits}
+_draining = False
+
+
+def _acquire(route_class: str) -> bool:
+    if _draining or not _semaphores[route_class].acquire(timeout=CONCURRENCY_QUEUE_TIMEOUT):
+        with _lock:
+            _rejected[route_class] += 1
+        return False
+    with _lock:
+        _in_flight[route_class] += 1
+    return True
+
+
+def _release(route_class: str):
+    with _lock:
+        _in_flight[route_class] -= 1
+        _lock.notify_all()
+    _semaphores[route_class].release()
+
+
+def limit(route_class: str):
+    """Decorator admitting at most the class's limit of concurrent requests."""
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not _acquire(route_class):
+                message = "Server is shutting down" if _draining else f"Too many concurrent {route_class} requests"
+                return jsonify({"status": "busy", "message": message}), 503, {"Retry-After": "5"}
+            try:
+                response = make_response(view(*args, **kwargs))
+            except BaseException:
+                _release(route_class)
+                raise
+            # Released once the body (possibly a stream) has been sent
+            response.call_on_close(lambda: _release(route_class))
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def begin_drain():
+    """Reject new limited requests; in-flight ones keep running."""
+    global _draining
+    _draining = True
+
+
+def wait_idle(timeout: float) -> bool:
+    """Wait up to `timeout` seconds for in-flight limited requests to finish."""
+    deadline = time.monotonic() + timeout
+    with _lock:
+        while any(_in_flight.values()):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            _lock.wait(remaining)
+    return True
+
+
+def stats() -> dict:
+    with _lock:
+        return {
+            "draining": _draining,
+            "limits": dict(_limits),
+            "in_flight": dict(_in_flight),
+            "rejected": dict(_rejected),
+        }
@@ -0,0 +1,349 @@
+"""
+Process-wide connections to Pinecone, Supabase and Ollama.
+
+Every worker keeps one client per service and reuses it for every request,
+so requests stop paying TLS handshakes and admin API calls:
+
+- Ollama: pooled keep-alive requests.Session (http_session()), retrying
+  failed connects;
+- Supabase: one client on a pooled keep-alive httpx.Client (supabase());
+  storage objects can be streamed over the same pool (storage_stream());
+- Pinecone: one client, with the index's host / dimension / metric described
+  once (pinecone_index_info()) and an Index handle opened straight on that
+  host (pinecone_index()).
+
+reset(service) drops a client so the next use reconnects; components that
+hold on to a client register with on_reset() to rebuild too.
+with_reconnect() retries a call once on a fresh client after a connection
+error. health() probes every service (results cached for
+CONNECTION_PROBE_TTL seconds) and resets the clients whose probe failed.
+
+Clients are never shared across fork(): a forked child starts empty.
+"""
+
+import os
+import time
+import threading
+from collections import Counter, defaultdict
+from typing import Callable, Optional
+from urllib.parse import quote
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Configuration
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "ollama:11434")
+PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
+PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME", "knoverse-index")
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "32"))
+HTTP_KEEPALIVE_SECONDS = float(os.getenv("HTTP_KEEPALIVE_SECONDS", "60"))
+HTTP_CONNECT_RETRIES = int(os.getenv("HTTP_CONNECT_RETRIES", "2"))
+SUPABASE_TIMEOUT = float(os.getenv("SUPABASE_TIMEOUT", "30"))
+CONNECTION_PROBE_TTL = float(os.getenv("CONNECTION_PROBE_TTL", "30"))
+CONNECTION_PROBE_TIMEOUT = float(os.getenv("CONNECTION_PROBE_TIMEOUT", "5"))
+
+OLLAMA = "ollama"
+SUPABASE = "supabase"
+PINECONE = "pinecone"
+SERVICES = (OLLAMA, SUPABASE, PINECONE)
+
+_lock = threading.RLock()
+_clients = {}
+_index_info = {}
+_listeners = defaultdict(list)
+_health = {}
+_stats = {"built": Counter(), "resets": Counter(), "reconnects": Counter()}
+
+
+def _after_fork():
+    global _lock
+    _lock = threading.RLock()
+    _clients.clear()
+    _index_info.clear()
+    _health.clear()
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def _get_or_build(key: str, service: str, builder: Callable):
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = builder()
+            _clients[key] = client
+            _stats["built"][service] += 1
+        return client
+
+
+# -- Ollama ---------------------------------------------------------------------
+
+def _build_http_session():
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    session = requests.Session()
+    # Only connection failures are retried: the request never reached Ollama
+    retry = Retry(total=HTTP_CONNECT_RETRIES, connect=HTTP_CONNECT_RETRIES, read=0, redirect=0, status=0,
+                  backoff_factor=0.2)
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def http_session():
+    """Shared keep-alive session for Ollama HTTP calls."""
+    return _get_or_build("ollama_session", OLLAMA, _build_http_session)
+
+
+# -- Supabase -------------------------------------------------------------------
+
+def _supabase_settings():
+    url: str = os.getenv("SUPABASE_URL", "").strip()
+    key: str = os.getenv("SUPABASE_KEY")
+
+    # Ensure storage endpoint has a trailing slash to avoid path join issues
+    if url and not url.endswith("/"):
+        url = url + "/"
+    return url, key
+
+
+def _build_supabase_http():
+    import httpx
+
+    return httpx.Client(
+        timeout=SUPABASE_TIMEOUT,
+        limits=httpx.Limits(
+            max_connections=HTTP_POOL_SIZE,
+            max_keepalive_connections=HTTP_POOL_SIZE,
+            keepalive_expiry=HTTP_KEEPALIVE_SECONDS,
+        ),
+        transport=httpx.HTTPTransport(retries=HTTP_CONNECT_RETRIES),
+    )
+
+
+def supabase_http():
+    """Pooled httpx.Client underneath the Supabase client."""
+    return _get_or_build("supabase_http", SUPABASE, _build_supabase_http)
+
+
+def _build_supabase():
+    from supabase import ClientOptions, create_client
+
+    url, key = _supabase_settings()
+    return create_client(url, key, options=ClientOptions(httpx_client=supabase_http()))
+
+
+def supabase():
+    """Shared Supabase client (PostgREST and storage share one connection pool)."""
+    return _get_or_build("supabase", SUPABASE, _build_supabase)
+
+
+def storage_stream(bucket: str, path: str):
+    """Streaming GET of a storage object, as an httpx stream context manager.
+
+    Unlike storage.from_(bucket).download(), the body is not read into
+    memory: iterate the response with iter_bytes().
+    """
+    url, key = _supabase_settings()
+    return supabase_http().stream(
+        "GET",
+        f"{url}storage/v1/object/{bucket}/{quote(path, safe='/')}",
+        headers={"Authorization": f"Bearer {key}", "apikey": key},
+    )
+
+
+# -- Pinecone -------------------------------------------------------------------
+
+def _build_pinecone():
+    from pinecone import Pinecone
+
+    if not PINECONE_API_KEY:
+        raise ValueError("PINECONE_API_KEY not set in environment variables")
+    return Pinecone(api_key=PINECONE_API_KEY)
+
+
+def pinecone():
+    """Shared Pinecone control-plane client."""
+    return _get_or_build("pinecone", PINECONE, _build_pinecone)
+
+
+def pinecone_index_info(name: str = PINECONE_INDEX_NAME) -> Optional[dict]:
+    """{"name", "host", "dimension", "metric"} of the index, or None if it
+    doesn't exist. Described once per process; forget_index_info() re-checks."""
+    info = _index_info.get(name)
+    if info is not None:
+        return info
+    with _lock:
+        info = _index_info.get(name)
+        if info is None:
+            client = pinecone()
+            if name not in client.list_indexes().names():
+                return None
+            description = client.describe_index(name)
+            info = {
+                "name": name,
+                "host": description.host,
+                "dimension": description.dimension,
+                "metric": description.metric,
+            }
+            _index_info[name] = info
+        return info
+
+
+def forget_index_info(name: str = PINECONE_INDEX_NAME):
+    with _lock:
+        _index_info.pop(name, None)
+
+
+def pinecone_index(name: str = PINECONE_INDEX_NAME):
+    """Shared data-plane handle of the index, opened on its cached host."""
+
+    def build():
+        info = pinecone_index_info(name)
+        if info is None:
+            raise ValueError(f"Pinecone index {name} does not exist")
+        return pinecone().Index(host=info["host"], connection_pool_maxsize=HTTP_POOL_SIZE)
+
+    return _get_or_build(f"pinecone_index:{name}", PINECONE, build)
+
+
+# -- Reconnection -----------------------------------------------------------------
+
+def on_reset(service: str, callback: Callable[[], None]):
+    """Call `callback` whenever `service`'s clients are reset."""
+    with _lock:
+        _listeners[service].append(callback)
+
+
+def reset(service: str):
+    """Drop `service`'s clients; the next use reconnects."""
+    prefix = {OLLAMA: "ollama", SUPABASE: "supabase", PINECONE: "pinecone"}[service]
+    with _lock:
+        for key in [key for key in _clients if key.startswith(prefix)]:
+            client = _clients.pop(key)
+            close = getattr(client, "close", None)
+            if callable(close):
+                try:
+                    close()
+                except Exception:
+                    pass
+        if service == PINECONE:
+            _index_info.clear()
+        _stats["resets"][service] += 1
+        listeners = list(_listeners[service])
+    for callback in listeners:
+        callback()
+    print(f"Reset {service} connections")
+
+
+def is_connection_error(error: BaseException) -> bool:
+    """True for network-level failures (refused, reset, DNS, TLS, timeouts)."""
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    try:
+        import requests
+
+        if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+            return True
+    except ImportError:
+        pass
+    try:
+        import httpx
+
+        if isinstance(error, httpx.TransportError):
+            return True
+    except ImportError:
+        pass
+    try:
+        import urllib3
+
+        if isinstance(error, (urllib3.exceptions.ProtocolError, urllib3.exceptions.MaxRetryError,
+                              urllib3.exceptions.NewConnectionError, urllib3.exceptions.TimeoutError)):
+            return True
+    except ImportError:
+        pass
+    return False
+
+
+def with_reconnect(service: str, call: Callable):
+    """Run `call()`; after a connection error, reset `service` and retry once.
+
+    `call` must fetch its client through this module so the retry uses the
+    new one.
+    """
+    try:
+        return call()
+    except Exception as e:
+        if not is_connection_error(e):
+            raise
+        print(f"Connection to {service} failed ({e}); reconnecting")
+        with _lock:
+            _stats["reconnects"][service] += 1
+        reset(service)
+        return call()
+
+
+# -- Health -------------------------------------------------------------------------
+
+def _probe_ollama():
+    http_session().get(f"{OLLAMA_BASE_URL}/api/version", timeout=CONNECTION_PROBE_TIMEOUT).raise_for_status()
+
+
+def _probe_supabase():
+    supabase().from_("chat_sessions").select("id").limit(1).execute()
+
+
+def _probe_pinecone():
+    import vector_backend
+
+    if vector_backend.is_local():
+        return
+    pinecone_index().describe_index_stats()
+
+
+_PROBES = {OLLAMA: _probe_ollama, SUPABASE: _probe_supabase, PINECONE: _probe_pinecone}
+
+
+def health(max_age: float = CONNECTION_PROBE_TTL) -> dict:
+    """Probe each service (reusing results younger than `max_age` seconds).
+
+    A failed probe resets the service's clients, so the next request
+    reconnects instead of reusing a broken connection.
+    """
+    now = time.time()
+    result = {}
+    for service, probe in _PROBES.items():
+        cached = _health.get(service)
+        if cached is not None and now - cached["checked_at"] < max_age:
+            result[service] = cached
+            continue
+        start = time.perf_counter()
+        try:
+            probe()
+            status = {"ok": True}
+        except Exception as e:
+            status = {"ok": False, "error": str(e)}
+            reset(service)
+        status["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        status["checked_at"] = now
+        _health[service] = status
+        result[service] = status
+    return result
+
+
+def stats() -> dict:
+    with _lock:
+        return {
+            "open": sorted(_clients),
+            "built": dict(_stats["built"]),
+            "resets": dict(_stats["resets"]),
+            "reconnects": dict(_stats["reconnects"]),
+            "index_info": dict(_index_info),
+            "health": dict(_health),
+        }
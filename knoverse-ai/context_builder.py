@@ -0,0 +1,150 @@
+"""
+Prompt context assembly.
+
+Retrieved chunks are not joined verbatim any more:
+
+1. exact duplicates (same normalised text) are dropped;
+2. chunks from the same file and page that overlap (the splitter repeats up
+   to CHUNK_OVERLAP characters between neighbours) are merged into one block
+   with the repeated text removed;
+3. blocks are packed in relevance order (a block ranks as its best chunk)
+   into CONTEXT_TOKEN_BUDGET estimated tokens; a block that doesn't fit is
+   skipped, except the most relevant one, which is truncated.
+
+build_context() returns the context text and a report of the tokens saved
+against the naive join; totals are exposed through stats().
+"""
+
+import os
+import threading
+from typing import List, Optional, Tuple
+from dotenv import load_dotenv
+
+from embedding_cache import normalize_text
+from token_budget import estimate_tokens, truncate_to_tokens
+
+load_dotenv()
+
+# Configuration
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+# Overlaps shorter than this are treated as coincidence, not splitter overlap
+CONTEXT_MIN_OVERLAP = int(os.getenv("CONTEXT_MIN_OVERLAP", "20"))
+CONTEXT_MAX_OVERLAP = int(os.getenv("CONTEXT_MAX_OVERLAP", "400"))
+
+_SEPARATOR = "\n\n"
+
+_lock = threading.Lock()
+_stats = {"requests": 0, "tokens_in": 0, "tokens_out": 0, "tokens_saved": 0, "merged": 0, "duplicates": 0,
+          "dropped": 0}
+
+
+def _overlap(left: str, right: str) -> int:
+    """Length of the longest suffix of `left` that is a prefix of `right`."""
+    for size in range(min(len(left), len(right), CONTEXT_MAX_OVERLAP), CONTEXT_MIN_OVERLAP - 1, -1):
+        if right.startswith(left[-size:]):
+            return size
+    return 0
+
+
+def _join(left: str, right: str) -> Optional[str]:
+    """Merge two neighbouring chunks in either order, or None if they don't overlap."""
+    if right in left:
+        return left
+    if left in right:
+        return right
+    size = _overlap(left, right)
+    if size:
+        return left + right[size:]
+    size = _overlap(right, left)
+    if size:
+        return right + left[size:]
+    return None
+
+
+class _Block:
+    __slots__ = ("key", "rank", "text", "chunks")
+
+    def __init__(self, key: tuple, rank: int, text: str):
+        self.key = key
+        self.rank = rank
+        self.text = text
+        self.chunks = 1
+
+
+def _blocks(docs) -> Tuple[List[_Block], int, int]:
+    seen = set()
+    blocks: List[_Block] = []
+    duplicates = merged = 0
+    for rank, doc in enumerate(docs):
+        text = (doc.page_content or "").strip()
+        fingerprint = normalize_text(text)
+        if not text or fingerprint in seen:
+            duplicates += 1
+            continue
+        seen.add(fingerprint)
+        metadata = doc.metadata or {}
+        key = (metadata.get("file_id"), metadata.get("source"), metadata.get("page"))
+        block = _Block(key, rank, text)
+
+        # Fold this chunk (and anything it bridges) into overlapping blocks
+        for other in [b for b in blocks if b.key == key]:
+            joined = _join(other.text, block.text)
+            if joined is not None:
+                blocks.remove(other)
+                block.text = joined
+                block.rank = min(block.rank, other.rank)
+                block.chunks += other.chunks
+                merged += 1
+        blocks.append(block)
+    blocks.sort(key=lambda b: b.rank)
+    return blocks, duplicates, merged
+
+
+def build_context(docs, budget: int = None) -> Tuple[str, dict]:
+    """Assemble the prompt context from `docs` (most relevant first).
+
+    Returns (context, report) where report has tokens_in (naive join),
+    tokens_out, tokens_saved, and the number of chunks merged, duplicated
+    and dropped for the budget.
+    """
+    budget = CONTEXT_TOKEN_BUDGET if budget is None else budget
+    docs = list(docs or [])
+    tokens_in = estimate_tokens(_SEPARATOR.join(doc.page_content for doc in docs))
+    blocks, duplicates, merged = _blocks(docs)
+
+    parts, used, dropped = [], 0, 0
+    for block in blocks:
+        cost = estimate_tokens(block.text) + (estimate_tokens(_SEPARATOR) if parts else 0)
+        if used + cost <= budget:
+            parts.append(block.text)
+            used += cost
+        elif not parts:
+            parts.append(truncate_to_tokens(block.text, budget))
+            used = estimate_tokens(parts[0])
+        else:
+            dropped += block.chunks
+
+    context = _SEPARATOR.join(parts)
+    tokens_out = estimate_tokens(context)
+    report = {
+        "chunks": len(docs),
+        "blocks": len(parts),
+        "merged": merged,
+        "duplicates": duplicates,
+        "dropped": dropped,
+        "tokens_in": tokens_in,
+        "tokens_out": tokens_out,
+        "tokens_saved": max(0, tokens_in - tokens_out),
+    }
+    with _lock:
+        _stats["requests"] += 1
+        for key in ("tokens_in", "tokens_out", "tokens_saved", "merged", "duplicates", "dropped"):
+            _stats[key] += report[key]
+    return context, report
+
+
+def stats() -> dict:
+    with _lock:
+        result = dict(_stats)
+    result["budget"] = CONTEXT_TOKEN_BUDGET
+    return result
@@ -0,0 +1,112 @@
+"""
+Micro-batching of concurrent query embeddings.
+
+Every chat question needs one query embedding. Under concurrent load those
+are many tiny Ollama calls, so QueryBatcher collects the questions of
+concurrent callers for up to EMBED_QUERY_BATCH_WAIT_MS milliseconds (or until
+EMBED_QUERY_BATCH_MAX are waiting) and embeds them with one batched call. Each
+caller blocks only on its own result.
+
+Batches are sent one at a time by a single worker thread: questions that
+arrive while a batch is in flight simply join the next one, so the batch size
+grows with load on its own.
+"""
+
+import os
+import time
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Callable, List
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Configuration
+EMBED_QUERY_BATCH_ENABLED = os.getenv("EMBED_QUERY_BATCH_ENABLED", "true").lower() in ("1", "true", "yes")
+EMBED_QUERY_BATCH_WAIT_MS = float(os.getenv("EMBED_QUERY_BATCH_WAIT_MS", "5"))
+EMBED_QUERY_BATCH_MAX = int(os.getenv("EMBED_QUERY_BATCH_MAX", "32"))
+
+# Upper bounds of the batch size histogram buckets in stats()
+_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+
+class QueryBatcher:
+    """Collects concurrent embed(text) calls into batched `embed_batch(texts)` calls."""
+
+    def __init__(self, embed_batch: Callable[[List[str]], List[List[float]]],
+                 max_batch: int = EMBED_QUERY_BATCH_MAX, max_wait_ms: float = EMBED_QUERY_BATCH_WAIT_MS):
+        self._embed_batch = embed_batch
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+        self._stats = {"queries": 0, "batches": 0, "deduplicated": 0, "failed_batches": 0, "max_batch": 0,
+                       "queue_wait_seconds": 0.0}
+        self._sizes = {f"<={bucket}": 0 for bucket in _BUCKETS}
+        self._sizes[f">{_BUCKETS[-1]}"] = 0
+
+    def embed(self, text: str) -> List[float]:
+        """Embed `text` as part of the next batch; raises the batch's error."""
+        future = Future()
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._work, name="query-embed-batcher", daemon=True)
+                self._worker.start()
+        self._queue.put((text, future, time.monotonic()))
+        return future.result()
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            try:
+                # Whatever queued up during the previous batch is taken without waiting
+                remaining = deadline - time.monotonic()
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _work(self):
+        while True:
+            batch = self._collect()
+            sent = time.monotonic()
+            # The same question from several sessions is embedded once
+            texts = list(dict.fromkeys(text for text, _, _ in batch))
+            try:
+                vectors = dict(zip(texts, self._embed_batch(texts)))
+            except BaseException as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                with self._lock:
+                    self._stats["failed_batches"] += 1
+                continue
+            for text, future, _ in batch:
+                future.set_result(vectors[text])
+            self._record(batch, len(texts), sent)
+
+    def _record(self, batch: list, unique: int, sent: float):
+        size = len(batch)
+        with self._lock:
+            self._stats["queries"] += size
+            self._stats["batches"] += 1
+            self._stats["deduplicated"] += size - unique
+            self._stats["max_batch"] = max(self._stats["max_batch"], size)
+            self._stats["queue_wait_seconds"] += sum(sent - queued for _, _, queued in batch)
+            bucket = next((f"<={b}" for b in _BUCKETS if size <= b), f">{_BUCKETS[-1]}")
+            self._sizes[bucket] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            result = dict(self._stats)
+            sizes = dict(self._sizes)
+        waited = result.pop("queue_wait_seconds")
+        result["avg_batch"] = round(result["queries"] / result["batches"], 2) if result["batches"] else 0.0
+        result["avg_queue_wait_ms"] = round(waited / result["queries"] * 1000, 2) if result["queries"] else 0.0
+        result["batch_sizes"] = sizes
+        result["max_wait_ms"] = self.max_wait * 1000
+        result["max_batch_size"] = self.max_batch
+        result["pending"] = self._queue.qsize()
+        return result
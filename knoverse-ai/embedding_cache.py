@@ -0,0 +1,209 @@
+"""
+Persistent content-hash embedding cache.
+
+Embeddings are keyed by (embedding model, hash of the normalised chunk text)
+and stored on local disk in SQLite as packed float32 blobs, so re-uploads of
+the same PDF and duplicate chunks skip Ollama entirely. A small in-memory LRU
+sits in front of the disk store for hot entries (repeated queries). The disk
+store is size-bounded: once it grows past EMBED_CACHE_MAX_MB the least
+recently used entries are evicted. Recency is approximate: a disk hit only
+refreshes last_used when it is older than EMBED_CACHE_TOUCH_SECONDS, and the
+refreshes are written in batches (with the next insert, before an eviction,
+or once _SQL_BATCH are queued) rather than one commit per lookup.
+"""
+
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Configuration
+EMBED_CACHE_ENABLED = os.getenv("EMBED_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", "embedding_cache.sqlite3")
+EMBED_CACHE_MAX_MB = float(os.getenv("EMBED_CACHE_MAX_MB", "512"))
+EMBED_CACHE_MEMORY_ENTRIES = int(os.getenv("EMBED_CACHE_MEMORY_ENTRIES", "4096"))
+# Disk hits refresh last_used at most this often per entry
+EMBED_CACHE_TOUCH_SECONDS = float(os.getenv("EMBED_CACHE_TOUCH_SECONDS", "600"))
+
+_WHITESPACE = re.compile(r"\s+")
+# SQLite limits the number of bound parameters per statement
+_SQL_BATCH = 500
+
+
+def normalize_text(text: str) -> str:
+    """Normalise text so trivially different copies share a cache entry."""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+def cache_key(model: str, text: str) -> bytes:
+    return hashlib.blake2b(f"{model}\x00{normalize_text(text)}".encode("utf-8"), digest_size=16).digest()
+
+
+def _pack(vector: Sequence[float]) -> bytes:
+    return array("f", vector).tobytes()
+
+
+def _unpack(blob: bytes) -> List[float]:
+    vector = array("f")
+    vector.frombytes(blob)
+    return vector.tolist()
+
+
+class EmbeddingCache:
+    """SQLite-backed float32 embedding store with an in-memory LRU front."""
+
+    def __init__(self, path: str = EMBED_CACHE_PATH, max_mb: float = EMBED_CACHE_MAX_MB,
+                 memory_entries: int = EMBED_CACHE_MEMORY_ENTRIES):
+        self.path = path
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.memory_entries = memory_entries
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[bytes, bytes]" = OrderedDict()
+        # key -> last_used not yet written to disk
+        self._touched: Dict[bytes, float] = {}
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS embeddings (
+                key BLOB PRIMARY KEY,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL
+            ) WITHOUT ROWID"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+        self._disk_bytes = self._conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+        self._stats = {"hits": 0, "memory_hits": 0, "misses": 0, "evictions": 0}
+
+    def _remember(self, key: bytes, blob: bytes):
+        self._memory[key] = blob
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get_many(self, model: str, texts: Sequence[str]) -> Dict[int, List[float]]:
+        """Return {position: vector} for the texts that are cached."""
+        keys = [cache_key(model, text) for text in texts]
+        found: Dict[int, List[float]] = {}
+        missing: Dict[bytes, List[int]] = {}
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                blob = self._memory.get(key)
+                if blob is not None:
+                    self._memory.move_to_end(key)
+                    found[i] = _unpack(blob)
+                    self._stats["memory_hits"] += 1
+                else:
+                    missing.setdefault(key, []).append(i)
+
+            if missing:
+                now = time.time()
+                disk_keys = list(missing)
+                for start in range(0, len(disk_keys), _SQL_BATCH):
+                    batch = disk_keys[start:start + _SQL_BATCH]
+                    rows = self._conn.execute(
+                        f"SELECT key, vector, last_used FROM embeddings WHERE key IN ({','.join('?' * len(batch))})",
+                        batch,
+                    ).fetchall()
+                    for key, blob, last_used in rows:
+                        if now - last_used > EMBED_CACHE_TOUCH_SECONDS:
+                            self._touched[key] = now
+                        self._remember(key, blob)
+                        vector = _unpack(blob)
+                        for i in missing[key]:
+                            found[i] = vector
+                if len(self._touched) >= _SQL_BATCH:
+                    self._flush_touched()
+                    self._conn.commit()
+
+            self._stats["hits"] += len(found)
+            self._stats["misses"] += len(keys) - len(found)
+        return found
+
+    def _flush_touched(self):
+        """Write the queued last_used refreshes (the caller commits)."""
+        if self._touched:
+            self._conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?",
+                                   [(now, key) for key, now in self._touched.items()])
+            self._touched.clear()
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        return self.get_many(model, [text]).get(0)
+
+    def put_many(self, model: str, texts: Sequence[str], vectors: Sequence[Sequence[float]]):
+        """Store vectors for texts (same order)."""
+        now = time.time()
+        rows = {}
+        for text, vector in zip(texts, vectors):
+            rows[cache_key(model, text)] = _pack(vector)
+        if not rows:
+            return
+
+        with self._lock:
+            self._flush_touched()
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, blob, now) for key, blob in rows.items()],
+            )
+            self._conn.commit()
+            for key, blob in rows.items():
+                self._remember(key, blob)
+            self._disk_bytes += sum(len(blob) for blob in rows.values())
+            if self._disk_bytes > self.max_bytes:
+                self._evict()
+
+    def put(self, model: str, text: str, vector: Sequence[float]):
+        self.put_many(model, [text], [vector])
+
+    def _evict(self):
+        # Recount first: other processes share the file and replaced rows were double counted
+        count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()
+        self._disk_bytes = total
+        if total <= self.max_bytes:
+            return
+        # Evict down to 90% of the budget so we don't evict on every insert
+        target = int(self.max_bytes * 0.9)
+        average = total / count if count else 1
+        to_remove = int((total - target) / average) + 1
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+            (to_remove,),
+        )
+        self._conn.commit()
+        self._stats["evictions"] += to_remove
+        self._disk_bytes = self._conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+            stats["disk_mb"] = round(self._disk_bytes / (1024 * 1024), 2)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        return stats
+
+
+_cache: Optional[EmbeddingCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> Optional[EmbeddingCache]:
+    """Process-wide cache, or None when EMBED_CACHE_ENABLED is off."""
+    global _cache
+    if not EMBED_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = EmbeddingCache()
+        return _cache
@@ -0,0 +1,277 @@
+"""
+Batched, concurrent embedding engine backed by Ollama.
+
+OllamaEmbeddings sends one HTTP request per text. EmbeddingEngine sends
+batches through Ollama's /api/embed endpoint instead and keeps up to
+EMBED_MAX_IN_FLIGHT batches in flight. The batch size adapts to observed
+latency and errors (grow while under EMBED_TARGET_LATENCY, shrink when slow,
+halve on failure). Failed batches are split and retried without
+re-embedding the batches that already succeeded.
+
+Results are read from and written to the persistent content-hash cache
+(embedding_cache.py), so only texts that were never embedded before reach
+Ollama.
+
+Every HTTP call takes a slot from the model's Ollama scheduler
+(llm_scheduler.py): embed_query() as a query embedding, embed_documents() as
+an ingestion embedding, attributed to the caller's llm_scheduler.team().
+Concurrent embed_query() misses are micro-batched into one call
+(embed_batcher.py).
+
+It implements LangChain's Embeddings interface, so it can be passed anywhere
+OllamaEmbeddings was used (PineconeVectorStore, retrievers).
+"""
+
+import os
+import time
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import List, Tuple
+from dotenv import load_dotenv
+from langchain_core.embeddings import Embeddings
+import connections
+import embedding_cache
+import embed_batcher
+import llm_scheduler
+
+load_dotenv()
+
+# Configuration
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+EMBED_MIN_BATCH_SIZE = int(os.getenv("EMBED_MIN_BATCH_SIZE", "1"))
+EMBED_MAX_BATCH_SIZE = int(os.getenv("EMBED_MAX_BATCH_SIZE", "256"))
+EMBED_MAX_IN_FLIGHT = int(os.getenv("EMBED_MAX_IN_FLIGHT", "4"))
+# Batches faster than this grow, batches much slower than this shrink (seconds)
+EMBED_TARGET_LATENCY = float(os.getenv("EMBED_TARGET_LATENCY", "2.0"))
+# Retries after Ollama errors; batches shed by llm_scheduler retry until the ingest class deadline
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "3"))
+EMBED_TIMEOUT = float(os.getenv("EMBED_TIMEOUT", "120"))
+
+
+class EmbeddingEngine(Embeddings):
+    """Ollama embeddings with batching, bounded concurrency and adaptive batch size."""
+
+    def __init__(self, model: str, base_url: str, max_in_flight: int = EMBED_MAX_IN_FLIGHT,
+                 batch_size: int = EMBED_BATCH_SIZE, cache: embedding_cache.EmbeddingCache = None):
+        self.model = model
+        self.cache = cache if cache is not None else embedding_cache.get_cache()
+        self.base_url = base_url.rstrip("/")
+        self.max_in_flight = max(1, max_in_flight)
+        self.batch_size = min(max(batch_size, EMBED_MIN_BATCH_SIZE), EMBED_MAX_BATCH_SIZE)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="embed")
+        self._lock = threading.Lock()
+        # Older Ollama versions only have the one-text-per-call /api/embeddings
+        self._legacy_api = False
+        self._stats = {"texts": 0, "batches": 0, "retries": 0, "overloaded_retries": 0, "failures": 0, "seconds": 0.0}
+        self._last_rate = 0.0
+        self._query_batcher = embed_batcher.QueryBatcher(self._embed_query_batch)
+
+    # -- HTTP -----------------------------------------------------------------
+
+    def _post_batch(self, texts: List[str]) -> List[List[float]]:
+        if not self._legacy_api:
+            resp = connections.http_session().post(
+                f"{self.base_url}/api/embed",
+                json={"model": self.model, "input": texts},
+                timeout=EMBED_TIMEOUT,
+            )
+            if resp.status_code != 404:
+                resp.raise_for_status()
+                embeddings = resp.json().get("embeddings") or []
+                if len(embeddings) != len(texts):
+                    raise RuntimeError(f"Ollama returned {len(embeddings)} embeddings for {len(texts)} texts")
+                return embeddings
+            print("Ollama /api/embed not available, falling back to /api/embeddings")
+            self._legacy_api = True
+
+        embeddings = []
+        for text in texts:
+            resp = connections.http_session().post(
+                f"{self.base_url}/api/embeddings",
+                json={"model": self.model, "prompt": text},
+                timeout=EMBED_TIMEOUT,
+            )
+            resp.raise_for_status()
+            embeddings.append(resp.json()["embedding"])
+        return embeddings
+
+    def _timed_batch(self, texts: List[str], delay: float, team_id: str) -> Tuple[List[List[float]], float]:
+        if delay:
+            time.sleep(delay)
+        with llm_scheduler.slot(self.model, llm_scheduler.INGEST_EMBED, team_id):
+            # Latency excludes the queue wait, so the batch size only reacts to Ollama
+            start = time.perf_counter()
+            embeddings = self._post_batch(texts)
+            return embeddings, time.perf_counter() - start
+
+    # -- Adaptive batch size ----------------------------------------------------
+
+    def _adapt(self, size: int, latency: float = None, ok: bool = True):
+        with self._lock:
+            if not ok:
+                self.batch_size = max(EMBED_MIN_BATCH_SIZE, self.batch_size // 2)
+            elif latency > EMBED_TARGET_LATENCY * 1.5:
+                self.batch_size = max(EMBED_MIN_BATCH_SIZE, self.batch_size * 3 // 4)
+            elif latency < EMBED_TARGET_LATENCY and size >= self.batch_size:
+                self.batch_size = min(EMBED_MAX_BATCH_SIZE, self.batch_size + max(1, self.batch_size // 4))
+
+    # -- Embeddings interface -------------------------------------------------
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed `texts`, preserving order. Cached texts skip Ollama."""
+        if self.cache is None or not texts:
+            return self._embed_uncached(texts)
+
+        results: List[List[float]] = [None] * len(texts)
+        for i, vector in self.cache.get_many(self.model, texts).items():
+            results[i] = vector
+        # Embed each distinct missing text once
+        missing = {}
+        for i, vector in enumerate(results):
+            if vector is None:
+                missing.setdefault(texts[i], []).append(i)
+        if missing:
+            unique = list(missing)
+            vectors = self._embed_uncached(unique)
+            self.cache.put_many(self.model, unique, vectors)
+            for text, vector in zip(unique, vectors):
+                for i in missing[text]:
+                    results[i] = vector
+        return results
+
+    def _embed_uncached(self, texts: List[str]) -> List[List[float]]:
+        n = len(texts)
+        if n == 0:
+            return []
+
+        started = time.perf_counter()
+        # Batches run on the engine's threads; carry the caller's team along
+        team_id = llm_scheduler.current_team()
+        results: List[List[float]] = [None] * n
+        retry = deque()
+        in_flight = {}
+        cursor = 0
+
+        # Ranges to (re)send: (start, end, failed attempts, times shed, first shed at)
+        while cursor < n or retry or in_flight:
+            while len(in_flight) < self.max_in_flight and (retry or cursor < n):
+                if retry:
+                    start, end, attempt, sheds, shed_since = retry.popleft()
+                else:
+                    start, end, attempt, sheds, shed_since = cursor, min(n, cursor + self.batch_size), 0, 0, None
+                    cursor = end
+                backoff = max(attempt, sheds)
+                delay = min(0.5 * (2 ** (backoff - 1)), 5.0) if backoff else 0.0
+                future = self._executor.submit(self._timed_batch, texts[start:end], delay, team_id)
+                in_flight[future] = (start, end, attempt, sheds, shed_since)
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                start, end, attempt, sheds, shed_since = in_flight.pop(future)
+                try:
+                    embeddings, latency = future.result()
+                except llm_scheduler.Overloaded as e:
+                    # Shed by the scheduler, Ollama didn't fail: back off and retry as is
+                    # until the ingest class deadline; doesn't count against EMBED_MAX_RETRIES
+                    now = time.monotonic()
+                    shed_since = shed_since if shed_since is not None else now
+                    if now - shed_since >= llm_scheduler.LLM_DEADLINES[llm_scheduler.INGEST_EMBED]:
+                        for pending in in_flight:
+                            pending.cancel()
+                        raise RuntimeError(f"Embedding batch [{start}:{end}] shed {sheds + 1} times: {e}")
+                    with self._lock:
+                        self._stats["overloaded_retries"] += 1
+                    retry.append((start, end, attempt, sheds + 1, shed_since))
+                    continue
+                except Exception as e:
+                    self._adapt(end - start, ok=False)
+                    with self._lock:
+                        self._stats["failures"] += 1
+                    if attempt >= EMBED_MAX_RETRIES:
+                        for pending in in_flight:
+                            pending.cancel()
+                        raise RuntimeError(f"Embedding batch [{start}:{end}] failed after {attempt + 1} attempts: {e}")
+                    with self._lock:
+                        self._stats["retries"] += 1
+                    # Split the failed range so one bad text doesn't sink its neighbours
+                    if end - start > 1:
+                        mid = (start + end) // 2
+                        retry.append((start, mid, attempt + 1, sheds, shed_since))
+                        retry.append((mid, end, attempt + 1, sheds, shed_since))
+                    else:
+                        retry.append((start, end, attempt + 1, sheds, shed_since))
+                    continue
+
+                results[start:end] = embeddings
+                self._adapt(end - start, latency)
+                with self._lock:
+                    self._stats["batches"] += 1
+
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self._stats["texts"] += n
+            self._stats["seconds"] += elapsed
+            self._last_rate = n / elapsed if elapsed else 0.0
+        if n > 1:
+            print(f"Embedded {n} chunks in {elapsed:.2f}s ({self._last_rate:.1f} chunks/sec, batch size {self.batch_size})")
+        return results
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a single query text."""
+        if self.cache is not None:
+            vector = self.cache.get(self.model, text)
+            if vector is not None:
+                return vector
+        if embed_batcher.EMBED_QUERY_BATCH_ENABLED:
+            vector = self._query_batcher.embed(text)
+        else:
+            vector = self._embed_query_batch([text])[0]
+        if self.cache is not None:
+            self.cache.put(self.model, text, vector)
+        return vector
+
+    def _embed_query_batch(self, texts: List[str]) -> List[List[float]]:
+        # One slot for the whole batch; it mixes teams, so none is attributed
+        with llm_scheduler.slot(self.model, llm_scheduler.QUERY_EMBED, team_id=""):
+            return self._post_batch(texts)
+
+    # -- Metrics ----------------------------------------------------------------
+
+    def stats(self) -> dict:
+        """Throughput and batching counters for this engine."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["chunks_per_sec"] = round(stats["texts"] / stats["seconds"], 2) if stats["seconds"] else 0.0
+            stats["last_chunks_per_sec"] = round(self._last_rate, 2)
+            stats["batch_size"] = self.batch_size
+            stats["max_in_flight"] = self.max_in_flight
+            stats["model"] = self.model
+        if self.cache is not None:
+            stats["cache"] = self.cache.stats()
+        stats["query_batching"] = self._query_batcher.stats()
+        stats["seconds"] = round(stats["seconds"], 3)
+        return stats
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(model: str, base_url: str) -> EmbeddingEngine:
+    """Shared engine per (model, base_url) so the whole process shares one
+    connection pool and one in-flight limit."""
+    key = (model, base_url.rstrip("/"))
+    with _engines_lock:
+        engine = _engines.get(key)
+        if engine is None:
+            engine = EmbeddingEngine(model=model, base_url=base_url)
+            _engines[key] = engine
+        return engine
+
+
+def all_stats() -> List[dict]:
+    """Stats for every engine created in this process."""
+    with _engines_lock:
+        engines = list(_engines.values())
+    return [engine.stats() for engine in engines]
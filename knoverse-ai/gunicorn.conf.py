@@ -0,0 +1,66 @@
+"""
+Production serving configuration: gunicorn -c gunicorn.conf.py app:app
+
+WEB_WORKERS processes with WEB_THREADS request threads each (gthread
+workers, so SSE streams and long generations only occupy a thread). Each
+worker warms up its own models and clients after forking. On SIGTERM a
+worker stops admitting new chat / ingestion requests and gunicorn waits up
+to WEB_GRACEFUL_TIMEOUT seconds for in-flight ones to finish.
+"""
+
+import os
+import signal
+from dotenv import load_dotenv
+
+load_dotenv()
+
+bind = os.getenv("WEB_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_WORKERS", "2"))
+threads = int(os.getenv("WEB_THREADS", "8"))
+worker_class = "gthread"
+# Long enough for a slow generation; streams keep the worker alive anyway
+timeout = int(os.getenv("WEB_TIMEOUT", "300"))
+graceful_timeout = int(os.getenv("WEB_GRACEFUL_TIMEOUT", "60"))
+keepalive = int(os.getenv("WEB_KEEPALIVE", "5"))
+max_requests = int(os.getenv("WEB_MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.getenv("WEB_MAX_REQUESTS_JITTER", "0"))
+accesslog = "-"
+errorlog = "-"
+
+
+def on_starting(server):
+    # Once per deployment, before any worker can pick up new jobs
+    import ingest_jobs
+
+    ingest_jobs.recover_interrupted()
+
+
+def post_worker_init(worker):
+    import components
+    import concurrency
+    import model_readiness
+
+    model_readiness.start()
+    components.warm_up()
+
+    previous = signal.getsignal(signal.SIGTERM)
+
+    def drain(signum, frame):
+        concurrency.begin_drain()
+        if callable(previous):
+            previous(signum, frame)
+
+    signal.signal(signal.SIGTERM, drain)
+
+
+def worker_exit(server, worker):
+    import async_runtime
+    import concurrency
+    import ingest_jobs
+
+    concurrency.begin_drain()
+    concurrency.wait_idle(graceful_timeout)
+    # Let background persistence / titles of finished chats complete
+    async_runtime.drain(graceful_timeout)
+    # Queued / running ingestion in this worker is marked interrupted
+    ingest_jobs.shutdown(wait=False)
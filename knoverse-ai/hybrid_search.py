@@ -0,0 +1,74 @@
+"""
+Hybrid retrieval: dense vector search fused with BM25 keyword search.
+
+Both retrievers fetch HYBRID_FETCH_K candidates for the team; the two rankings
+are merged with reciprocal rank fusion (score = sum of 1 / (RRF_K + rank)),
+which needs no score calibration between cosine and BM25, and the top
+HYBRID_K chunks are returned. With reranking on (reranker.py) the whole fused
+list is handed to the rerank stage instead.
+"""
+
+import os
+import hashlib
+from typing import List
+from dotenv import load_dotenv
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+import bm25_index
+from reranker import timed
+
+load_dotenv()
+
+# Configuration
+HYBRID_SEARCH_ENABLED = os.getenv("HYBRID_SEARCH_ENABLED", "true").lower() in ("1", "true", "yes")
+HYBRID_K = int(os.getenv("HYBRID_K", "4"))
+HYBRID_FETCH_K = int(os.getenv("HYBRID_FETCH_K", "10"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+
+def _doc_key(doc: Document) -> str:
+    return doc.id or hashlib.blake2b(doc.page_content.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def reciprocal_rank_fusion(rankings: List[List[Document]], k: int = RRF_K) -> List[Document]:
+    """Merge ranked document lists; documents are matched by id (or content)."""
+    scores, docs = {}, {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, 1):
+            key = _doc_key(doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            docs.setdefault(key, doc)
+    return [docs[key] for key in sorted(scores, key=scores.get, reverse=True)]
+
+
+def keyword_documents(team_id: str, query: str, k: int = HYBRID_FETCH_K) -> List[Document]:
+    """BM25 hits for the team as Documents shaped like vector store results."""
+    return [
+        Document(id=vid, page_content=text, metadata=metadata)
+        for vid, _, text, metadata in bm25_index.search(team_id, query, k)
+    ]
+
+
+class HybridRetriever(BaseRetriever):
+    """Dense retriever for one team fused with the team's BM25 shard."""
+
+    dense: BaseRetriever
+    team_id: str
+    k: int = HYBRID_K
+    fetch_k: int = HYBRID_FETCH_K
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        with timed("dense"):
+            dense = self.dense.invoke(query)
+        try:
+            with timed("keyword"):
+                keyword = keyword_documents(self.team_id, query, self.fetch_k)
+        except Exception as e:
+            # Keyword search is best effort; dense results still answer
+            print(f"Warning: BM25 search failed for team {self.team_id}: {e}")
+            keyword = []
+        with timed("fusion"):
+            return reciprocal_rank_fusion([dense, keyword])[:self.k]
@@ -0,0 +1,290 @@
+"""
+Asynchronous ingestion jobs for /uploadFile.
+
+Uploads are queued onto a bounded worker pool and tracked in a SQLite job
+table, so the HTTP request returns a job id immediately and clients poll for
+progress. Each job records its current stage (queued, downloading,
+downloaded, parsing, embedding, upserted, completed) together with "N of M
+chunks" counters (M grows while the PDF is still being parsed), and can be
+cancelled; a running job stops at the next stage or batch boundary.
+
+Nothing is written to the working directory: the PDF is streamed from
+storage in INGEST_DOWNLOAD_CHUNK_BYTES chunks into a SpooledTemporaryFile,
+which stays in memory up to INGEST_SPOOL_MAX_BYTES and beyond that rolls
+over to an anonymous temp file, and is parsed straight from that buffer.
+The buffer is gone as soon as the job finishes.
+"""
+
+import os
+import time
+import uuid
+import sqlite3
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, List, Optional
+from dotenv import load_dotenv
+
+import components
+import connections
+import answer_cache
+import pinecone_file_upload as pfu
+
+load_dotenv()
+
+# Configuration
+INGEST_JOBS_DB = os.getenv("INGEST_JOBS_DB", "ingest_jobs.sqlite3")
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+# Maximum number of jobs queued or running at once in this process
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "32"))
+# Downloads larger than this spill from memory to an unlinked temp file
+INGEST_SPOOL_MAX_BYTES = int(os.getenv("INGEST_SPOOL_MAX_BYTES", str(32 * 1024 * 1024)))
+INGEST_DOWNLOAD_CHUNK_BYTES = int(os.getenv("INGEST_DOWNLOAD_CHUNK_BYTES", str(1024 * 1024)))
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+TERMINAL_STATUSES = (COMPLETED, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    """Raised inside a running job once cancellation has been requested."""
+
+
+class QueueFull(RuntimeError):
+    """Raised by submit() when INGEST_QUEUE_SIZE jobs are already pending."""
+
+
+_lock = threading.Lock()
+_executor: Optional[ThreadPoolExecutor] = None
+_futures = {}
+# Set by shutdown(wait=False): running jobs stop at their next progress report
+_stopping = threading.Event()
+_INTERRUPTED = "Interrupted by server shutdown"
+
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(INGEST_JOBS_DB, timeout=30)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def init_db():
+    """Create the job table if needed."""
+    with _connect() as conn:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS ingest_jobs (
+                id TEXT PRIMARY KEY,
+                file_name TEXT NOT NULL,
+                team_id TEXT,
+                file_id TEXT,
+                status TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                chunks_done INTEGER,
+                chunks_total INTEGER,
+                error TEXT,
+                cancel_requested INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )"""
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS ingest_jobs_team ON ingest_jobs (team_id, created_at)")
+
+
+def _update(job_id: str, **fields):
+    fields["updated_at"] = time.time()
+    columns = ", ".join(f"{name} = ?" for name in fields)
+    with _connect() as conn:
+        conn.execute(f"UPDATE ingest_jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+
+def _row_to_job(row: sqlite3.Row) -> dict:
+    return {
+        "jobId": row["id"],
+        "fileName": row["file_name"],
+        "teamId": row["team_id"],
+        "fileId": row["file_id"],
+        "status": row["status"],
+        "stage": row["stage"],
+        "chunksDone": row["chunks_done"],
+        "chunksTotal": row["chunks_total"],
+        "error": row["error"],
+        "cancelRequested": bool(row["cancel_requested"]),
+        "createdAt": row["created_at"],
+        "updatedAt": row["updated_at"],
+    }
+
+
+def get(job_id: str) -> Optional[dict]:
+    """Return the job as a dict, or None if it doesn't exist."""
+    with _connect() as conn:
+        row = conn.execute("SELECT * FROM ingest_jobs WHERE id = ?", (job_id,)).fetchone()
+    return _row_to_job(row) if row else None
+
+
+def list_jobs(team_id: str = None, limit: int = 50) -> List[dict]:
+    """Most recent jobs first, optionally for one team."""
+    with _connect() as conn:
+        if team_id:
+            rows = conn.execute(
+                "SELECT * FROM ingest_jobs WHERE team_id = ? ORDER BY created_at DESC LIMIT ?",
+                (team_id, limit),
+            ).fetchall()
+        else:
+            rows = conn.execute("SELECT * FROM ingest_jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+    return [_row_to_job(row) for row in rows]
+
+
+def _cancel_requested(job_id: str) -> bool:
+    with _connect() as conn:
+        row = conn.execute("SELECT cancel_requested FROM ingest_jobs WHERE id = ?", (job_id,)).fetchone()
+    return bool(row and row["cancel_requested"])
+
+
+def download_to(file_name: str, out: BinaryIO) -> int:
+    """Stream `file_name` from the Supabase "files" bucket into `out` in chunks.
+
+    Returns the number of bytes written. A retry after a dropped connection
+    starts over at the beginning of `out`.
+    """
+    print(f"Downloading file {file_name} from Supabase storage")
+
+    def fetch():
+        out.seek(0)
+        out.truncate()
+        size = 0
+        with connections.storage_stream("files", file_name) as response:
+            response.raise_for_status()
+            for chunk in response.iter_bytes(INGEST_DOWNLOAD_CHUNK_BYTES):
+                out.write(chunk)
+                size += len(chunk)
+        return size
+
+    try:
+        return connections.with_reconnect(connections.SUPABASE, fetch)
+    except Exception as e:
+        raise RuntimeError(f"Storage download failed: {str(e)}")
+
+
+def _invalidate(team_id: str):
+    try:
+        components.invalidate(team_id)
+        answer_cache.invalidate(team_id)
+    except Exception as e:
+        print(f"Warning: failed to invalidate cached chains / answers of team {team_id}: {e}")
+
+
+def _run(job_id: str, file_name: str, team_id: str, file_id: str, incremental: bool = True):
+    def progress(stage: str, done: int = None, total: int = None):
+        if _stopping.is_set():
+            raise RuntimeError(_INTERRUPTED)
+        if _cancel_requested(job_id):
+            raise JobCancelled()
+        fields = {"stage": stage}
+        if done is not None:
+            fields["chunks_done"] = done
+        if total is not None:
+            fields["chunks_total"] = total
+        _update(job_id, **fields)
+
+    try:
+        if _cancel_requested(job_id):
+            raise JobCancelled()
+        _update(job_id, status=RUNNING, stage="downloading")
+
+        with tempfile.SpooledTemporaryFile(max_size=INGEST_SPOOL_MAX_BYTES) as pdf:
+            size = download_to(file_name, pdf)
+            print(f"Downloaded {size} bytes of {file_name}")
+            progress("downloaded")
+
+            pdf.seek(0)
+            try:
+                pfu.uploadFile(file_name, team_id, file_id, progress=progress, incremental=incremental, stream=pdf)
+            finally:
+                # Also when the job failed or was cancelled (uploadFile has rolled it back by
+                # then): answers may have been cached from batches upserted in the meantime
+                _invalidate(team_id)
+        _update(job_id, status=COMPLETED, stage="completed")
+    except JobCancelled:
+        print(f"Ingestion job {job_id} cancelled")
+        _update(job_id, status=CANCELLED, stage="cancelled")
+    except Exception as e:
+        print(f"Ingestion job {job_id} failed: {e}")
+        _update(job_id, status=FAILED, error=str(e))
+    finally:
+        with _lock:
+            _futures.pop(job_id, None)
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        init_db()
+        _executor = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix="ingest")
+    return _executor
+
+
+def submit(file_name: str, team_id: str, file_id: str, incremental: bool = True) -> dict:
+    """Queue an ingestion job and return it. Raises QueueFull when saturated."""
+    job_id = str(uuid.uuid4())
+    now = time.time()
+    with _lock:
+        executor = _get_executor()
+        if len(_futures) >= INGEST_QUEUE_SIZE:
+            raise QueueFull(f"Ingestion queue is full ({INGEST_QUEUE_SIZE} jobs pending)")
+        with _connect() as conn:
+            conn.execute(
+                """INSERT INTO ingest_jobs
+                   (id, file_name, team_id, file_id, status, stage, created_at, updated_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                (job_id, file_name, team_id, file_id, QUEUED, QUEUED, now, now),
+            )
+        _futures[job_id] = executor.submit(_run, job_id, file_name, team_id, file_id, incremental)
+    return get(job_id)
+
+
+def cancel(job_id: str) -> Optional[dict]:
+    """Request cancellation. Queued jobs are cancelled at once, running jobs at
+    their next stage or batch boundary. Returns the job, or None if unknown."""
+    job = get(job_id)
+    if job is None or job["status"] in TERMINAL_STATUSES:
+        return job
+
+    _update(job_id, cancel_requested=1)
+    with _lock:
+        future = _futures.get(job_id)
+        if future is not None and future.cancel():
+            _futures.pop(job_id, None)
+            _update(job_id, status=CANCELLED, stage="cancelled")
+    return get(job_id)
+
+
+def recover_interrupted():
+    """Mark jobs left queued/running by a previous process as failed."""
+    init_db()
+    with _connect() as conn:
+        conn.execute(
+            "UPDATE ingest_jobs SET status = ?, error = ?, updated_at = ? WHERE status IN (?, ?)",
+            (FAILED, "Interrupted by server restart", time.time(), QUEUED, RUNNING),
+        )
+
+
+def shutdown(wait: bool = True):
+    """Stop accepting jobs and optionally wait for running ones.
+
+    Without `wait`, queued jobs are marked failed and running ones stop at
+    their next stage or batch boundary.
+    """
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+        pending = [job_id for job_id, future in _futures.items() if not wait and future.cancel()]
+    if not wait:
+        _stopping.set()
+        for job_id in pending:
+            _update(job_id, status=FAILED, error=_INTERRUPTED)
+    if executor is not None:
+        executor.shutdown(wait=wait, cancel_futures=not wait)
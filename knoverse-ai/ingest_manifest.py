@@ -0,0 +1,203 @@
+"""
+Per-file ingestion manifest for incremental re-indexing.
+
+Every indexed chunk gets a deterministic vector id derived from its file_id
+and the hash of its normalised text (plus an occurrence counter for repeated
+chunks). The manifest records, per file, which vector ids were written along
+with the chunk hash, ordinal and page. On re-upload the new chunking is
+diffed against it: only new or changed chunks are embedded and upserted,
+and only vectors that disappeared are deleted.
+
+The manifest doubles as the vector id registry used for deletion: deletes
+are batched delete-by-id calls instead of metadata-filter scans. Ids are
+also recorded as "pending" right after each upsert, so vectors written by an
+ingestion that never finished can still be found and deleted.
+"""
+
+import os
+import time
+import sqlite3
+import hashlib
+from typing import Dict, Iterable, List, Optional, Tuple
+from dotenv import load_dotenv
+
+from embedding_cache import normalize_text
+
+load_dotenv()
+
+# Configuration
+INGEST_MANIFEST_DB = os.getenv("INGEST_MANIFEST_DB", "ingest_manifest.sqlite3")
+_SQL_BATCH = 400
+
+# vector_id -> (chunk_hash, ordinal, page)
+Manifest = Dict[str, Tuple[str, int, Optional[int]]]
+
+
+def chunk_hash(text: str) -> str:
+    return hashlib.blake2b(normalize_text(text).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def vector_id(file_id: str, hash_: str, occurrence: int = 0) -> str:
+    """Stable vector id for the `occurrence`-th chunk with this hash in the file."""
+    base = f"{file_id}#{hash_}"
+    return f"{base}-{occurrence}" if occurrence else base
+
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(INGEST_MANIFEST_DB, timeout=30)
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS manifest_files (
+            file_id TEXT PRIMARY KEY,
+            team_id TEXT,
+            chunk_count INTEGER NOT NULL,
+            updated_at REAL NOT NULL
+        )"""
+    )
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS manifest_chunks (
+            file_id TEXT NOT NULL,
+            vector_id TEXT NOT NULL,
+            chunk_hash TEXT NOT NULL,
+            ordinal INTEGER NOT NULL,
+            page INTEGER,
+            PRIMARY KEY (file_id, vector_id)
+        )"""
+    )
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS manifest_pending (
+            file_id TEXT NOT NULL,
+            vector_id TEXT NOT NULL,
+            team_id TEXT,
+            PRIMARY KEY (file_id, vector_id)
+        )"""
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS manifest_files_team ON manifest_files (team_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS manifest_pending_team ON manifest_pending (team_id)")
+    return conn
+
+
+def _in(values: List[str]) -> str:
+    return f"IN ({','.join('?' * len(values))})"
+
+
+def load(file_id: str) -> Optional[Manifest]:
+    """Return the file's manifest, or None if it was never indexed with one."""
+    with _connect() as conn:
+        if conn.execute("SELECT 1 FROM manifest_files WHERE file_id = ?", (file_id,)).fetchone() is None:
+            return None
+        rows = conn.execute(
+            "SELECT vector_id, chunk_hash, ordinal, page FROM manifest_chunks WHERE file_id = ?",
+            (file_id,),
+        ).fetchall()
+    return {vid: (hash_, ordinal, page) for vid, hash_, ordinal, page in rows}
+
+
+def record_upserted(file_id: str, team_id: str, vector_ids: List[str]):
+    """Register ids as soon as they are upserted, before the manifest is saved."""
+    with _connect() as conn:
+        conn.executemany(
+            "INSERT OR IGNORE INTO manifest_pending (file_id, vector_id, team_id) VALUES (?, ?, ?)",
+            [(file_id, vid, team_id) for vid in vector_ids],
+        )
+
+
+def pending_ids(file_id: str) -> List[str]:
+    """Ids upserted for the file that no saved manifest covers yet."""
+    with _connect() as conn:
+        return [row[0] for row in conn.execute("SELECT vector_id FROM manifest_pending WHERE file_id = ?", (file_id,))]
+
+
+def clear_pending(file_id: str):
+    """Forget the file's pending ids (after an unfinished run was rolled back)."""
+    with _connect() as conn:
+        conn.execute("DELETE FROM manifest_pending WHERE file_id = ?", (file_id,))
+
+
+def save(file_id: str, team_id: str, manifest: Manifest):
+    """Replace the file's manifest."""
+    with _connect() as conn:
+        conn.execute("DELETE FROM manifest_pending WHERE file_id = ?", (file_id,))
+        conn.execute("DELETE FROM manifest_chunks WHERE file_id = ?", (file_id,))
+        conn.executemany(
+            "INSERT INTO manifest_chunks (file_id, vector_id, chunk_hash, ordinal, page) VALUES (?, ?, ?, ?, ?)",
+            [(file_id, vid, hash_, ordinal, page) for vid, (hash_, ordinal, page) in manifest.items()],
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO manifest_files (file_id, team_id, chunk_count, updated_at) VALUES (?, ?, ?, ?)",
+            (file_id, team_id, len(manifest), time.time()),
+        )
+
+
+def delete(file_id: str):
+    """Forget the file's manifest (after its vectors were deleted)."""
+    delete_many([file_id])
+
+
+def delete_many(file_ids: List[str]):
+    """Forget the manifests and registered ids of `file_ids`."""
+    with _connect() as conn:
+        for batch in batched_ids(file_ids, _SQL_BATCH):
+            for table in ("manifest_chunks", "manifest_pending", "manifest_files"):
+                conn.execute(f"DELETE FROM {table} WHERE file_id {_in(batch)}", batch)
+
+
+def vector_ids(file_ids: List[str]) -> Dict[str, List[str]]:
+    """Registered vector ids per file (saved manifest plus pending upserts)."""
+    result: Dict[str, List[str]] = {}
+    with _connect() as conn:
+        for batch in batched_ids(file_ids, _SQL_BATCH):
+            for file_id, vid in conn.execute(
+                f"SELECT file_id, vector_id FROM manifest_chunks WHERE file_id {_in(batch)} "
+                f"UNION SELECT file_id, vector_id FROM manifest_pending WHERE file_id {_in(batch)}",
+                batch + batch,
+            ):
+                result.setdefault(file_id, []).append(vid)
+    return result
+
+
+def get_teams(file_ids: List[str]) -> Dict[str, str]:
+    """team_id of each file whose team is known."""
+    teams = {}
+    with _connect() as conn:
+        for batch in batched_ids(file_ids, _SQL_BATCH):
+            teams.update(conn.execute(
+                f"SELECT file_id, team_id FROM manifest_pending WHERE file_id {_in(batch)} "
+                f"UNION SELECT file_id, team_id FROM manifest_files WHERE file_id {_in(batch)}",
+                batch + batch,
+            ).fetchall())
+    return {file_id: team_id for file_id, team_id in teams.items() if team_id}
+
+
+def files_for_team(team_id: str) -> List[str]:
+    """Every file registered for the team."""
+    with _connect() as conn:
+        return [row[0] for row in conn.execute(
+            "SELECT file_id FROM manifest_files WHERE team_id = ? "
+            "UNION SELECT file_id FROM manifest_pending WHERE team_id = ?",
+            (team_id, team_id),
+        )]
+
+
+def get_team(file_id: str) -> Optional[str]:
+    """team_id the file was indexed for, if known."""
+    return get_teams([file_id]).get(file_id)
+
+
+def is_unchanged(previous: Optional[Manifest], vid: str, page: Optional[int]) -> bool:
+    """True when the chunk is already indexed under `vid` with the same page.
+
+    Chunks whose page moved are re-upserted so their page metadata stays right.
+    """
+    return previous is not None and vid in previous and previous[vid][2] == page
+
+
+def stale_ids(previous: Optional[Manifest], current: Manifest, pending: Iterable[str] = ()) -> List[str]:
+    """Vector ids in `previous` (or left `pending` by an unfinished run) that
+    no longer exist in `current`."""
+    return [vid for vid in dict.fromkeys([*(previous or {}), *pending]) if vid not in current]
+
+
+def batched_ids(ids: Iterable[str], size: int = 1000) -> Iterable[List[str]]:
+    ids = list(ids)
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
@@ -0,0 +1,120 @@
+"""
+Minimal streaming pipeline: generator stages connected by bounded queues.
+
+Each stage runs in its own thread and takes an iterator of its upstream's
+items, yielding items for the next stage. Because the queues are bounded, a
+slow stage (e.g. embedding) applies backpressure to the ones before it
+(e.g. PDF parsing) so memory stays flat, while the stages still overlap.
+
+    for item in run_pipeline(source, [stage_a, stage_b]):
+        ...
+
+If any stage raises, the remaining stages are stopped and the exception is
+re-raised to the consumer. If the consumer stops early (break / exception),
+the stages are stopped too.
+"""
+
+import os
+import queue
+import threading
+from typing import Callable, Iterable, Iterator, List
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Maximum number of items buffered between two stages
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "4"))
+
+_POLL_SECONDS = 0.1
+_DONE = object()
+
+Stage = Callable[[Iterator], Iterable]
+
+
+class _Stopped(Exception):
+    """Internal: the pipeline was stopped while a stage was waiting."""
+
+
+class _Context:
+    def __init__(self):
+        self.stop = threading.Event()
+        self.error = None
+        self._lock = threading.Lock()
+
+    def fail(self, error: BaseException):
+        with self._lock:
+            if self.error is None:
+                self.error = error
+        self.stop.set()
+
+
+def _put(ctx: _Context, q: queue.Queue, item):
+    while True:
+        if ctx.stop.is_set():
+            raise _Stopped()
+        try:
+            q.put(item, timeout=_POLL_SECONDS)
+            return
+        except queue.Full:
+            continue
+
+
+def _drain(ctx: _Context, q: queue.Queue) -> Iterator:
+    while True:
+        if ctx.stop.is_set():
+            raise _Stopped()
+        try:
+            item = q.get(timeout=_POLL_SECONDS)
+        except queue.Empty:
+            continue
+        if item is _DONE:
+            return
+        yield item
+
+
+def _run_stage(ctx: _Context, items: Callable[[], Iterable], out_q: queue.Queue):
+    try:
+        for item in items():
+            _put(ctx, out_q, item)
+        _put(ctx, out_q, _DONE)
+    except _Stopped:
+        pass
+    except BaseException as e:
+        ctx.fail(e)
+
+
+def run_pipeline(source: Iterable, stages: List[Stage], maxsize: int = PIPELINE_QUEUE_SIZE) -> Iterator:
+    """Run `source` and each of `stages` in its own thread; yield the last stage's output."""
+    ctx = _Context()
+    threads = []
+
+    out_q = queue.Queue(maxsize=maxsize)
+    threads.append(threading.Thread(target=_run_stage, args=(ctx, lambda: source, out_q), daemon=True))
+    for stage in stages:
+        in_q, out_q = out_q, queue.Queue(maxsize=maxsize)
+        items = (lambda stage=stage, in_q=in_q: stage(_drain(ctx, in_q)))
+        threads.append(threading.Thread(target=_run_stage, args=(ctx, items, out_q), daemon=True))
+
+    for thread in threads:
+        thread.start()
+
+    try:
+        yield from _drain(ctx, out_q)
+    except _Stopped:
+        raise ctx.error
+    finally:
+        ctx.stop.set()
+        for thread in threads:
+            thread.join()
+
+
+def batched(items: Iterable, size: int) -> Iterator[list]:
+    """Group `items` into lists of at most `size`."""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
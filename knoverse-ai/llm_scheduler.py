@@ -0,0 +1,319 @@
+"""
+Admission control and priority scheduling for Ollama calls.
+
+Every generate / embed request to Ollama takes a slot from the scheduler of
+its model first, so overload turns into queueing (or a fast, explicit
+rejection) instead of piling requests onto Ollama until they time out.
+
+- Priority classes, highest first: interactive chat, query embedding,
+  ingestion embedding, session titles. A freed slot always goes to the
+  highest class with a waiter.
+- Each model admits at most its max in-flight requests (LLM_MAX_IN_FLIGHT,
+  overridable per model with LLM_MODEL_LIMITS="gemma3:1b=2,nomic-embed-text=4").
+  LLM_INTERACTIVE_RESERVE of those slots are kept for chat / query embeds,
+  so a large ingestion can't take every slot.
+- The wait queue holds at most LLM_QUEUE_SIZE requests per model. When it is
+  full, a newcomer evicts the newest request of a lower class (from the team
+  with the most queued requests) or is rejected.
+- Each class has a deadline (max queue wait). Requests are shed when the
+  deadline passes, or straight away when the estimated wait (from the
+  model's average service time) already exceeds it.
+- Within a class, teams are served round-robin, so one team's burst can't
+  starve the others.
+
+Shed requests raise Overloaded. Limits are per worker process. Model pulls
+(model_readiness.py) are not scheduled.
+"""
+
+import os
+import time
+import threading
+import contextvars
+from collections import Counter, OrderedDict, deque
+from contextlib import contextmanager
+from typing import Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CHAT = "chat"
+QUERY_EMBED = "query_embed"
+INGEST_EMBED = "ingest_embed"
+TITLE = "title"
+# Highest priority first
+PRIORITIES = (CHAT, QUERY_EMBED, INGEST_EMBED, TITLE)
+INTERACTIVE = (CHAT, QUERY_EMBED)
+
+# Configuration
+LLM_SCHEDULER_ENABLED = os.getenv("LLM_SCHEDULER_ENABLED", "true").lower() in ("1", "true", "yes")
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "4"))
+LLM_MODEL_LIMITS = os.getenv("LLM_MODEL_LIMITS", "")
+LLM_INTERACTIVE_RESERVE = int(os.getenv("LLM_INTERACTIVE_RESERVE", "1"))
+LLM_QUEUE_SIZE = int(os.getenv("LLM_QUEUE_SIZE", "64"))
+# Max seconds a request of each class may wait for a slot
+LLM_DEADLINES = {
+    CHAT: float(os.getenv("LLM_DEADLINE_CHAT", "30")),
+    QUERY_EMBED: float(os.getenv("LLM_DEADLINE_QUERY_EMBED", "10")),
+    INGEST_EMBED: float(os.getenv("LLM_DEADLINE_INGEST_EMBED", "600")),
+    TITLE: float(os.getenv("LLM_DEADLINE_TITLE", "5")),
+}
+# Recent waits kept per class for the percentiles in stats()
+LLM_WAIT_SAMPLES = 512
+
+_RANK = {priority: rank for rank, priority in enumerate(PRIORITIES)}
+_team: contextvars.ContextVar = contextvars.ContextVar("llm_scheduler_team", default=None)
+
+
+class Overloaded(RuntimeError):
+    """Raised when a request is shed instead of waiting for an Ollama slot."""
+
+    def __init__(self, model: str, priority: str, reason: str):
+        self.model = model
+        self.priority = priority
+        self.reason = reason
+        super().__init__(f"Ollama is overloaded ({model}, {priority}: {reason})")
+
+
+def _parse_limits(spec: str) -> dict:
+    limits = {}
+    for item in spec.split(","):
+        name, _, value = item.strip().rpartition("=")
+        if name and value.strip().isdigit():
+            limits[name.strip()] = max(1, int(value))
+    return limits
+
+
+_model_limits = _parse_limits(LLM_MODEL_LIMITS)
+
+
+class _Ticket:
+    __slots__ = ("priority", "team", "enqueued", "started", "event", "granted", "shed")
+
+    def __init__(self, priority: str, team: Optional[str]):
+        self.priority = priority
+        self.team = team
+        self.enqueued = time.monotonic()
+        self.started = None
+        self.event = threading.Event()
+        self.granted = False
+        self.shed = None
+
+
+def _percentile(values, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class _ModelScheduler:
+    """Slots and wait queue for one model."""
+
+    def __init__(self, model: str, limit: int):
+        self.model = model
+        self.limit = max(1, limit)
+        self._lock = threading.Lock()
+        # priority -> team -> queued tickets (oldest first); team order is the round-robin order
+        self._queues = {priority: OrderedDict() for priority in PRIORITIES}
+        self._depth = 0
+        self._in_flight = Counter()
+        # Moving average of seconds a slot is held, for the predicted wait
+        self._service = 0.0
+        self._waits = {priority: deque(maxlen=LLM_WAIT_SAMPLES) for priority in PRIORITIES}
+        self._admitted = Counter()
+        self._shed = {priority: Counter() for priority in PRIORITIES}
+
+    def _capacity(self, priority: str) -> int:
+        if priority in INTERACTIVE:
+            return self.limit
+        return max(1, self.limit - LLM_INTERACTIVE_RESERVE)
+
+    def _queued(self, priority: str) -> int:
+        return sum(len(tickets) for tickets in self._queues[priority].values())
+
+    def _ahead(self, priority: str) -> int:
+        return sum(self._queued(p) for p in PRIORITIES[:_RANK[priority] + 1])
+
+    def _start(self, ticket: _Ticket):
+        ticket.granted = True
+        ticket.started = time.monotonic()
+        self._in_flight[ticket.priority] += 1
+        self._admitted[ticket.priority] += 1
+        self._waits[ticket.priority].append(ticket.started - ticket.enqueued)
+        ticket.event.set()
+
+    def _remove(self, ticket: _Ticket):
+        teams = self._queues[ticket.priority]
+        tickets = teams.get(ticket.team)
+        if tickets is None or ticket not in tickets:
+            return
+        tickets.remove(ticket)
+        if not tickets:
+            del teams[ticket.team]
+        self._depth -= 1
+
+    def _evict_for(self, priority: str) -> bool:
+        """Shed the newest lower-class request of the busiest team; False if none."""
+        for lower in reversed(PRIORITIES[_RANK[priority] + 1:]):
+            teams = self._queues[lower]
+            if not teams:
+                continue
+            tickets = max(teams.values(), key=len)
+            victim = tickets[-1]
+            self._remove(victim)
+            victim.shed = "evicted"
+            self._shed[lower]["evicted"] += 1
+            victim.event.set()
+            return True
+        return False
+
+    def _dispatch(self):
+        in_flight = sum(self._in_flight.values())
+        for priority in PRIORITIES:
+            teams = self._queues[priority]
+            while teams and in_flight < self._capacity(priority):
+                team, tickets = next(iter(teams.items()))
+                ticket = tickets.popleft()
+                if tickets:
+                    teams.move_to_end(team)
+                else:
+                    del teams[team]
+                self._depth -= 1
+                self._start(ticket)
+                in_flight += 1
+            if teams:
+                # Lower classes never get a slot this class is waiting for
+                return
+
+    def acquire(self, priority: str, team: Optional[str], timeout: float) -> _Ticket:
+        ticket = _Ticket(priority, team)
+        with self._lock:
+            in_flight = sum(self._in_flight.values())
+            if in_flight < self._capacity(priority) and not self._ahead(priority):
+                self._start(ticket)
+                return ticket
+
+            reason = None
+            expected = (self._ahead(priority) + 1) * self._service / self._capacity(priority)
+            if self._service and expected > timeout:
+                reason = "predicted"
+            elif self._depth >= LLM_QUEUE_SIZE and not self._evict_for(priority):
+                reason = "queue_full"
+            if reason:
+                self._shed[priority][reason] += 1
+                raise Overloaded(self.model, priority, reason)
+
+            self._queues[priority].setdefault(team, deque()).append(ticket)
+            self._depth += 1
+
+        ticket.event.wait(timeout)
+        with self._lock:
+            if ticket.granted:
+                return ticket
+            if ticket.shed is None:
+                self._remove(ticket)
+                ticket.shed = "deadline"
+                self._shed[priority]["deadline"] += 1
+        raise Overloaded(self.model, priority, ticket.shed)
+
+    def release(self, ticket: _Ticket):
+        held = time.monotonic() - ticket.started
+        with self._lock:
+            self._in_flight[ticket.priority] -= 1
+            self._service = held if not self._service else 0.8 * self._service + 0.2 * held
+            self._dispatch()
+
+    def depth(self) -> int:
+        with self._lock:
+            return self._depth
+
+    def stats(self) -> dict:
+        with self._lock:
+            classes = {}
+            for priority in PRIORITIES:
+                waits = list(self._waits[priority])
+                classes[priority] = {
+                    "queued": self._queued(priority),
+                    "teams_waiting": len(self._queues[priority]),
+                    "in_flight": self._in_flight[priority],
+                    "admitted": self._admitted[priority],
+                    "shed": dict(self._shed[priority]),
+                    "wait_p50_ms": round(_percentile(waits, 0.5) * 1000, 1),
+                    "wait_p95_ms": round(_percentile(waits, 0.95) * 1000, 1),
+                    "wait_max_ms": round(max(waits, default=0.0) * 1000, 1),
+                }
+            return {
+                "max_in_flight": self.limit,
+                "in_flight": sum(self._in_flight.values()),
+                "queue_depth": self._depth,
+                "avg_service_ms": round(self._service * 1000, 1),
+                "classes": classes,
+            }
+
+
+_lock = threading.Lock()
+_schedulers = {}
+
+
+def _get(model: str) -> _ModelScheduler:
+    with _lock:
+        scheduler = _schedulers.get(model)
+        if scheduler is None:
+            scheduler = _ModelScheduler(model, _model_limits.get(model, LLM_MAX_IN_FLIGHT))
+            _schedulers[model] = scheduler
+        return scheduler
+
+
+@contextmanager
+def team(team_id: Optional[str]):
+    """Attribute the Ollama calls made in this block (this thread) to `team_id`."""
+    token = _team.set(team_id)
+    try:
+        yield
+    finally:
+        _team.reset(token)
+
+
+def current_team() -> Optional[str]:
+    return _team.get()
+
+
+@contextmanager
+def slot(model: str, priority: str, team_id: Optional[str] = None, timeout: float = None):
+    """Hold one of `model`'s Ollama slots for the duration of the block.
+
+    Waits at most `timeout` seconds (default: the class deadline) and raises
+    Overloaded if the request is shed. `team_id` defaults to the enclosing
+    team() block.
+    """
+    if not LLM_SCHEDULER_ENABLED:
+        yield
+        return
+    scheduler = _get(model)
+    ticket = scheduler.acquire(
+        priority,
+        team_id if team_id is not None else _team.get(),
+        LLM_DEADLINES[priority] if timeout is None else timeout,
+    )
+    try:
+        yield
+    finally:
+        scheduler.release(ticket)
+
+
+def queue_depth(model: str) -> int:
+    """Requests waiting for one of `model`'s slots."""
+    with _lock:
+        scheduler = _schedulers.get(model)
+    return scheduler.depth() if scheduler is not None else 0
+
+
+def stats() -> dict:
+    with _lock:
+        schedulers = dict(_schedulers)
+    return {
+        "enabled": LLM_SCHEDULER_ENABLED,
+        "queue_size": LLM_QUEUE_SIZE,
+        "deadlines": dict(LLM_DEADLINES),
+        "models": {model: scheduler.stats() for model, scheduler in schedulers.items()},
+    }
@@ -0,0 +1,672 @@
+"""
+Local vector store backend (NumPy / memory-mapped) used instead of Pinecone
+when VECTOR_BACKEND=local.
+
+LocalIndex mirrors the subset of the Pinecone Index API the app uses
+(upsert, query, delete, fetch, list_paginated, describe_index_stats), so ingestion and
+deletion code works unchanged against either backend. Each namespace is a
+directory holding:
+
+- append-only segments: raw float32 matrices (one file per upsert batch,
+  rows L2-normalised) opened with np.memmap
+- meta.sqlite3: the metadata side table (id -> segment/row, team_id,
+  file_id, metadata JSON), indexed by team_id and file_id
+
+Deletes and overwrites only remove rows from the side table; compaction
+rewrites the live rows into a single segment once too many rows are dead or
+too many segments exist. Cosine top-k is a vectorised dot product over the
+rows selected by the filter; team-filtered queries on large teams (or any
+query on a namespace holding a single team) only score the candidates from
+the team's IVF partition (ann_index.py).
+
+LocalVectorStore wraps a LocalIndex as a LangChain VectorStore, so
+as_retriever() / similarity_search() work as with PineconeVectorStore.
+"""
+
+import os
+import json
+import uuid
+import sqlite3
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from dotenv import load_dotenv
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+import ann_index
+
+load_dotenv()
+
+# Configuration
+LOCAL_MAX_SEGMENTS = int(os.getenv("LOCAL_MAX_SEGMENTS", "32"))
+# Compact once this fraction of stored rows is dead
+LOCAL_COMPACT_DEAD_RATIO = float(os.getenv("LOCAL_COMPACT_DEAD_RATIO", "0.3"))
+
+_COLUMN_KEYS = ("team_id", "file_id")
+_SQL_BATCH = 500
+
+
+class _Match:
+    """Query match with the same attributes as Pinecone's ScoredVector."""
+
+    __slots__ = ("id", "score", "metadata", "values")
+
+    def __init__(self, id: str, score: float, metadata: dict = None, values: list = None):
+        self.id = id
+        self.score = score
+        self.metadata = metadata
+        self.values = values
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def to_dict(self) -> dict:
+        return {"id": self.id, "score": self.score, "metadata": self.metadata, "values": self.values}
+
+
+class _Response(dict):
+    """dict that also allows attribute access, like Pinecone responses."""
+
+    def __getattr__(self, key):
+        try:
+            return self[key]
+        except KeyError:
+            raise AttributeError(key)
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _as_condition(condition) -> Tuple[str, Any]:
+    if isinstance(condition, dict):
+        if len(condition) != 1:
+            raise ValueError(f"Unsupported filter condition: {condition}")
+        return next(iter(condition.items()))
+    return "$eq", condition
+
+
+def _single_team(filter: Optional[dict]) -> Optional[str]:
+    """team_id the filter pins to a single value, if any."""
+    for key, condition in (filter or {}).items():
+        if key == "$and":
+            for sub in condition:
+                team = _single_team(sub)
+                if team is not None:
+                    return team
+        elif key == "team_id":
+            op, operand = _as_condition(condition)
+            if op == "$eq":
+                return operand
+    return None
+
+
+def _matches(value, op: str, operand) -> bool:
+    if op == "$eq":
+        return value == operand
+    if op == "$ne":
+        return value != operand
+    if op == "$in":
+        return value in operand
+    if op == "$nin":
+        return value not in operand
+    raise ValueError(f"Unsupported filter operator: {op}")
+
+
+class _SegmentGone(Exception):
+    """A segment of a columns view was compacted away (by another process)."""
+
+
+class _Columns:
+    """In-memory columnar view of a namespace's side table."""
+
+    def __init__(self, rows: List[tuple]):
+        self.ids = [row[0] for row in rows]
+        self.position = {vid: i for i, vid in enumerate(self.ids)}
+        self.segment_names: List[str] = []
+        segment_codes = {}
+        self.codes: Dict[str, Dict[Any, int]] = {key: {} for key in _COLUMN_KEYS}
+        segments, positions = [], []
+        columns = {key: [] for key in _COLUMN_KEYS}
+        for vid, segment, row, team_id, file_id in rows:
+            if segment not in segment_codes:
+                segment_codes[segment] = len(self.segment_names)
+                self.segment_names.append(segment)
+            segments.append(segment_codes[segment])
+            positions.append(row)
+            for key, value in (("team_id", team_id), ("file_id", file_id)):
+                columns[key].append(self.codes[key].setdefault(value, len(self.codes[key])))
+        self.segment = np.asarray(segments, dtype=np.int32)
+        self.row = np.asarray(positions, dtype=np.int64)
+        self.column = {key: np.asarray(values, dtype=np.int32) for key, values in columns.items()}
+        # Per-team namespaces hold a single team; its queries carry no team filter
+        teams = self.codes["team_id"]
+        self.only_team = next(iter(teams)) if len(teams) == 1 else None
+
+    def __len__(self):
+        return len(self.ids)
+
+
+class _Namespace:
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(os.path.join(path, "meta.sqlite3"), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._conn:
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS vectors (
+                    id TEXT PRIMARY KEY,
+                    segment TEXT NOT NULL,
+                    row INTEGER NOT NULL,
+                    team_id TEXT,
+                    file_id TEXT,
+                    metadata TEXT
+                )"""
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS vectors_team ON vectors (team_id)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS vectors_file ON vectors (file_id)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS segments (name TEXT PRIMARY KEY, rows INTEGER NOT NULL, dead INTEGER NOT NULL DEFAULT 0)"
+            )
+            self._conn.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value INTEGER)")
+            self._conn.execute("INSERT OR IGNORE INTO state (key, value) VALUES ('version', 0)")
+        self._columns: Optional[_Columns] = None
+        self._columns_version = None
+        self._mmaps: Dict[str, np.memmap] = {}
+        self.ann = ann_index.PartitionedANN(os.path.basename(path))
+
+    # -- State ---------------------------------------------------------------
+
+    def _state(self, key: str) -> Optional[int]:
+        row = self._conn.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def dimension(self) -> Optional[int]:
+        return self._state("dimension")
+
+    def _bump(self):
+        self._conn.execute("UPDATE state SET value = value + 1 WHERE key = 'version'")
+
+    def columns(self) -> _Columns:
+        """Columnar view, rebuilt when this or another process wrote since."""
+        with self._lock:
+            version = self._state("version")
+            if self._columns is None or version != self._columns_version:
+                rows = self._conn.execute("SELECT id, segment, row, team_id, file_id FROM vectors").fetchall()
+                self._columns = _Columns(rows)
+                self._columns_version = version
+                # Segments compacted away (here or by another process) hold no live rows
+                live = set(self._columns.segment_names)
+                for name in [name for name in self._mmaps if name not in live]:
+                    del self._mmaps[name]
+            return self._columns
+
+    def read(self, fn: Callable[[_Columns], Any]) -> Any:
+        """fn(columns) under the lock, run once more on a fresh view if
+        another process compacted one of the view's segments away."""
+        with self._lock:
+            try:
+                return fn(self.columns())
+            except _SegmentGone:
+                self._columns = None
+                return fn(self.columns())
+
+    def _segment(self, name: str) -> np.memmap:
+        mm = self._mmaps.get(name)
+        if mm is None:
+            row = self._conn.execute("SELECT rows FROM segments WHERE name = ?", (name,)).fetchone()
+            if row is None:
+                raise _SegmentGone(name)
+            try:
+                mm = np.memmap(os.path.join(self.path, name), dtype=np.float32, mode="r", shape=(row[0], self.dimension()))
+            except FileNotFoundError:
+                raise _SegmentGone(name)
+            self._mmaps[name] = mm
+        return mm
+
+    def _write_segment(self, matrix: np.ndarray) -> str:
+        name = f"seg-{uuid.uuid4().hex}.f32"
+        tmp = os.path.join(self.path, name + ".tmp")
+        np.ascontiguousarray(matrix, dtype=np.float32).tofile(tmp)
+        os.replace(tmp, os.path.join(self.path, name))
+        return name
+
+    def _mark_dead(self, ids: List[str]):
+        for start in range(0, len(ids), _SQL_BATCH):
+            batch = ids[start:start + _SQL_BATCH]
+            self._conn.execute(
+                f"""UPDATE segments SET dead = dead + (
+                        SELECT COUNT(*) FROM vectors WHERE vectors.segment = segments.name
+                        AND vectors.id IN ({','.join('?' * len(batch))}))""",
+                batch,
+            )
+
+    # -- Writes --------------------------------------------------------------
+
+    def upsert(self, items: List[Tuple[str, List[float], dict]]) -> int:
+        # Last write wins for duplicate ids within one call
+        deduped = {vid: (values, metadata) for vid, values, metadata in items}
+        if not deduped:
+            return 0
+        ids = list(deduped)
+        matrix = _normalize_rows(np.asarray([deduped[vid][0] for vid in ids], dtype=np.float32))
+
+        with self._lock:
+            dimension = self.dimension()
+            if dimension is None:
+                dimension = matrix.shape[1]
+            elif matrix.shape[1] != dimension:
+                raise ValueError(f"Vector dimension {matrix.shape[1]} does not match index dimension {dimension}")
+            name = self._write_segment(matrix)
+            with self._conn:
+                self._conn.execute("INSERT OR IGNORE INTO state (key, value) VALUES ('dimension', ?)", (dimension,))
+                self._mark_dead(ids)
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO vectors (id, segment, row, team_id, file_id, metadata) VALUES (?, ?, ?, ?, ?, ?)",
+                    [
+                        (vid, name, row, (deduped[vid][1] or {}).get("team_id"), (deduped[vid][1] or {}).get("file_id"),
+                         json.dumps(deduped[vid][1] or {}))
+                        for row, vid in enumerate(ids)
+                    ],
+                )
+                self._conn.execute("INSERT INTO segments (name, rows) VALUES (?, ?)", (name, len(ids)))
+                self._bump()
+                version = self._state("version")
+            self.ann.apply_upsert(ids, [(deduped[vid][1] or {}).get("team_id") for vid in ids], matrix, version)
+            self.maybe_compact()
+        return len(ids)
+
+    def delete_ids(self, ids: List[str]) -> int:
+        if not ids:
+            return 0
+        deleted = 0
+        with self._lock:
+            with self._conn:
+                self._mark_dead(ids)
+                for start in range(0, len(ids), _SQL_BATCH):
+                    batch = ids[start:start + _SQL_BATCH]
+                    deleted += self._conn.execute(
+                        f"DELETE FROM vectors WHERE id IN ({','.join('?' * len(batch))})", batch
+                    ).rowcount
+                self._bump()
+                version = self._state("version")
+            self.ann.apply_delete(ids, version)
+        return deleted
+
+    def delete_all(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM vectors")
+            self._conn.execute("UPDATE segments SET dead = rows")
+            self._bump()
+        self.maybe_compact()
+
+    # -- Reads ---------------------------------------------------------------
+
+    def metadata(self, ids: List[str]) -> Dict[str, dict]:
+        result = {}
+        for start in range(0, len(ids), _SQL_BATCH):
+            batch = ids[start:start + _SQL_BATCH]
+            for vid, metadata in self._conn.execute(
+                f"SELECT id, metadata FROM vectors WHERE id IN ({','.join('?' * len(batch))})", batch
+            ):
+                result[vid] = json.loads(metadata) if metadata else {}
+        return result
+
+    def select(self, columns: _Columns, filter: Optional[dict], positions: np.ndarray = None) -> np.ndarray:
+        """Column positions (of all rows, or of `positions`) matching a
+        Pinecone-style metadata filter."""
+        if positions is None:
+            positions = np.arange(len(columns))
+        keep = np.ones(len(positions), dtype=bool)
+        post = {}
+        for key, condition in (filter or {}).items():
+            if key == "$and":
+                for sub in condition:
+                    keep &= np.isin(positions, self.select(columns, sub, positions))
+                continue
+            op, operand = _as_condition(condition)
+            if key in _COLUMN_KEYS:
+                codes = columns.codes[key]
+                column = columns.column[key][positions]
+                if op in ("$eq", "$ne"):
+                    hit = column == codes.get(operand, -1)
+                    keep &= hit if op == "$eq" else ~hit
+                elif op in ("$in", "$nin"):
+                    hit = np.isin(column, [codes[v] for v in operand if v in codes])
+                    keep &= hit if op == "$in" else ~hit
+                else:
+                    raise ValueError(f"Unsupported filter operator: {op}")
+            else:
+                post[key] = (op, operand)
+
+        positions = positions[keep]
+        if post and len(positions):
+            # Other metadata keys are checked against the side table
+            candidates = [columns.ids[i] for i in positions]
+            metadata = self.metadata(candidates)
+            keep = np.asarray([
+                all(_matches(metadata.get(vid, {}).get(key), op, operand) for key, (op, operand) in post.items())
+                for vid in candidates
+            ], dtype=bool)
+            positions = positions[keep]
+        return positions
+
+    def vectors(self, columns: _Columns, positions: np.ndarray) -> np.ndarray:
+        """Stored (normalised) vectors for the given column positions."""
+        result = np.empty((len(positions), self.dimension() or 0), dtype=np.float32)
+        segments = columns.segment[positions]
+        for code in np.unique(segments):
+            selected = np.flatnonzero(segments == code)
+            result[selected] = self._segment(columns.segment_names[code])[columns.row[positions[selected]]]
+        return result
+
+    def _load_vectors(self, columns: _Columns):
+        def load(positions: np.ndarray) -> np.ndarray:
+            with self._lock:
+                return self.vectors(columns, positions)
+        return load
+
+    def _ann_candidates(self, columns: _Columns, query: np.ndarray, filter: Optional[dict],
+                        nprobe: Optional[int]) -> Optional[np.ndarray]:
+        team = _single_team(filter)
+        if team is None and not filter:
+            team = columns.only_team
+        if team is None or not ann_index.ANN_ENABLED:
+            return None
+        self.ann.sync(columns, self._columns_version, self._load_vectors(columns))
+        ids = self.ann.candidates(team, query, nprobe)
+        if ids is None:
+            return None
+        # Tombstoned ids are no longer in the columns
+        positions = np.unique(np.asarray(
+            [columns.position[vid] for vid in ids if vid in columns.position], dtype=np.int64
+        ))
+        return self.select(columns, filter, positions)
+
+    def search(self, vector: List[float], top_k: int, filter: Optional[dict] = None,
+               nprobe: int = None, exact: bool = False) -> List[Tuple[str, float]]:
+        """Cosine top-k over the rows matching `filter`.
+
+        Team-filtered queries probe the team's IVF partition (see
+        ann_index.py) when it has one, unless `exact` is set.
+        """
+        query = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+
+        def score(columns: _Columns):
+            if not len(columns) or top_k <= 0:
+                return columns, None, None
+            positions = None if exact else self._ann_candidates(columns, query, filter, nprobe)
+            if positions is None or len(positions) < top_k:
+                # No partition, or too few candidates in the probed lists
+                positions = self.select(columns, filter)
+            if not len(positions):
+                return columns, None, None
+            return columns, positions, self.vectors(columns, positions) @ query
+
+        columns, positions, scores = self.read(score)
+        if scores is None:
+            return []
+        k = min(top_k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(columns.ids[positions[i]], float(scores[i])) for i in top]
+
+    def list_ids(self, prefix: Optional[str], limit: int, after: Optional[str]) -> List[str]:
+        """Up to `limit` live ids (sorted) starting with `prefix`, after `after`."""
+        sql, params = "SELECT id FROM vectors WHERE id > ?", [after or ""]
+        if prefix:
+            sql += " AND substr(id, 1, ?) = ?"
+            params += [len(prefix), prefix]
+        with self._lock:
+            return [row[0] for row in self._conn.execute(f"{sql} ORDER BY id LIMIT ?", (*params, limit))]
+
+    # -- Maintenance ---------------------------------------------------------
+
+    def stats(self) -> dict:
+        total, dead, segments = self._conn.execute(
+            "SELECT COALESCE(SUM(rows), 0), COALESCE(SUM(dead), 0), COUNT(*) FROM segments"
+        ).fetchone()
+        return {"vector_count": total - dead, "dead_rows": dead, "segments": segments}
+
+    def maybe_compact(self):
+        stats = self.stats()
+        stored = stats["vector_count"] + stats["dead_rows"]
+        if stats["segments"] > LOCAL_MAX_SEGMENTS or (stored and stats["dead_rows"] / stored > LOCAL_COMPACT_DEAD_RATIO):
+            self.compact()
+
+    def compact(self):
+        """Rewrite all live rows into one segment and drop the old segment files.
+
+        The snapshot and the rewrite happen in one BEGIN IMMEDIATE transaction,
+        which holds SQLite's write lock, so other worker processes can't
+        upsert or delete in between.
+        """
+        with self._lock:
+            new_name = None
+            try:
+                with self._conn:
+                    self._conn.execute("BEGIN IMMEDIATE")
+                    columns = _Columns(self._conn.execute("SELECT id, segment, row, team_id, file_id FROM vectors").fetchall())
+                    old_segments = [name for (name,) in self._conn.execute("SELECT name FROM segments")]
+                    if len(columns):
+                        new_name = self._write_segment(self.vectors(columns, np.arange(len(columns))))
+                        self._conn.executemany(
+                            "UPDATE vectors SET segment = ?, row = ? WHERE id = ?",
+                            [(new_name, row, vid) for row, vid in enumerate(columns.ids)],
+                        )
+                        self._conn.execute("INSERT INTO segments (name, rows) VALUES (?, ?)", (new_name, len(columns)))
+                    self._conn.executemany("DELETE FROM segments WHERE name = ?", [(name,) for name in old_segments])
+                    self._bump()
+                    version = self._state("version")
+            except BaseException:
+                if new_name:
+                    os.remove(os.path.join(self.path, new_name))
+                raise
+            self.ann.apply_compaction(version)
+            for name in old_segments:
+                self._mmaps.pop(name, None)
+                try:
+                    os.remove(os.path.join(self.path, name))
+                except FileNotFoundError:
+                    pass
+            print(f"Compacted local namespace {os.path.basename(self.path)}: {len(old_segments)} segments -> {1 if new_name else 0}")
+
+
+class LocalIndex:
+    """Pinecone-Index-compatible local vector index rooted at `root`."""
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._namespaces: Dict[str, _Namespace] = {}
+
+    def _ns(self, namespace: Optional[str]) -> _Namespace:
+        name = namespace or "__default__"
+        with self._lock:
+            ns = self._namespaces.get(name)
+            if ns is None:
+                ns = _Namespace(os.path.join(self.root, name))
+                self._namespaces[name] = ns
+            return ns
+
+    def _existing_namespaces(self) -> List[str]:
+        return sorted(
+            name for name in os.listdir(self.root)
+            if os.path.exists(os.path.join(self.root, name, "meta.sqlite3"))
+        )
+
+    def upsert(self, vectors: Iterable, namespace: str = None, **kwargs) -> dict:
+        items = []
+        for vector in vectors:
+            if isinstance(vector, dict):
+                items.append((vector["id"], vector["values"], vector.get("metadata") or {}))
+            else:
+                vid, values, *rest = vector
+                items.append((vid, values, rest[0] if rest else {}))
+        return _Response(upserted_count=self._ns(namespace).upsert(items))
+
+    def query(self, vector: List[float] = None, top_k: int = 10, filter: dict = None, namespace: str = None,
+              include_metadata: bool = False, include_values: bool = False, id: str = None,
+              nprobe: int = None, exact: bool = False, **kwargs) -> dict:
+        ns = self._ns(namespace)
+        if vector is None and id is not None:
+            vector = self.fetch([id], namespace).vectors[id]["values"]
+        hits = ns.search(vector, top_k, filter, nprobe=nprobe, exact=exact)
+        ids = [vid for vid, _ in hits]
+        metadata = ns.metadata(ids) if include_metadata else {}
+        values = {}
+        if include_values and ids:
+            fetched = self.fetch(ids, namespace).vectors
+            values = {vid: fetched[vid]["values"] for vid in fetched}
+        matches = [
+            _Match(vid, score, metadata.get(vid) if include_metadata else None, values.get(vid))
+            for vid, score in hits
+        ]
+        return _Response(matches=matches, namespace=namespace or "")
+
+    def fetch(self, ids: List[str], namespace: str = None, **kwargs) -> dict:
+        ns = self._ns(namespace)
+
+        def load(columns: _Columns):
+            found = [vid for vid in ids if vid in columns.position]
+            positions = np.asarray([columns.position[vid] for vid in found], dtype=np.int64)
+            return found, ns.vectors(columns, positions) if len(found) else []
+
+        found, vectors = ns.read(load)
+        metadata = ns.metadata(found)
+        return _Response(
+            namespace=namespace or "",
+            vectors={
+                vid: {"id": vid, "values": vectors[i].tolist(), "metadata": metadata.get(vid, {})}
+                for i, vid in enumerate(found)
+            },
+        )
+
+    def list_paginated(self, prefix: str = None, limit: int = 100, pagination_token: str = None,
+                       namespace: str = None, **kwargs) -> dict:
+        """One page of vector ids, like Pinecone's list_paginated."""
+        ids = self._ns(namespace).list_ids(prefix, limit, pagination_token)
+        more = len(ids) == limit and bool(self._ns(namespace).list_ids(prefix, 1, ids[-1]))
+        return _Response(
+            namespace=namespace or "",
+            vectors=[_Response(id=vid) for vid in ids],
+            pagination=_Response(next=ids[-1]) if more else None,
+        )
+
+    def delete(self, ids: List[str] = None, filter: dict = None, namespace: str = None,
+               delete_all: bool = False, **kwargs) -> dict:
+        ns = self._ns(namespace)
+        if delete_all:
+            ns.delete_all()
+        elif ids:
+            ns.delete_ids(list(ids))
+        elif filter:
+            columns = ns.columns()
+            ns.delete_ids([columns.ids[i] for i in ns.select(columns, filter)])
+        ns.maybe_compact()
+        return _Response()
+
+    def describe_index_stats(self, **kwargs) -> dict:
+        namespaces = {}
+        dimension = None
+        for name in self._existing_namespaces():
+            ns = self._ns(name)
+            namespaces[name] = {"vector_count": ns.stats()["vector_count"]}
+            dimension = dimension or ns.dimension()
+        return _Response(
+            dimension=dimension,
+            namespaces=namespaces,
+            total_vector_count=sum(ns["vector_count"] for ns in namespaces.values()),
+        )
+
+    def compact(self, namespace: str = None):
+        self._ns(namespace).compact()
+
+    def ann_stats(self) -> dict:
+        return {name: self._ns(name).ann.stats() for name in self._existing_namespaces()}
+
+
+class LocalVectorStore(VectorStore):
+    """LangChain VectorStore over a LocalIndex (same text/metadata layout as
+    PineconeVectorStore: the chunk text is stored under the "text" key)."""
+
+    def __init__(self, index: LocalIndex, embedding: Embeddings, namespace: str = None, text_key: str = "text"):
+        self._index = index
+        self._embedding = embedding
+        self._namespace = namespace
+        self._text_key = text_key
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+                  ids: Optional[List[str]] = None, namespace: str = None, **kwargs) -> List[str]:
+        texts = list(texts)
+        ids = list(ids) if ids else [str(uuid.uuid4()) for _ in texts]
+        metadatas = metadatas or [{} for _ in texts]
+        vectors = self._embedding.embed_documents(texts)
+        self._index.upsert(
+            [
+                (vid, vector, {**metadata, self._text_key: text})
+                for vid, vector, metadata, text in zip(ids, vectors, metadatas, texts)
+            ],
+            namespace=namespace or self._namespace,
+        )
+        return ids
+
+    def similarity_search_by_vector_with_score(self, embedding: List[float], k: int = 4, filter: dict = None,
+                                               namespace: str = None, **kwargs) -> List[Tuple[Document, float]]:
+        response = self._index.query(
+            vector=embedding, top_k=k, filter=filter, namespace=namespace or self._namespace, include_metadata=True,
+            nprobe=kwargs.get("nprobe"), exact=kwargs.get("exact", False),
+        )
+        results = []
+        for match in response.matches:
+            metadata = dict(match.metadata or {})
+            text = metadata.pop(self._text_key, "")
+            results.append((Document(id=match.id, page_content=text, metadata=metadata), match.score))
+        return results
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: dict = None,
+                                     namespace: str = None, **kwargs) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(
+            self._embedding.embed_query(query), k=k, filter=filter, namespace=namespace, **kwargs
+        )
+
+    def similarity_search(self, query: str, k: int = 4, filter: dict = None, namespace: str = None,
+                          **kwargs) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, filter=filter, namespace=namespace,
+                                                                    **kwargs)]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, filter: dict = None,
+                                    namespace: str = None, **kwargs) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k=k, filter=filter,
+                                                                              namespace=namespace, **kwargs)]
+
+    def delete(self, ids: Optional[List[str]] = None, filter: dict = None, namespace: str = None,
+               delete_all: bool = False, **kwargs) -> None:
+        self._index.delete(ids=ids, filter=filter, namespace=namespace or self._namespace, delete_all=delete_all)
+
+    def _select_relevance_score_fn(self):
+        # Scores are cosine similarities in [-1, 1]
+        return lambda score: (score + 1.0) / 2.0
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None,
+                   ids: Optional[List[str]] = None, index: LocalIndex = None, namespace: str = None,
+                   **kwargs) -> "LocalVectorStore":
+        store = cls(index or LocalIndex(kwargs.get("path", "vector_data")), embedding, namespace=namespace)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
@@ -0,0 +1,232 @@
+"""
+Move vectors from the shared namespace into per-team namespaces.
+
+Resumable bulk migration for VECTOR_NAMESPACE_STRATEGY=per_team:
+
+1. copy: list the source namespace's ids page by page, fetch each page and
+   re-upsert its vectors into their team's namespace in batches. Every copied
+   id is recorded (with its team) in MIGRATION_STATE_DB together with the
+   pagination token, so an interrupted run continues with the next page.
+2. verify: compare per-team counts of the copied ids against the target
+   namespaces and fetch every copied id back from its target namespace.
+3. delete: remove the verified originals from the source namespace in batches.
+
+Vectors without a team_id stay in the source namespace.
+
+Usage: python migrate_namespaces.py [--restart] [--keep-source]
+
+--restart discards the saved progress; --keep-source stops after verify.
+Suggested rollout: migrate, switch VECTOR_NAMESPACE_STRATEGY to per_team and
+restart the API, then run the migration once more to move vectors that were
+written to the shared namespace in between.
+"""
+
+import os
+import sys
+import time
+import sqlite3
+from collections import Counter, defaultdict
+from typing import Dict, List
+from dotenv import load_dotenv
+
+import vector_backend
+
+load_dotenv()
+
+# Configuration
+MIGRATION_STATE_DB = os.getenv("MIGRATION_STATE_DB", "namespace_migration.sqlite3")
+MIGRATION_PAGE_SIZE = int(os.getenv("MIGRATION_PAGE_SIZE", "100"))  # Pinecone lists at most 100 ids per page
+MIGRATION_UPSERT_BATCH = int(os.getenv("MIGRATION_UPSERT_BATCH", "100"))
+MIGRATION_DELETE_BATCH = int(os.getenv("MIGRATION_DELETE_BATCH", "1000"))
+# Pinecone is eventually consistent: verification retries before giving up
+MIGRATION_VERIFY_ATTEMPTS = int(os.getenv("MIGRATION_VERIFY_ATTEMPTS", "5"))
+MIGRATION_VERIFY_DELAY = float(os.getenv("MIGRATION_VERIFY_DELAY", "5"))
+
+COPY = "copy"
+VERIFY = "verify"
+DELETE = "delete"
+DONE = "done"
+
+
+def _field(obj, name: str):
+    # Local responses are dicts, Pinecone's are objects
+    return obj.get(name) if isinstance(obj, dict) else getattr(obj, name, None)
+
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(MIGRATION_STATE_DB, timeout=30)
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS migration_state (
+            source TEXT PRIMARY KEY,
+            phase TEXT NOT NULL,
+            pagination_token TEXT,
+            updated_at REAL NOT NULL
+        )"""
+    )
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS migrated_vectors (
+            source TEXT NOT NULL,
+            vector_id TEXT NOT NULL,
+            team_id TEXT NOT NULL,
+            deleted INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (source, vector_id)
+        )"""
+    )
+    return conn
+
+
+def _state(conn: sqlite3.Connection, source: str):
+    row = conn.execute("SELECT phase, pagination_token FROM migration_state WHERE source = ?", (source,)).fetchone()
+    return row if row else (None, None)
+
+
+def _set_state(conn: sqlite3.Connection, source: str, phase: str, token: str = None):
+    conn.execute(
+        "INSERT OR REPLACE INTO migration_state (source, phase, pagination_token, updated_at) VALUES (?, ?, ?, ?)",
+        (source, phase, token, time.time()),
+    )
+
+
+def _batched(items: List, size: int):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _copy(index, conn: sqlite3.Connection, source: str, token: str = None):
+    copied = Counter()
+    skipped = 0
+    while True:
+        page = index.list_paginated(namespace=source, limit=MIGRATION_PAGE_SIZE, pagination_token=token)
+        ids = [_field(item, "id") for item in (_field(page, "vectors") or [])]
+        if ids:
+            fetched = _field(index.fetch(ids=ids, namespace=source), "vectors") or {}
+            by_team: Dict[str, list] = defaultdict(list)
+            for vid in ids:
+                vector = fetched.get(vid)
+                if vector is None:
+                    continue
+                metadata = dict(_field(vector, "metadata") or {})
+                team_id = metadata.get("team_id")
+                if not team_id:
+                    skipped += 1
+                    continue
+                by_team[team_id].append((vid, list(_field(vector, "values")), metadata))
+            for team_id, vectors in by_team.items():
+                for batch in _batched(vectors, MIGRATION_UPSERT_BATCH):
+                    index.upsert(vectors=batch, namespace=vector_backend.team_namespace(team_id))
+                copied[team_id] += len(vectors)
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO migrated_vectors (source, vector_id, team_id, deleted) VALUES (?, ?, ?, 0)",
+                    [(source, vid, team_id) for team_id, vectors in by_team.items() for vid, _, _ in vectors],
+                )
+                pagination = _field(page, "pagination")
+                token = _field(pagination, "next") if pagination else None
+                _set_state(conn, source, COPY if token else VERIFY, token)
+        else:
+            with conn:
+                _set_state(conn, source, VERIFY)
+        print(f"Copied {sum(copied.values())} vectors to {len(copied)} team namespaces ({skipped} without team_id)")
+        if not token or not ids:
+            return
+
+
+def _missing(index, conn: sqlite3.Connection, source: str) -> Dict[str, List[str]]:
+    """Copied ids (per team) not found in their target namespace."""
+    missing = {}
+    teams = [row[0] for row in conn.execute(
+        "SELECT DISTINCT team_id FROM migrated_vectors WHERE source = ? AND deleted = 0", (source,)
+    )]
+    for team_id in teams:
+        ids = [row[0] for row in conn.execute(
+            "SELECT vector_id FROM migrated_vectors WHERE source = ? AND team_id = ? AND deleted = 0",
+            (source, team_id),
+        )]
+        found = set()
+        for batch in _batched(ids, MIGRATION_PAGE_SIZE):
+            found.update((_field(index.fetch(ids=batch, namespace=vector_backend.team_namespace(team_id)),
+                                 "vectors") or {}).keys())
+        lost = [vid for vid in ids if vid not in found]
+        if lost:
+            missing[team_id] = lost
+    return missing
+
+
+def _verify(index, conn: sqlite3.Connection, source: str) -> bool:
+    counts = dict(conn.execute(
+        "SELECT team_id, COUNT(*) FROM migrated_vectors WHERE source = ? AND deleted = 0 GROUP BY team_id", (source,)
+    ).fetchall())
+    for attempt in range(1, MIGRATION_VERIFY_ATTEMPTS + 1):
+        namespaces = _field(index.describe_index_stats(), "namespaces") or {}
+        short = {
+            team_id: (count, _field(namespaces.get(vector_backend.team_namespace(team_id)) or {}, "vector_count") or 0)
+            for team_id, count in counts.items()
+        }
+        short = {team_id: pair for team_id, pair in short.items() if pair[1] < pair[0]}
+        missing = {} if short else _missing(index, conn, source)
+        if not short and not missing:
+            print(f"Verified {sum(counts.values())} vectors in {len(counts)} team namespaces")
+            return True
+        print(f"Verify attempt {attempt}: {len(short)} namespaces short, "
+              f"{sum(len(ids) for ids in missing.values())} ids missing")
+        if attempt < MIGRATION_VERIFY_ATTEMPTS:
+            time.sleep(MIGRATION_VERIFY_DELAY)
+    return False
+
+
+def _delete(index, conn: sqlite3.Connection, source: str):
+    ids = [row[0] for row in conn.execute(
+        "SELECT vector_id FROM migrated_vectors WHERE source = ? AND deleted = 0", (source,)
+    )]
+    for batch in _batched(ids, MIGRATION_DELETE_BATCH):
+        index.delete(ids=batch, namespace=source)
+        with conn:
+            conn.executemany(
+                "UPDATE migrated_vectors SET deleted = 1 WHERE source = ? AND vector_id = ?",
+                [(source, vid) for vid in batch],
+            )
+    print(f"Deleted {len(ids)} migrated vectors from namespace {source}")
+
+
+def migrate(source: str = vector_backend.DEFAULT_NAMESPACE, keep_source: bool = False, restart: bool = False) -> bool:
+    """Run (or resume) the migration of `source`; True when it completed."""
+    vector_backend.ensure_index()
+    index = vector_backend.get_index()
+    conn = _connect()
+    if restart:
+        with conn:
+            conn.execute("DELETE FROM migration_state WHERE source = ?", (source,))
+            conn.execute("DELETE FROM migrated_vectors WHERE source = ?", (source,))
+
+    phase, token = _state(conn, source)
+    if phase in (None, DONE):
+        # Fresh run; after a completed one this picks up vectors written since
+        phase, token = COPY, None
+        with conn:
+            _set_state(conn, source, COPY)
+    print(f"Migrating namespace {source} ({vector_backend.VECTOR_BACKEND}), resuming at phase {phase}")
+
+    if phase == COPY:
+        _copy(index, conn, source, token)
+        phase = VERIFY
+    if phase == VERIFY:
+        if not _verify(index, conn, source):
+            print("Verification failed; originals kept. Re-run to retry.")
+            return False
+        with conn:
+            _set_state(conn, source, DONE if keep_source else DELETE)
+        if keep_source:
+            return True
+        phase = DELETE
+    if phase == DELETE:
+        _delete(index, conn, source)
+        with conn:
+            _set_state(conn, source, DONE)
+    # Chunk manifests stay valid: vector ids don't change
+    print(f"Migration of {source} complete")
+    return True
+
+
+if __name__ == "__main__":
+    ok = migrate(keep_source="--keep-source" in sys.argv, restart="--restart" in sys.argv)
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,191 @@
+"""
+Ollama model readiness tracking.
+
+At startup the required models are checked (and pulled in the background if
+missing). Chat requests then consult an in-memory readiness state instead of
+calling Ollama: once every model is known to be present a request costs zero
+HTTP calls. The state is re-checked in the background after MODEL_CHECK_TTL
+seconds, and requests that arrive while a pull is running get a
+ModelsWarmingUp error straight away instead of blocking a worker.
+"""
+
+import os
+import json
+import time
+import threading
+from typing import Iterable, List
+from dotenv import load_dotenv
+
+import connections
+
+load_dotenv()
+
+# Configuration
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "ollama:11434")
+OLLAMA_EMBEDDING_MODEL = os.getenv("OLLAMA_EMBEDDING_MODEL", "nomic-embed-text")
+OLLAMA_LLM_MODEL = os.getenv("OLLAMA_LLM_MODEL", "gemma3:1b")
+REQUIRED_MODELS = [OLLAMA_EMBEDDING_MODEL, OLLAMA_LLM_MODEL]
+
+# Seconds before a "ready" model is re-checked against /api/tags
+MODEL_CHECK_TTL = float(os.getenv("MODEL_CHECK_TTL", "300"))
+# Seconds before a failed re-check of a ready model is retried
+MODEL_RECHECK_RETRY = float(os.getenv("MODEL_RECHECK_RETRY", "30"))
+# Timeout for /api/tags; pulls use it to connect and PULL_READ_TIMEOUT between progress lines
+OLLAMA_HTTP_TIMEOUT = float(os.getenv("OLLAMA_HTTP_TIMEOUT", "5"))
+PULL_READ_TIMEOUT = float(os.getenv("OLLAMA_PULL_READ_TIMEOUT", "600"))
+
+READY = "ready"
+PULLING = "pulling"
+MISSING = "missing"
+ERROR = "error"
+UNKNOWN = "unknown"
+
+
+class ModelsWarmingUp(RuntimeError):
+    """Raised when a request needs a model that isn't available yet."""
+
+    def __init__(self, models: List[str]):
+        self.models = models
+        super().__init__(f"Ollama models warming up: {', '.join(models)}")
+
+
+_lock = threading.Lock()
+_state = {}
+_refreshing = False
+
+
+def _canonical(model: str) -> str:
+    # Ollama reports untagged models as "<name>:latest"
+    return model if ":" in model else f"{model}:latest"
+
+
+def _set(model: str, status: str, error: str = None):
+    with _lock:
+        _state[model] = {"status": status, "checked_at": time.monotonic(), "error": error}
+
+
+def _check_failed(model: str, error: str):
+    """A failed /api/tags call: a model confirmed ready stays ready."""
+    with _lock:
+        entry = _state.get(model)
+        if entry is None or entry["status"] != READY:
+            _state[model] = {"status": ERROR, "checked_at": time.monotonic(), "error": error}
+            return
+        entry["retry_at"] = time.monotonic() + MODEL_RECHECK_RETRY
+        entry["error"] = error
+
+
+def _fetch_installed() -> set:
+    resp = connections.http_session().get(f"{OLLAMA_BASE_URL}/api/tags", timeout=OLLAMA_HTTP_TIMEOUT)
+    resp.raise_for_status()
+    return {_canonical(m["name"]) for m in resp.json().get("models", [])}
+
+
+def _pull(model: str):
+    print(f"📥 Pulling Ollama model: {model}")
+    with connections.http_session().post(
+        f"{OLLAMA_BASE_URL}/api/pull",
+        json={"name": model},
+        stream=True,
+        timeout=(OLLAMA_HTTP_TIMEOUT, PULL_READ_TIMEOUT),
+    ) as r:
+        r.raise_for_status()
+        for line in r.iter_lines():
+            if not line:
+                continue
+            progress = json.loads(line)
+            if progress.get("error"):
+                raise RuntimeError(progress["error"])
+    print(f"Pulled Ollama model: {model}")
+
+
+def refresh(models: Iterable[str] = None):
+    """Check `models` against Ollama and pull any that are missing (blocking).
+
+    If Ollama can't be reached, models already confirmed ready keep that
+    state (a transient failure shouldn't reject all traffic) and are
+    re-checked after MODEL_RECHECK_RETRY seconds; the others become ERROR.
+    """
+    models = list(models or REQUIRED_MODELS)
+    try:
+        installed = _fetch_installed()
+    except Exception as e:
+        print(f"Warning: failed to list Ollama models: {e}")
+        for model in models:
+            _check_failed(model, str(e))
+        return
+
+    for model in models:
+        if _canonical(model) in installed:
+            _set(model, READY)
+            continue
+        _set(model, PULLING)
+        try:
+            _pull(model)
+            _set(model, READY)
+        except Exception as e:
+            print(f"Warning: failed to pull Ollama model {model}: {e}")
+            _set(model, ERROR, str(e))
+
+
+def _refresh_in_background(models: List[str]):
+    global _refreshing
+    try:
+        refresh(models)
+    finally:
+        with _lock:
+            _refreshing = False
+
+
+def start(models: Iterable[str] = None) -> bool:
+    """Start a background check/pull of `models`. Returns False if one is already running."""
+    global _refreshing
+    models = list(models or REQUIRED_MODELS)
+    with _lock:
+        if _refreshing:
+            return False
+        _refreshing = True
+        for model in models:
+            _state.setdefault(model, {"status": UNKNOWN, "checked_at": 0.0, "error": None})
+    threading.Thread(target=_refresh_in_background, args=(models,), daemon=True).start()
+    return True
+
+
+def require_ready(models: Iterable[str] = None):
+    """Fast readiness check for the request path.
+
+    Returns immediately when every model is ready; a stale entry schedules a
+    background re-check but is still served. Raises ModelsWarmingUp if any
+    model is pulling, missing or failed its last check.
+    """
+    models = list(models or REQUIRED_MODELS)
+    now = time.monotonic()
+    not_ready = []
+    stale = False
+    with _lock:
+        for model in models:
+            entry = _state.get(model)
+            if entry is None or entry["status"] != READY:
+                not_ready.append(model)
+            elif now - entry["checked_at"] > MODEL_CHECK_TTL and now >= entry.get("retry_at", 0.0):
+                stale = True
+
+    if not_ready:
+        start(models)
+        raise ModelsWarmingUp(not_ready)
+    if stale:
+        start(models)
+
+
+def status() -> dict:
+    """Snapshot of the readiness state, for health/metrics endpoints."""
+    now = time.monotonic()
+    with _lock:
+        return {
+            model: {
+                "status": entry["status"],
+                "age_seconds": round(now - entry["checked_at"], 1) if entry["checked_at"] else None,
+                "error": entry["error"],
+            }
+            for model, entry in _state.items()
+        }
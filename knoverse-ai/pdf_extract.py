@@ -0,0 +1,203 @@
+"""
+PDF page extraction from a path or an in-memory / spooled buffer.
+
+iter_pages() yields one LangChain Document per page, with the metadata
+PyPDFLoader sets: the document information (producer, creator, title,
+creationdate, ...) plus source, total_pages, page and page_label. It reads through
+pypdf directly, so ingestion can parse a seekable binary stream (such as the
+SpooledTemporaryFile a storage download is streamed into) without the PDF
+ever being written to the working directory. pypdf reads the stream lazily;
+keep it open until the pages have been consumed.
+
+iter_page_chunks() also splits each page into chunks. Text extraction is CPU
+bound, so PDFs with at least PDF_PARALLEL_MIN_PAGES pages are extracted by a
+pool of PDF_EXTRACT_WORKERS processes: the pages are cut into ranges of
+PDF_PAGES_PER_TASK, each worker extracts and splits whole ranges, and the
+chunks come back in page order. Only PDF_TASKS_PER_WORKER ranges per worker
+are submitted ahead of the consumer, so memory stays bounded when a later
+stage (embedding) is slower than extraction. Smaller PDFs (or PDF_EXTRACT_WORKERS=1) are
+extracted serially, where starting processes would cost more than it saves.
+A pool lives for one PDF and its workers open the PDF by path: a stream is
+first copied, in chunks, to a named temp file that is removed afterwards, so
+memory use doesn't grow with the number of workers.
+"""
+
+import os
+import time
+import shutil
+import tempfile
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import BinaryIO, Iterator, List, Union
+from dotenv import load_dotenv
+
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from pypdf import PdfReader
+
+load_dotenv()
+
+# Configuration
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1))))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "64"))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "16"))
+# Ranges submitted per worker ahead of the one being consumed
+PDF_TASKS_PER_WORKER = int(os.getenv("PDF_TASKS_PER_WORKER", "2"))
+# forkserver: the API process is multi-threaded, so workers are not forked from it directly
+PDF_EXTRACT_START_METHOD = os.getenv(
+    "PDF_EXTRACT_START_METHOD",
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn",
+)
+
+PdfSource = Union[str, BinaryIO]
+
+_lock = threading.Lock()
+_stats = {"serial": 0, "parallel": 0, "pages": 0, "parallel_pages": 0, "seconds": 0.0}
+
+
+def _document_metadata(reader: PdfReader, source: str) -> dict:
+    """PyPDFLoader's document-level metadata: the PDF's information
+    dictionary with normalised keys, plus source and total_pages."""
+    info = {"producer": "PyPDF", "creator": "PyPDF", "creationdate": ""}
+    info.update(reader.metadata or {})
+    info.update(source=source, total_pages=len(reader.pages))
+    metadata = {}
+    for key, value in info.items():
+        if type(value) not in (str, int):
+            value = str(value)
+        key = key.lstrip("/").lower()
+        if key in ("creationdate", "moddate"):
+            try:
+                value = datetime.strptime(value.replace("'", ""), "D:%Y%m%d%H%M%S%z").isoformat("T")
+            except ValueError:
+                pass
+        elif isinstance(value, str):
+            value = value.strip()
+        metadata[key] = value
+    return metadata
+
+
+def _page_document(reader: PdfReader, number: int, metadata: dict, labels: List[str]) -> Document:
+    return Document(
+        page_content=reader.pages[number].extract_text(extraction_mode="plain").strip(),
+        metadata={**metadata, "page": number, "page_label": labels[number]},
+    )
+
+
+def iter_pages(pdf: PdfSource, source: str = None) -> Iterator[Document]:
+    """Lazily extract the text of each page of `pdf` (a path or a seekable binary file).
+
+    `source` is recorded as the pages' "source" metadata (default: the path).
+    """
+    if source is None:
+        source = pdf if isinstance(pdf, str) else ""
+    reader = PdfReader(pdf)
+    metadata = _document_metadata(reader, source)
+    labels = reader.page_labels
+    for number in range(len(reader.pages)):
+        yield _page_document(reader, number, metadata, labels)
+
+
+# -- Worker processes -------------------------------------------------------------
+
+_worker = {}
+
+
+def _init_worker(path: str, source: str, splitter_args: dict):
+    reader = PdfReader(path)
+    _worker.update(
+        reader=reader,
+        labels=reader.page_labels,
+        metadata=_document_metadata(reader, source),
+        splitter=RecursiveCharacterTextSplitter(**splitter_args),
+    )
+
+
+def _extract_range(start: int, stop: int) -> List[List[Document]]:
+    reader, labels, metadata, splitter = _worker["reader"], _worker["labels"], _worker["metadata"], _worker["splitter"]
+    return [
+        splitter.split_documents([_page_document(reader, number, metadata, labels)])
+        for number in range(start, stop)
+    ]
+
+
+# -- Extraction -------------------------------------------------------------------
+
+def _record(mode: str, pages: int, started: float):
+    with _lock:
+        _stats[mode] += 1
+        _stats["pages"] += pages
+        if mode == "parallel":
+            _stats["parallel_pages"] += pages
+        _stats["seconds"] += time.perf_counter() - started
+
+
+def iter_page_chunks(pdf: PdfSource, source: str, splitter_args: dict,
+                     workers: int = None) -> Iterator[List[Document]]:
+    """The chunks of each page of `pdf`, one list per page, in page order.
+
+    `splitter_args` are the RecursiveCharacterTextSplitter arguments. Large
+    PDFs are extracted by up to `workers` (default PDF_EXTRACT_WORKERS)
+    processes; the chunks are the same either way.
+    """
+    started = time.perf_counter()
+    workers = PDF_EXTRACT_WORKERS if workers is None else workers
+    reader = PdfReader(pdf)
+    total = len(reader.pages)
+
+    if workers <= 1 or total < max(PDF_PARALLEL_MIN_PAGES, 2):
+        splitter = RecursiveCharacterTextSplitter(**splitter_args)
+        metadata = _document_metadata(reader, source)
+        labels = reader.page_labels
+        for number in range(total):
+            yield splitter.split_documents([_page_document(reader, number, metadata, labels)])
+        _record("serial", total, started)
+        return
+
+    step = max(1, PDF_PAGES_PER_TASK)
+    ranges = [(start, min(start + step, total)) for start in range(0, total, step)]
+    spilled = executor = None
+    try:
+        if not isinstance(pdf, str):
+            spilled = tempfile.NamedTemporaryFile(suffix=".pdf", delete=False)
+            with spilled:
+                pdf.seek(0)
+                shutil.copyfileobj(pdf, spilled)
+            pdf = spilled.name
+        executor = ProcessPoolExecutor(
+            max_workers=min(workers, len(ranges)),
+            mp_context=multiprocessing.get_context(PDF_EXTRACT_START_METHOD),
+            initializer=_init_worker,
+            initargs=(pdf, source, splitter_args),
+        )
+        # At most PDF_TASKS_PER_WORKER ranges per worker are outstanding, so a slow
+        # consumer doesn't let finished ranges pile up; results keep page order
+        window = max(1, PDF_TASKS_PER_WORKER) * min(workers, len(ranges))
+        pending = deque()
+        for start, stop in ranges:
+            pending.append(executor.submit(_extract_range, start, stop))
+            if len(pending) >= window:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+    finally:
+        # Also reached when the consumer stops early (a cancelled job)
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+        if spilled is not None:
+            os.remove(spilled.name)
+    _record("parallel", total, started)
+
+
+def stats() -> dict:
+    with _lock:
+        result = dict(_stats)
+    result["seconds"] = round(result["seconds"], 3)
+    result["workers"] = PDF_EXTRACT_WORKERS
+    result["parallel_min_pages"] = PDF_PARALLEL_MIN_PAGES
+    result["pages_per_task"] = PDF_PAGES_PER_TASK
+    result["tasks_per_worker"] = PDF_TASKS_PER_WORKER
+    return result
@@ -1,8 +1,9 @@
 import os
 import string
 from dotenv import load_dotenv
-from typing import List
+from typing import Dict, Iterable, List, Optional
 import sys
+from collections import defaultdict
 
 # LangChain imports
 from langchain_community.document_loaders import PyPDFLoader
@@ -10,9 +11,9 @@ from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.embeddings import OllamaEmbeddings
 from langchain_pinecone import PineconeVectorStore
 
-# Pinecone imports
-from pinecone import Pinecone
-from pinecone import ServerlessSpec
+import ingest_manifest
+import vector_backend
+import bm25_index
 
 # Load environment variables
 load_dotenv()
@@ -21,59 +22,155 @@ load_dotenv()
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 PINECONE_ENVIRONMENT = os.getenv("PINECONE_ENVIRONMENT", "us-east-1")
 PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME", "knoverse-index")
+# Pinecone accepts at most 1000 ids per delete call
+DELETE_BATCH_SIZE = int(os.getenv("DELETE_BATCH_SIZE", "1000"))
 
 
-def delete_file_from_pinecone(file_id: str):
-    # Defensive checks and clearer debug for list_indexes returning None
-    if not PINECONE_API_KEY:
+def _get_index():
+    """Shared index handle of the configured VECTOR_BACKEND (no new client per delete)."""
+    if not vector_backend.is_local() and not PINECONE_API_KEY:
         raise ValueError("PINECONE_API_KEY is not set in environment variables")
+    return vector_backend.get_index()
 
-    try:
-        pc = Pinecone(api_key=PINECONE_API_KEY)
-    except Exception as e:
-        # If client construction fails, raise with context
-        raise RuntimeError(f"Failed to instantiate Pinecone client: {e}")
 
-    # Debug: show the client repr (helps detect import/version conflicts)
-    print(f"Pinecone client: {repr(pc)}")
+def _namespaces(team_id: Optional[str]) -> List[str]:
+    """Namespaces that may hold vectors of a file of `team_id`."""
+    if team_id or not vector_backend.per_team():
+        return [vector_backend.namespace_for(team_id)]
+    return vector_backend.namespaces()
+
+
+def _delete_ids(index, ids: List[str], namespace: str) -> int:
+    for batch in ingest_manifest.batched_ids(ids, DELETE_BATCH_SIZE):
+        index.delete(ids=batch, namespace=namespace)
+    return len(ids)
+
 
+def _listed_ids(index, file_id: str, namespace: str) -> List[str]:
+    """Ids of the file found by listing its id prefix (vector ids start with file_id#)."""
+    ids, token = [], None
     try:
-        index_list = pc.list_indexes()
+        while True:
+            page = index.list_paginated(prefix=f"{file_id}#", namespace=namespace, pagination_token=token)
+            ids.extend(vector.id for vector in page.vectors or [])
+            token = page.pagination.next if page.pagination else None
+            if not token:
+                return ids
     except Exception as e:
-        # Provide the raw exception which often contains HTTP status / auth info
-        raise RuntimeError(f"pc.list_indexes() raised an exception: {e}")
+        # Pod-based indexes can't list ids
+        print(f"Warning: listing vector ids of file {file_id} failed: {e}")
+        return ids
 
-    # Debug: show the returned value
-    print(f"pc.list_indexes() -> {repr(index_list)}")
 
-    # Backwards-compatible checks: some clients return None on error
-    if index_list is None:
-        raise RuntimeError("pc.list_indexes() returned None - check PINECONE_API_KEY, network access, and installed pinecone package versions.")
-
-    # index_list is expected to have an .indexes list or be an iterable of names
+def _delete_unregistered(index, file_id: str, namespace: str) -> int:
+    """Delete a file indexed before the id registry existed."""
+    ids = _listed_ids(index, file_id, namespace)
+    if ids:
+        return _delete_ids(index, ids, namespace)
+    try:
+        index.delete(filter={"file_id": file_id}, namespace=namespace)
+    except Exception as e:
+        # Serverless indexes don't support delete by metadata filter
+        print(f"Warning: filter delete of file {file_id} in {namespace} failed: {e}")
+    return 0
+
+
+def delete_files(file_ids: Iterable[str], teams: Dict[str, str] = None) -> dict:
+    """Delete every vector of `file_ids` with batched delete-by-id calls.
+
+    Ids come from the registry (ingest_manifest.vector_ids) and are grouped
+    per namespace, so many files cost a few round trips. Files without
+    registered ids fall back to listing their id prefix, then to a
+    metadata-filter delete. `teams` maps file_id -> team_id where known.
+    """
+    file_ids = list(dict.fromkeys(file_ids))
+    if not file_ids:
+        return {"files": 0, "vectors": 0, "unregistered": 0}
+    index = _get_index()
+    teams = {**ingest_manifest.get_teams(file_ids), **{f: t for f, t in (teams or {}).items() if t}}
+    registered = ingest_manifest.vector_ids(file_ids)
+
+    by_namespace = defaultdict(list)
+    unregistered = []
+    for file_id in file_ids:
+        if registered.get(file_id):
+            by_namespace[vector_backend.namespace_for(teams.get(file_id))].extend(registered[file_id])
+        else:
+            unregistered.append(file_id)
+
+    deleted = 0
+    for namespace, ids in by_namespace.items():
+        deleted += _delete_ids(index, ids, namespace)
+    for file_id in unregistered:
+        for namespace in _namespaces(teams.get(file_id)):
+            deleted += _delete_unregistered(index, file_id, namespace)
+
+    bm25_index.delete_files(file_ids)
+    # Forget the files' chunk manifests so a re-upload indexes them from scratch
+    ingest_manifest.delete_many(file_ids)
+
+    print(f"Deleted {deleted} vectors of {len(file_ids)} files from {vector_backend.VECTOR_BACKEND} index "
+          f"({len(unregistered)} without registered ids)")
+    return {"files": len(file_ids), "vectors": deleted, "unregistered": len(unregistered)}
+
+
+def _namespace_counts(index) -> Optional[Dict[str, int]]:
+    """Vector count per namespace (Pinecone's are approximate), or None if unavailable."""
     try:
-        index_names = [idx.name for idx in index_list.indexes] if hasattr(index_list, "indexes") else list(index_list)
-    except Exception:
-        # Fall back to trying to treat the response as a sequence of names
-        try:
-            index_names = list(index_list)
-        except Exception as e:
-            raise RuntimeError(f"Unable to parse pc.list_indexes() result: {e}")
-
-    if PINECONE_INDEX_NAME not in index_names:
-        raise ValueError(f"Pinecone index {PINECONE_INDEX_NAME} does not exist. Available indexes: {index_names}")
-
-    # Get a handle to the actual index and delete matching vectors
-    pine_index = pc.Index(PINECONE_INDEX_NAME)
-
-    pine_index.delete(
-        filter={
-            "file_id": file_id  # Replace with the actual file_id to delete
-        },
-        namespace="pdf-documents"
-    )
-
-    print(f"Deleted entries with file_id {file_id} from Pinecone index.")
+        namespaces = index.describe_index_stats().namespaces or {}
+    except Exception as e:
+        print(f"Warning: describing index stats failed: {e}")
+        return None
+    # Local summaries are dicts, Pinecone's are objects
+    return {
+        name: (summary.get("vector_count") if isinstance(summary, dict) else getattr(summary, "vector_count", None)) or 0
+        for name, summary in namespaces.items()
+    }
+
+
+def delete_teams(team_ids: Iterable[str]) -> dict:
+    """Delete every vector of `team_ids`.
+
+    A team with its own namespace is dropped with one delete_all call;
+    in the shared namespace the team's registered files are deleted by id,
+    plus a team_id filter delete for anything unregistered where supported.
+    """
+    team_ids = [team_id for team_id in dict.fromkeys(team_ids) if team_id]
+    index = _get_index()
+    files = {team_id: ingest_manifest.files_for_team(team_id) for team_id in team_ids}
+    all_files = [file_id for team_files in files.values() for file_id in team_files]
+    deleted = 0
+    if vector_backend.per_team():
+        # Counted before the namespaces are dropped: delete_all doesn't report it
+        counts = _namespace_counts(index)
+        deleted = None if counts is None else sum(
+            counts.get(vector_backend.team_namespace(team_id), 0) for team_id in team_ids
+        )
+        for team_id in team_ids:
+            try:
+                index.delete(delete_all=True, namespace=vector_backend.team_namespace(team_id))
+            except Exception as e:
+                # Pinecone reports a namespace that was never written as not found
+                print(f"Warning: deleting namespace of team {team_id} failed: {e}")
+        bm25_index.delete_teams(team_ids)
+        ingest_manifest.delete_many(all_files)
+    else:
+        teams = {file_id: team_id for team_id, team_files in files.items() for file_id in team_files}
+        deleted = delete_files(all_files, teams)["vectors"]
+        for team_id in team_ids:
+            try:
+                index.delete(filter={"team_id": team_id}, namespace=vector_backend.DEFAULT_NAMESPACE)
+            except Exception as e:
+                print(f"Warning: filter delete of team {team_id} failed, only registered files were removed: {e}")
+        bm25_index.delete_teams(team_ids)
+
+    print(f"Deleted {len(team_ids)} teams ({len(all_files)} files) from {vector_backend.VECTOR_BACKEND} index")
+    return {"teams": len(team_ids), "files": len(all_files), "vectors": deleted}
+
+
+def delete_file_from_pinecone(file_id: str, team_id: str = None):
+    """Delete every vector of the file from the configured VECTOR_BACKEND."""
+    return delete_files([file_id], {file_id: team_id})
 
 if __name__ == "__main__":
     # Example usage
@@ -5,23 +5,29 @@ This script demonstrates the full workflow of:
 2. Splitting text into chunks
 3. Creating embeddings using Ollama
 4. Uploading to Pinecone vector database
+
+uploadFile runs these steps as an overlapped, bounded pipeline
+(see ingest_pipeline.py).
 """
 
 import os
 import string
+import threading
+import uuid
+from collections import Counter
 from dotenv import load_dotenv
-from typing import List
+from typing import BinaryIO, Callable, List, Optional, Tuple
 import sys
 
 # LangChain imports
-from langchain_community.document_loaders import PyPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.embeddings import OllamaEmbeddings
-from langchain_pinecone import PineconeVectorStore
-
-# Pinecone imports
-from pinecone import Pinecone
-from pinecone import ServerlessSpec
+import embedding_engine
+import ingest_pipeline
+import ingest_manifest
+import vector_backend
+import bm25_index
+import llm_scheduler
+import pdf_extract
 
 # Load environment variables
 load_dotenv()
@@ -37,89 +43,240 @@ PDF_PATH = "pdf/sample-terms-conditions-agreement.pdf"
 # Chunk configuration
 CHUNK_SIZE = 1000
 CHUNK_OVERLAP = 200
+SPLITTER_ARGS = {
+    "chunk_size": CHUNK_SIZE,
+    "chunk_overlap": CHUNK_OVERLAP,
+    "separators": ["\n\n", "\n", " ", ""],
+}
 
+# Number of chunks handed to the embedding engine and upserted per step.
+# Large enough for the engine to keep several embed batches in flight.
+UPSERT_BATCH_SIZE = int(os.getenv("UPSERT_BATCH_SIZE", "256"))
 
-def initialize_pinecone() -> str:
-    """Initialize Pinecone and create index if it doesn't exist."""
-    pc = Pinecone(api_key=PINECONE_API_KEY)
+# progress(stage, done=None, total=None); may raise to abort the upload
+ProgressCallback = Callable[..., None]
 
-    # Check if index exists
-    existing_indexes = pc.list_indexes()
-    index_names = [index.name for index in existing_indexes.indexes] if existing_indexes.indexes else []
 
-    if PINECONE_INDEX_NAME not in index_names:
-        print(f"Creating Pinecone index: {PINECONE_INDEX_NAME}")
-        pc.create_index(
-            name=PINECONE_INDEX_NAME,
-            dimension=768,  # nomic-embed-text uses 768 dimensions
-            metric="cosine",
-            spec=ServerlessSpec(cloud="aws", region=PINECONE_ENVIRONMENT)
-        )
-        print(f"Index {PINECONE_INDEX_NAME} created successfully!")
-    else:
-        print(f"Index {PINECONE_INDEX_NAME} already exists")
+def _report(progress: Optional[ProgressCallback], stage: str, done: int = None, total: int = None):
+    if progress is not None:
+        progress(stage, done, total)
 
-    return PINECONE_INDEX_NAME
+
+def initialize_pinecone() -> str:
+    """Initialize the vector index (creates the Pinecone index if it doesn't exist)."""
+    return vector_backend.ensure_index()
 
 
 def load_and_split_pdf(pdf_path: str, team_id: str, file_id: str) -> List:
-    """Load PDF and split into chunks."""
+    """Load PDF and split into chunks (large PDFs are extracted in parallel, see pdf_extract.py)."""
     print(f"\nLoading PDF from: {pdf_path}")
 
     if not os.path.exists(pdf_path):
         raise FileNotFoundError(f"PDF not found at {pdf_path}")
 
-    # Load PDF
-    loader = PyPDFLoader(pdf_path)
-    documents = loader.load()
-    print(f"Loaded {len(documents)} pages from PDF")
+    # Extract and split pages, in page order
+    chunks = []
+    pages = 0
+    for page_chunks in pdf_extract.iter_page_chunks(pdf_path, pdf_path, SPLITTER_ARGS):
+        pages += 1
+        chunks.extend(tag_chunks(page_chunks, team_id, file_id))
+    print(f"Loaded {pages} pages from PDF")
+    print(f"Split into {len(chunks)} chunks")
 
-    # Split into chunks
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=CHUNK_SIZE,
-        chunk_overlap=CHUNK_OVERLAP,
-        separators=["\n\n", "\n", " ", ""]
-    )
-    chunks = text_splitter.split_documents(documents)
+    return chunks
+
+
+def _make_splitter() -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(**SPLITTER_ARGS)
+
+
+def tag_chunks(chunks: List, team_id: str, file_id: str) -> List:
+    """Tag chunks with team_id / file_id."""
     for chunk in chunks:
         chunk.metadata["team_id"] = team_id
         chunk.metadata["file_id"] = file_id
-    print(f"Split into {len(chunks)} chunks")
-
     return chunks
 
 
-def create_embeddings():
-    """Create embedding instance using Ollama."""
-    print(f"\nInitializing Ollama embeddings with model: {OLLAMA_MODEL}")
-    embeddings = OllamaEmbeddings(
-        model=OLLAMA_MODEL,
-        base_url=OLLAMA_BASE_URL
-    )
-    return embeddings
+def split_pages(pages, team_id: str, file_id: str, text_splitter: RecursiveCharacterTextSplitter = None) -> List:
+    """Split page documents into chunks tagged with team_id / file_id."""
+    text_splitter = text_splitter or _make_splitter()
+    return tag_chunks(text_splitter.split_documents(pages), team_id, file_id)
 
 
-def upload_to_pinecone(chunks: List, embeddings, index_name: str):
-    """Upload document chunks to Pinecone."""
-    print(f"\nUploading {len(chunks)} chunks to Pinecone index: {index_name}")
+def get_index(index_name: str = None):
+    """Return a handle to the index of the configured VECTOR_BACKEND."""
+    return vector_backend.get_index()
 
-    # Create vector store and upload
-    vector_store = PineconeVectorStore.from_documents(
-        documents=chunks,
-        embedding=embeddings,
-        index_name=index_name,
-        namespace="pdf-documents"  # Optional: organize by namespace
-    )
-
-    print(f"Successfully uploaded {len(chunks)} chunks to Pinecone!")
-    return vector_store
 
+def create_embeddings():
+    """Return the shared batched Ollama embedding engine."""
+    print(f"\nInitializing Ollama embeddings with model: {OLLAMA_MODEL}")
+    return embedding_engine.get_engine(OLLAMA_MODEL, OLLAMA_BASE_URL)
+
+
+def test_retrieval(team_id: str, test_query: str = "terms and conditions"):
+    """Run a sample similarity search against the team's uploaded chunks."""
+    print("\nTesting retrieval...")
+    vector_store = vector_backend.get_vector_store(create_embeddings(), vector_backend.namespace_for(team_id))
+    results = vector_store.similarity_search(test_query, k=3, filter=vector_backend.team_filter(team_id))
+    print(f"\nTop 3 results for query '{test_query}':")
+    for i, result in enumerate(results, 1):
+        print(f"\n{i}. Score: {result.metadata.get('score', 'N/A')}")
+        print(f"   Content: {result.page_content[:200]}...")
+
+
+def rollback(file_id: str, team_id: str, previous: Optional[ingest_manifest.Manifest], index):
+    """Remove what an unfinished run of the file added on top of `previous`.
+
+    Deletes the registered pending ids the previous manifest doesn't cover
+    from the index and the BM25 index, leaving the file as it was indexed
+    before the run.
+    """
+    added = [vid for vid in ingest_manifest.pending_ids(file_id) if vid not in (previous or {})]
+    namespace = vector_backend.namespace_for(team_id)
+    for ids in ingest_manifest.batched_ids(added):
+        index.delete(ids=ids, namespace=namespace)
+    bm25_index.delete_ids(added)
+    ingest_manifest.clear_pending(file_id)
+    print(f"Rolled back {len(added)} vectors of file {file_id}")
+
+
+def ingest_pdf_pipelined(path: string, team_id: string, file_id: string, embeddings, index,
+                         progress: Optional[ProgressCallback] = None, incremental: bool = True,
+                         stream: Optional[BinaryIO] = None) -> Tuple[int, int, int]:
+    """Stream a PDF into Pinecone: pages -> chunks -> embeddings -> upserts.
+
+    Each stage runs in its own thread connected by bounded queues, so parsing
+    page N+1 overlaps embedding of page N and only a few batches are ever held
+    in memory. Large PDFs are parsed by a process pool (see pdf_extract.py).
+
+    Chunks get deterministic vector ids (see ingest_manifest.py). With
+    `incremental`, chunks already indexed for this file are skipped; either
+    way, vectors from the previous version that no longer exist are deleted.
+    If `stream` (a seekable binary file) is given the PDF is parsed from it
+    and `path` only names the source. Returns (chunks upserted, chunks
+    skipped as unchanged, chunks parsed).
+
+    If the run fails or is aborted (by `progress` raising), the vectors it
+    added are rolled back before the exception propagates.
+    """
+    if stream is None and not os.path.exists(path):
+        raise FileNotFoundError(f"PDF not found at {path}")
+
+    previous = ingest_manifest.load(file_id)
+    # Ids an interrupted earlier run upserted without saving a manifest
+    leftover = ingest_manifest.pending_ids(file_id)
+    namespace = vector_backend.namespace_for(team_id)
+    current: ingest_manifest.Manifest = {}
+    parsed = {"pages": 0, "chunks": 0, "unchanged": 0}
+    parsed_lock = threading.Lock()
+
+    # BM25 rows of the unchanged chunks, indexed once the run has succeeded
+    unchanged_rows = []
+
+    def split_stage(pages):
+        occurrences = Counter()
+        for page_chunks in pages:
+            chunks = tag_chunks(page_chunks, team_id, file_id)
+            keep = []
+            for chunk in chunks:
+                hash_ = ingest_manifest.chunk_hash(chunk.page_content)
+                vid = ingest_manifest.vector_id(file_id, hash_, occurrences[hash_])
+                occurrences[hash_] += 1
+                page_no = chunk.metadata.get("page")
+                current[vid] = (hash_, len(current), page_no)
+                if incremental and ingest_manifest.is_unchanged(previous, vid, page_no):
+                    unchanged_rows.append((vid, chunk.page_content, chunk.metadata))
+                else:
+                    keep.append((vid, chunk))
+            with parsed_lock:
+                parsed["pages"] += 1
+                parsed["chunks"] += len(chunks)
+                parsed["unchanged"] += len(chunks) - len(keep)
+            yield from keep
+
+    def embed_stage(batches):
+        # Ollama slots are shared fairly between the teams ingesting at once
+        with llm_scheduler.team(team_id):
+            for batch in batches:
+                yield batch, embeddings.embed_documents([chunk.page_content for _, chunk in batch])
+
+    def upsert_stage(embedded):
+        for batch, vectors in embedded:
+            index.upsert(
+                vectors=[
+                    (vid, vector, {**chunk.metadata, "text": chunk.page_content})
+                    for (vid, chunk), vector in zip(batch, vectors)
+                ],
+                namespace=namespace,
+            )
+            # Registered right away so the vectors stay deletable by id if this run dies
+            ingest_manifest.record_upserted(file_id, team_id, [vid for vid, _ in batch])
+            # Lexical rows only for vectors that are actually in the index
+            bm25_index.add([(vid, chunk.page_content, chunk.metadata) for vid, chunk in batch])
+            yield len(batch)
+
+    upserted = 0
+    _report(progress, "embedding", 0, 0)
+    pipeline = ingest_pipeline.run_pipeline(
+        pdf_extract.iter_page_chunks(path if stream is None else stream, path, SPLITTER_ARGS),
+        [
+            lambda pages: ingest_pipeline.batched(split_stage(pages), UPSERT_BATCH_SIZE),
+            embed_stage,
+            upsert_stage,
+        ],
+    )
+    try:
+        for count in pipeline:
+            upserted += count
+            with parsed_lock:
+                done = upserted + parsed["unchanged"]
+                total = parsed["chunks"]
+            _report(progress, "embedding", done, total)
+    except Exception:
+        # Failed or cancelled: stop the stages, then don't leave a partial new version searchable
+        pipeline.close()
+        try:
+            rollback(file_id, team_id, previous, index)
+        except Exception as e:
+            # The ids stay registered; the next run of the file deletes them as stale
+            print(f"Warning: failed to roll back file {file_id}: {e}")
+        raise
 
-def uploadFile(path: string, team_id:string, file_id:string):
-    """Main workflow: Load PDF -> Create embeddings -> Upload to Pinecone."""
+    # Re-index the unchanged chunks too, in case the BM25 index lacks them
+    for start in range(0, len(unchanged_rows), UPSERT_BATCH_SIZE):
+        bm25_index.add(unchanged_rows[start:start + UPSERT_BATCH_SIZE])
+    stale = ingest_manifest.stale_ids(previous, current, leftover)
+    for ids in ingest_manifest.batched_ids(stale):
+        index.delete(ids=ids, namespace=namespace)
+    bm25_index.delete_ids(stale)
+    ingest_manifest.save(file_id, team_id, current)
+
+    print(
+        f"Parsed {parsed['pages']} pages: upserted {upserted} new/changed chunks, "
+        f"skipped {parsed['unchanged']} unchanged, deleted {len(stale)} stale vectors"
+    )
+    return upserted, parsed["unchanged"], parsed["chunks"]
+
+
+def uploadFile(path: string, team_id:string, file_id:string, progress: Optional[ProgressCallback] = None,
+               incremental: bool = True, stream: Optional[BinaryIO] = None):
+    """Main workflow: Load PDF -> Create embeddings -> Upload to Pinecone.
+
+    Parsing, splitting, embedding and upserting run as an overlapped
+    pipeline (see ingest_pdf_pipelined). `progress` is called as
+    progress(stage, done, total) with stages "parsing", "embedding" (chunks
+    done / chunks parsed so far) and "upserted" (chunks indexed / chunks in the
+    PDF); it may raise to abort.
+    With `incremental`, only chunks that changed since the file was last
+    indexed are embedded and upserted. With `stream`, the PDF is read from
+    that binary file instead of from `path` (see ingest_pdf_pipelined).
+    Returns the number of chunks uploaded.
+    """
     try:
         # Validate configuration
-        if not PINECONE_API_KEY:
+        if not vector_backend.is_local() and not PINECONE_API_KEY:
             raise ValueError("PINECONE_API_KEY not set in environment variables")
 
         print("=" * 60)
@@ -129,31 +286,31 @@ def uploadFile(path: string, team_id:string, file_id:string):
         # Step 1: Initialize Pinecone
         index_name = initialize_pinecone()
 
-        # Step 2: Load and split PDF
-        chunks = load_and_split_pdf(path, team_id, file_id)
-
-        # Step 3: Create embeddings using Ollama
+        # Step 2: Create embeddings using Ollama
         embeddings = create_embeddings()
 
-        # Step 4: Upload to Pinecone
-        vector_store = upload_to_pinecone(chunks, embeddings, index_name)
+        # Step 3: Stream pages -> chunks -> embeddings -> Pinecone
+        _report(progress, "parsing")
+        count, unchanged, total = ingest_pdf_pipelined(path, team_id, file_id, embeddings, get_index(index_name),
+                                                       progress, incremental, stream)
+        _report(progress, "upserted", count + unchanged, total)
 
         print("\n" + "=" * 60)
         print("Pipeline completed successfully!")
+        print(f"Embedding throughput: {embeddings.stats()['chunks_per_sec']} chunks/sec")
         print("=" * 60)
 
-        # Optional: Test retrieval
-        print("\nTesting retrieval...")
-        test_query = "terms and conditions"
-        results = vector_store.similarity_search(test_query, k=3)
-        print(f"\nTop 3 results for query '{test_query}':")
-        for i, result in enumerate(results, 1):
-            print(f"\n{i}. Score: {result.metadata.get('score', 'N/A')}")
-            print(f"   Content: {result.page_content[:200]}...")
+        return count
 
     except Exception as e:
         print(f"\nError: {str(e)}")
         raise
 
 if __name__ == "__main__":
-    uploadFile(sys.argv[1], "2285d04b-98c9-4a1e-9276-941f5cd77d67")
+    # usage: python pinecone_file_upload.py <pdf_path> [team_id] [file_id]
+    team_id = sys.argv[2] if len(sys.argv) > 2 else "2285d04b-98c9-4a1e-9276-941f5cd77d67"
+    # Vector ids and the chunk manifest are keyed on the file id
+    file_id = sys.argv[3] if len(sys.argv) > 3 else str(uuid.uuid4())
+    print(f"Indexing {sys.argv[1]} as file {file_id} of team {team_id}")
+    uploadFile(sys.argv[1], team_id, file_id)
+    test_retrieval(team_id)
@@ -1,32 +1,42 @@
 """
-Interactive query tool for searching indexed documents in Pinecone
-Usage: python query_documents.py
+Interactive query tool for searching indexed documents (Pinecone or local backend)
+Usage: python query_documents.py [--team <team_id>] [query ...]
+
+Searches one team's documents (--team, or TEAM_ID from the environment).
 """
 
 import os
 from dotenv import load_dotenv
 from langchain_community.embeddings import OllamaEmbeddings
-from langchain_pinecone import PineconeVectorStore
+
+import vector_backend
 
 load_dotenv()
 
 PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME", "knoverse-index")
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "nomic-embed-text")
 OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+TEAM_ID = os.getenv("TEAM_ID")
+
 
+def team_id_from_args(args):
+    """Team to search: `--team <id>` (removed from `args`) or TEAM_ID."""
+    if "--team" in args:
+        position = args.index("--team")
+        team_id = args[position + 1] if position + 1 < len(args) else None
+        del args[position:position + 2]
+        return team_id
+    return TEAM_ID
 
-def initialize_vector_store():
-    """Initialize the vector store for queries."""
+
+def initialize_vector_store(team_id: str):
+    """Initialize the vector store for queries over the team's namespace."""
     embeddings = OllamaEmbeddings(
         model=OLLAMA_MODEL,
         base_url=OLLAMA_BASE_URL
     )
     
-    vector_store = PineconeVectorStore(
-        index_name=PINECONE_INDEX_NAME,
-        embedding=embeddings,
-        namespace="pdf-documents"
-    )
+    vector_store = vector_backend.get_vector_store(embeddings, vector_backend.namespace_for(team_id))
     
     return vector_store
 
@@ -49,7 +59,7 @@ def format_results(results, query):
         print()
 
 
-def interactive_search():
+def interactive_search(team_id: str):
     """Interactive search loop."""
     print("\n" + "="*60)
     print("Document Search Tool")
@@ -57,7 +67,7 @@ def interactive_search():
     print("Initialize vector store...", end=" ", flush=True)
     
     try:
-        vector_store = initialize_vector_store()
+        vector_store = initialize_vector_store(team_id)
         print("✓")
     except Exception as e:
         print(f"✗\nError: {str(e)}")
@@ -89,7 +99,7 @@ def interactive_search():
                 continue
             
             # Perform search
-            results = vector_store.similarity_search(query, k=3)
+            results = vector_store.similarity_search(query, k=3, **vector_backend.search_kwargs(team_id))
             format_results(results, query)
             
         except KeyboardInterrupt:
@@ -100,28 +110,31 @@ def interactive_search():
             continue
 
 
-def batch_search(queries):
+def batch_search(queries, team_id: str):
     """Search multiple queries at once."""
     print("Initializing vector store...")
     
     try:
-        vector_store = initialize_vector_store()
+        vector_store = initialize_vector_store(team_id)
     except Exception as e:
         print(f"Error: {str(e)}")
         return
     
     for query in queries:
-        results = vector_store.similarity_search(query, k=3)
+        results = vector_store.similarity_search(query, k=3, **vector_backend.search_kwargs(team_id))
         format_results(results, query)
 
 
 if __name__ == "__main__":
     import sys
     
-    if len(sys.argv) > 1:
+    args = sys.argv[1:]
+    team_id = team_id_from_args(args)
+    if not team_id:
+        sys.exit("Usage: python query_documents.py --team <team_id> [query ...] (or set TEAM_ID)")
+    if args:
         # Batch search mode
-        queries = sys.argv[1:]
-        batch_search(queries)
+        batch_search(args, team_id)
     else:
         # Interactive mode
-        interactive_search()
+        interactive_search(team_id)
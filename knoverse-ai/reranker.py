@@ -0,0 +1,199 @@
+"""
+LLM-free reranking of retrieved chunks.
+
+Retrieval over-fetches RERANK_FETCH_K candidates (dense and BM25, fused),
+which is cheap; every chunk sent to the LLM costs prefill time, so only the
+best RERANK_K are forwarded. Candidates are rescored on the CPU from lexical
+features of the query against each chunk:
+
+- bm25: BM25 of the query within the candidate, with the team's idf
+  (bm25_index.term_weights), normalised by the best candidate;
+- coverage: idf-weighted share of the distinct query terms the chunk contains;
+- phrase: share of adjacent query term pairs that also appear adjacent in the chunk;
+- prior: the candidate's position in the fused retrieval ranking.
+
+Scores are a weighted sum (RERANK_WEIGHTS="bm25=0.35,coverage=0.3,phrase=0.15,prior=0.2").
+Fan-out and final k can be set per team with RERANK_TEAM_CONFIG, e.g.
+'{"<team_id>": {"fetch_k": 40, "k": 6}}'.
+
+Per-stage retrieval timings (dense, keyword, fusion, rerank) are recorded
+with timed() and reported by stats().
+"""
+
+import os
+import json
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import List
+from dotenv import load_dotenv
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+import bm25_index
+
+load_dotenv()
+
+# Configuration
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "true").lower() in ("1", "true", "yes")
+RERANK_FETCH_K = int(os.getenv("RERANK_FETCH_K", "30"))
+RERANK_K = int(os.getenv("RERANK_K", "4"))
+RERANK_WEIGHTS = os.getenv("RERANK_WEIGHTS", "bm25=0.35,coverage=0.3,phrase=0.15,prior=0.2")
+RERANK_TEAM_CONFIG = os.getenv("RERANK_TEAM_CONFIG", "")
+# Recent timings kept per stage for the percentiles in stats()
+TIMING_SAMPLES = 512
+
+FEATURES = ("bm25", "coverage", "phrase", "prior")
+
+
+def _parse_weights(spec: str) -> dict:
+    weights = dict.fromkeys(FEATURES, 0.0)
+    for item in spec.split(","):
+        name, _, value = item.strip().partition("=")
+        if name in weights:
+            weights[name] = float(value)
+    return weights
+
+
+def _parse_team_config(spec: str) -> dict:
+    if not spec.strip():
+        return {}
+    try:
+        config = json.loads(spec)
+    except ValueError as e:
+        print(f"Warning: ignoring invalid RERANK_TEAM_CONFIG: {e}")
+        return {}
+    return {str(team): dict(values) for team, values in config.items()}
+
+
+_weights = _parse_weights(RERANK_WEIGHTS)
+_team_config = _parse_team_config(RERANK_TEAM_CONFIG)
+
+
+def team_settings(team_id: str) -> dict:
+    """{"fetch_k", "k"} for `team_id`: the team's override or the defaults."""
+    override = _team_config.get(team_id, {})
+    k = max(1, int(override.get("k", RERANK_K)))
+    return {"fetch_k": max(k, int(override.get("fetch_k", RERANK_FETCH_K))), "k": k}
+
+
+# -- Stage timings ------------------------------------------------------------
+
+_lock = threading.Lock()
+_timings = {}
+_stats = {"reranked": 0, "reordered": 0, "candidates": 0}
+
+
+@contextmanager
+def timed(stage: str):
+    """Record the wall time of the block under `stage`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        with _lock:
+            samples = _timings.get(stage)
+            if samples is None:
+                samples = _timings[stage] = [0, 0.0, deque(maxlen=TIMING_SAMPLES)]
+            samples[0] += 1
+            samples[1] += elapsed
+            samples[2].append(elapsed)
+
+
+# -- Scoring --------------------------------------------------------------------
+
+def _pairs(tokens: List[str]) -> set:
+    return set(zip(tokens, tokens[1:]))
+
+
+def score(query: str, docs: List[Document], team_id: str = None) -> List[float]:
+    """Rerank score of each candidate in `docs` (given in retrieval order)."""
+    query_tokens = bm25_index.tokenize(query)
+    n = len(docs)
+    if not n:
+        return []
+    priors = [1.0 - rank / n for rank in range(n)]
+    if not query_tokens:
+        return priors
+
+    terms = list(dict.fromkeys(query_tokens))
+    idf, avgdl = bm25_index.term_weights(team_id, terms) if team_id else ({}, 0.0)
+    idf = {term: idf.get(term, 1.0) for term in terms}
+    total_idf = sum(idf.values()) or 1.0
+    query_pairs = _pairs(query_tokens)
+
+    doc_tokens = [bm25_index.tokenize(doc.page_content) for doc in docs]
+    avgdl = avgdl or (sum(len(tokens) for tokens in doc_tokens) / n) or 1.0
+    k1, b = bm25_index.BM25_K1, bm25_index.BM25_B
+
+    bm25, coverage, phrase = [], [], []
+    for tokens in doc_tokens:
+        counts = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        norm = k1 * (1 - b + b * len(tokens) / avgdl)
+        bm25.append(sum(
+            idf[term] * counts[term] * (k1 + 1) / (counts[term] + norm) for term in terms if term in counts
+        ))
+        coverage.append(sum(idf[term] for term in terms if term in counts) / total_idf)
+        phrase.append(len(query_pairs & _pairs(tokens)) / len(query_pairs) if query_pairs else 0.0)
+
+    best = max(bm25) or 1.0
+    return [
+        _weights["bm25"] * bm25[i] / best
+        + _weights["coverage"] * coverage[i]
+        + _weights["phrase"] * phrase[i]
+        + _weights["prior"] * priors[i]
+        for i in range(n)
+    ]
+
+
+def rerank(query: str, docs: List[Document], k: int, team_id: str = None) -> List[Document]:
+    """The `k` best of `docs` by rerank score."""
+    docs = list(docs)
+    with timed("rerank"):
+        scores = score(query, docs, team_id)
+        order = sorted(range(len(docs)), key=lambda i: (-scores[i], i))[:k]
+    with _lock:
+        _stats["reranked"] += 1
+        _stats["candidates"] += len(docs)
+        if order != list(range(min(k, len(docs)))):
+            _stats["reordered"] += 1
+    return [docs[i] for i in order]
+
+
+class RerankingRetriever(BaseRetriever):
+    """Over-fetching retriever for one team followed by the rerank stage."""
+
+    candidates: BaseRetriever
+    team_id: str
+    k: int = RERANK_K
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        with timed("retrieve"):
+            candidates = self.candidates.invoke(query)
+        return rerank(query, candidates, self.k, self.team_id)
+
+
+def stats() -> dict:
+    with _lock:
+        stages = {
+            stage: {
+                "count": count,
+                "avg_ms": round(total / count * 1000, 2) if count else 0.0,
+                "p95_ms": round(sorted(samples)[int(0.95 * (len(samples) - 1))] * 1000, 2) if samples else 0.0,
+            }
+            for stage, (count, total, samples) in _timings.items()
+        }
+        result = dict(_stats)
+    result["avg_candidates"] = round(result["candidates"] / result["reranked"], 1) if result["reranked"] else 0.0
+    result["enabled"] = RERANK_ENABLED
+    result["defaults"] = {"fetch_k": RERANK_FETCH_K, "k": RERANK_K}
+    result["team_overrides"] = len(_team_config)
+    result["weights"] = dict(_weights)
+    result["stages"] = stages
+    return result
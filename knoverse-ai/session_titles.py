@@ -0,0 +1,247 @@
+"""
+Session titles without an LLM call on the critical path.
+
+The first message of a session gets an instant extractive title (its first
+few keywords). A nicer LLM title is then queued for a single low-priority
+background worker, which:
+
+- deduplicates: a session is queued at most once per worker;
+- is rate limited to TITLE_LLM_PER_MINUTE generations;
+- skips LLM titles entirely under load: when the queue is full, at least
+  TITLE_SKIP_CHAT_IN_FLIGHT chats are in flight or requests are already
+  waiting for the LLM, the extractive title stays;
+- generates at the lowest Ollama priority (llm_scheduler.TITLE), so a title
+  never delays a chat answer and is shed if it can't start in time.
+
+The LLM title only replaces the extractive one if the session still has it,
+so a rename in the UI is never overwritten.
+"""
+
+import os
+import re
+import time
+import queue
+import threading
+from collections import OrderedDict
+from typing import Optional
+from dotenv import load_dotenv
+import llm_scheduler
+
+load_dotenv()
+
+# Configuration
+OLLAMA_LLM_MODEL = os.getenv("OLLAMA_LLM_MODEL", "gemma3:1b")
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "ollama:11434")
+TITLE_LLM_ENABLED = os.getenv("TITLE_LLM_ENABLED", "true").lower() in ("1", "true", "yes")
+TITLE_LLM_PER_MINUTE = float(os.getenv("TITLE_LLM_PER_MINUTE", "30"))
+TITLE_QUEUE_SIZE = int(os.getenv("TITLE_QUEUE_SIZE", "64"))
+TITLE_SKIP_CHAT_IN_FLIGHT = int(os.getenv("TITLE_SKIP_CHAT_IN_FLIGHT", "3"))
+TITLE_MAX_WORDS = 6
+TITLE_MAX_CHARS = 50
+# Sessions known to have a title, so later messages skip the lookup
+TITLE_KNOWN_SESSIONS = int(os.getenv("TITLE_KNOWN_SESSIONS", "4096"))
+
+_WORD = re.compile(r"[A-Za-z0-9][A-Za-z0-9'._-]*")
+_STOPWORDS = frozenset("""
+    a about above after again all am an and any are as at be because been before being below between both but by
+    can could did do does doing down during each few for from further had has have having he her here hers him his
+    how i if in into is it its itself just me more most my no nor not now of off on once only or other our ours out
+    over own please same she should so some such than that the their theirs them then there these they this those
+    through to too under until up very was we were what when where which while who whom why will with would you
+    your yours hi hello hey thanks thank tell know want need like help
+""".split())
+
+_lock = threading.Lock()
+_known: "OrderedDict[str, None]" = OrderedDict()
+_pending = set()
+_queue: "queue.Queue" = queue.Queue(maxsize=TITLE_QUEUE_SIZE)
+_worker: Optional[threading.Thread] = None
+_llm = None
+_next_allowed = 0.0
+_stats = {"extractive": 0, "queued": 0, "generated": 0, "kept": 0, "skipped_load": 0, "skipped_rate": 0,
+          "dropped_full": 0, "failed": 0}
+
+
+def extractive_title(message: str) -> str:
+    """Title from the first keywords of the message, e.g. 'Refund Policy Clause 4.2'."""
+    words = []
+    seen = set()
+    for word in _WORD.findall(message or ""):
+        word = word.strip("'._-")
+        key = word.lower()
+        if not word or key in _STOPWORDS or key in seen:
+            continue
+        seen.add(key)
+        words.append(word if word.isupper() or any(c.isdigit() for c in word) else word.capitalize())
+        if len(words) == TITLE_MAX_WORDS:
+            break
+    title = " ".join(words)
+    if len(title) > TITLE_MAX_CHARS:
+        title = title[:TITLE_MAX_CHARS - 3].rstrip() + "..."
+    if title:
+        return title
+    fallback = (message or "").strip().splitlines()[0][:TITLE_MAX_CHARS].strip() if (message or "").strip() else ""
+    return fallback or "New Chat"
+
+
+def _get_llm():
+    global _llm
+    if _llm is None:
+        from langchain_community.llms import Ollama
+
+        _llm = Ollama(model=OLLAMA_LLM_MODEL, base_url=OLLAMA_BASE_URL, temperature=0.3)
+    return _llm
+
+
+def _generate(message: str) -> Optional[str]:
+    """LLM title for `message`; raises llm_scheduler.Overloaded if shed."""
+    prompt = f"""Generate a very short, descriptive title (max 6 words) for a chat session that starts with this message.
+Return ONLY the title, nothing else. No quotes, no explanation, no punctuation at the end.
+
+User message: {message[:500]}
+
+Title:"""
+    try:
+        with llm_scheduler.slot(OLLAMA_LLM_MODEL, llm_scheduler.TITLE):
+            response = _get_llm().invoke(prompt)
+    except llm_scheduler.Overloaded:
+        raise
+    except Exception as e:
+        print(f"Warning: Ollama session name generation failed: {e}")
+        return None
+    # Clean up the response
+    title = response.strip().splitlines()[0].strip().strip('"\'').strip() if response.strip() else ""
+    # Remove trailing punctuation
+    title = title.rstrip(".,!?;:")
+    # Truncate if too long
+    if len(title) > TITLE_MAX_CHARS:
+        title = title[:TITLE_MAX_CHARS - 3] + "..."
+    return title or None
+
+
+def generate_llm_title(message: str) -> Optional[str]:
+    """LLM-generated title (max ~50 chars), or None if generation fails or Ollama is overloaded."""
+    try:
+        return _generate(message)
+    except llm_scheduler.Overloaded as e:
+        print(f"Warning: session name generation skipped: {e}")
+        return None
+
+
+def _remember(chat_session: str):
+    with _lock:
+        _known[chat_session] = None
+        _known.move_to_end(chat_session)
+        while len(_known) > TITLE_KNOWN_SESSIONS:
+            _known.popitem(last=False)
+
+
+def _under_load() -> bool:
+    import concurrency
+
+    if llm_scheduler.queue_depth(OLLAMA_LLM_MODEL):
+        return True
+    return concurrency.stats()["in_flight"][concurrency.CHAT] >= TITLE_SKIP_CHAT_IN_FLIGHT
+
+
+def _take_rate_slot() -> bool:
+    global _next_allowed
+    if TITLE_LLM_PER_MINUTE <= 0:
+        return False
+    now = time.monotonic()
+    with _lock:
+        if now < _next_allowed:
+            return False
+        _next_allowed = now + 60.0 / TITLE_LLM_PER_MINUTE
+        return True
+
+
+def _count(key: str):
+    with _lock:
+        _stats[key] += 1
+
+
+def _work():
+    while True:
+        supabase, chat_session, message, extractive = _queue.get()
+        try:
+            if _under_load():
+                _count("skipped_load")
+                continue
+            if not _take_rate_slot():
+                _count("skipped_rate")
+                continue
+            try:
+                title = _generate(message)
+            except llm_scheduler.Overloaded:
+                _count("skipped_load")
+                continue
+            if not title:
+                _count("failed")
+                continue
+            # Only replace our own extractive title, never a user rename
+            supabase.from_("chat_sessions").update({"session_name": title}).eq("id", chat_session).eq(
+                "session_name", extractive
+            ).execute()
+            _count("generated")
+            print(f"Generated session name for {chat_session}: {title}")
+        except Exception as e:
+            _count("failed")
+            print(f"Warning: failed to update LLM session title for {chat_session}: {e}")
+        finally:
+            with _lock:
+                _pending.discard(chat_session)
+            _queue.task_done()
+
+
+def _enqueue(supabase, chat_session: str, message: str, extractive: str):
+    global _worker
+    if not TITLE_LLM_ENABLED:
+        return
+    if _under_load():
+        _count("skipped_load")
+        return
+    with _lock:
+        if chat_session in _pending:
+            return
+        if _worker is None:
+            _worker = threading.Thread(target=_work, name="session-titles", daemon=True)
+            _worker.start()
+        try:
+            _queue.put_nowait((supabase, chat_session, message, extractive))
+        except queue.Full:
+            _stats["dropped_full"] += 1
+            return
+        _pending.add(chat_session)
+        _stats["queued"] += 1
+
+
+def ensure_title(supabase, chat_session: str, message: str):
+    """Give an untitled session an extractive title now and queue an LLM title."""
+    with _lock:
+        if chat_session in _known:
+            _known.move_to_end(chat_session)
+            return
+
+    session_resp = supabase.from_("chat_sessions").select("session_name").eq("id", chat_session).maybe_single().execute()
+    session_row = getattr(session_resp, "data", None) or session_resp
+    current_name = session_row.get("session_name") if isinstance(session_row, dict) else None
+    if current_name and str(current_name).strip():
+        _remember(chat_session)
+        _count("kept")
+        return
+
+    extractive = extractive_title(message)
+    supabase.from_("chat_sessions").update({"session_name": extractive}).eq("id", chat_session).execute()
+    _remember(chat_session)
+    _count("extractive")
+    print(f"Session {chat_session} titled '{extractive}'")
+    _enqueue(supabase, chat_session, message, extractive)
+
+
+def stats() -> dict:
+    with _lock:
+        result = dict(_stats)
+        result["pending"] = len(_pending)
+    result["llm_enabled"] = TITLE_LLM_ENABLED
+    return result
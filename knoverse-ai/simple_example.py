@@ -1,19 +1,28 @@
 """
 Simple example: Ask questions about PDF using LangChain + Ollama + Pinecone
 This is the most straightforward way to get started
+
+Usage: python simple_example.py <team_id>   (or set TEAM_ID)
 """
 
 import os
+import sys
 from dotenv import load_dotenv
 from langchain_community.embeddings import OllamaEmbeddings
-from langchain_pinecone import PineconeVectorStore
 from langchain_community.llms import Ollama
 from langchain_core.prompts import PromptTemplate
 from langchain_core.runnables import RunnablePassthrough
 from langchain_core.output_parsers import StrOutputParser
 
+import vector_backend
+
 load_dotenv()
 
+# Vectors are stored per team (see vector_backend.namespace_for)
+TEAM_ID = sys.argv[1] if len(sys.argv) > 1 else os.getenv("TEAM_ID")
+if not TEAM_ID:
+    sys.exit("Usage: python simple_example.py <team_id> (or set TEAM_ID)")
+
 # Step 1: Create embeddings (for retrieving relevant chunks)
 print("Setting up embeddings...")
 embeddings = OllamaEmbeddings(
@@ -21,13 +30,9 @@ embeddings = OllamaEmbeddings(
     base_url="http://localhost:11434"
 )
 
-# Step 2: Connect to your Pinecone vector store (from main.py)
-print("Connecting to Pinecone...")
-vector_store = PineconeVectorStore(
-    index_name="knoverse-index",
-    embedding=embeddings,
-    namespace="pdf-documents"
-)
+# Step 2: Connect to your vector store (Pinecone, or local with VECTOR_BACKEND=local)
+print(f"Connecting to {vector_backend.VECTOR_BACKEND} vector store...")
+vector_store = vector_backend.get_vector_store(embeddings, vector_backend.namespace_for(TEAM_ID))
 
 # Step 3: Create an LLM (for generating answers)
 print("Initializing LLM...")
@@ -37,7 +42,7 @@ llm = Ollama(
 )
 
 # Step 4: Create a simple RAG pipeline
-retriever = vector_store.as_retriever(search_kwargs={"k": 3})
+retriever = vector_store.as_retriever(search_kwargs={**vector_backend.search_kwargs(TEAM_ID), "k": 3})
 
 template = """Based on the following context from the document, answer the question.
 
@@ -0,0 +1,19 @@
+"""
+Test setup: import the service modules from the parent directory and point
+every store at a throwaway directory, on the local vector backend.
+"""
+
+import os
+import sys
+import tempfile
+
+_data_dir = tempfile.mkdtemp(prefix="knoverse-tests-")
+
+# Read at import time by the modules under test
+os.environ["VECTOR_BACKEND"] = "local"
+os.environ["LOCAL_VECTOR_PATH"] = os.path.join(_data_dir, "vector_data")
+os.environ["INGEST_MANIFEST_DB"] = os.path.join(_data_dir, "ingest_manifest.sqlite3")
+os.environ["BM25_INDEX_DB"] = os.path.join(_data_dir, "bm25_index.sqlite3")
+os.environ["INGEST_JOBS_DB"] = os.path.join(_data_dir, "ingest_jobs.sqlite3")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,106 @@
+"""A cancelled or failed ingest leaves the file as it was indexed before."""
+
+import hashlib
+
+import pytest
+from langchain_core.documents import Document
+
+import bm25_index
+import ingest_jobs
+import ingest_manifest
+import pinecone_file_upload as pfu
+import vector_backend
+
+TEAM_ID = "team-rollback"
+DIMENSION = 8
+
+
+class FakeEmbeddings:
+    """Deterministic embeddings, so no Ollama is needed."""
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        return [byte / 255.0 + 0.01 for byte in digest[:DIMENSION]]
+
+
+def _pages(version, count):
+    def iter_page_chunks(pdf, source, splitter_args):
+        for number in range(count):
+            yield [Document(page_content=f"{version} page {number} chunk {n}", metadata={"page": number})
+                   for n in range(3)]
+    return iter_page_chunks
+
+
+def _ingest(monkeypatch, file_id, version, pages, progress=None):
+    monkeypatch.setattr(pfu.pdf_extract, "iter_page_chunks", _pages(version, pages))
+    return pfu.ingest_pdf_pipelined(
+        "test.pdf", TEAM_ID, file_id, FakeEmbeddings(), vector_backend.get_index(), progress, stream=object()
+    )
+
+
+def _indexed(vector_ids):
+    index = vector_backend.get_index()
+    found = index.fetch(vector_ids, namespace=vector_backend.namespace_for(TEAM_ID)).vectors
+    return set(found)
+
+
+def _lexical(file_id):
+    return {vid for vid, *_ in bm25_index.search(TEAM_ID, "page chunk", k=1000) if vid.startswith(file_id)}
+
+
+@pytest.fixture(autouse=True)
+def small_batches(monkeypatch):
+    monkeypatch.setattr(pfu, "UPSERT_BATCH_SIZE", 2)
+
+
+def test_cancel_mid_ingest_rolls_back_to_previous_version(monkeypatch):
+    file_id = "file-cancelled"
+    _ingest(monkeypatch, file_id, "v1", pages=2)
+    previous = ingest_manifest.load(file_id)
+    assert _indexed(list(previous)) == set(previous)
+
+    def progress(stage, done=None, total=None):
+        if stage == "embedding" and done:
+            raise ingest_jobs.JobCancelled()
+
+    with pytest.raises(ingest_jobs.JobCancelled):
+        _ingest(monkeypatch, file_id, "v2", pages=20, progress=progress)
+
+    # Only the previous version is left, in the vector and the BM25 index
+    assert ingest_manifest.load(file_id) == previous
+    assert ingest_manifest.pending_ids(file_id) == []
+    stats = vector_backend.get_index().describe_index_stats()
+    assert stats.namespaces[vector_backend.namespace_for(TEAM_ID)]["vector_count"] == len(previous)
+    assert _indexed(list(previous)) == set(previous)
+    assert _lexical(file_id) == set(previous)
+
+
+def test_failed_first_ingest_leaves_nothing_behind(monkeypatch):
+    file_id = "file-failed"
+    index = vector_backend.get_index()
+
+    class FailingIndex:
+        """Fails the third upsert, after two batches went in."""
+
+        upserts = 0
+
+        def __getattr__(self, name):
+            return getattr(index, name)
+
+        def upsert(self, **kwargs):
+            FailingIndex.upserts += 1
+            if FailingIndex.upserts > 2:
+                raise RuntimeError("upsert failed")
+            return index.upsert(**kwargs)
+
+    monkeypatch.setattr(pfu.pdf_extract, "iter_page_chunks", _pages("v1", 20))
+    with pytest.raises(RuntimeError):
+        pfu.ingest_pdf_pipelined("test.pdf", TEAM_ID, file_id, FakeEmbeddings(), FailingIndex(), stream=object())
+
+    assert FailingIndex.upserts == 3
+    assert ingest_manifest.load(file_id) is None
+    assert ingest_manifest.pending_ids(file_id) == []
+    assert _lexical(file_id) == set()
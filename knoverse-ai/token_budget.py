@@ -0,0 +1,33 @@
+"""
+Cheap token estimates for prompt budgeting.
+
+Ollama models use their own tokenizers, which we can't load here without a
+round trip, so budgets use the usual ~4 characters per token estimate. It is
+only used to keep prompts bounded, not for exact accounting.
+"""
+
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CHARS_PER_TOKEN = float(os.getenv("CHARS_PER_TOKEN", "4"))
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count of `text`."""
+    if not text:
+        return 0
+    return int(len(text) / CHARS_PER_TOKEN) + 1
+
+
+def truncate_to_tokens(text: str, max_tokens: int, suffix: str = "...") -> str:
+    """Cut `text` to roughly `max_tokens`, preferring a word boundary."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    limit = max(0, int(max_tokens * CHARS_PER_TOKEN) - len(suffix))
+    cut = text[:limit]
+    space = cut.rfind(" ")
+    if space > limit // 2:
+        cut = cut[:space]
+    return cut.rstrip() + suffix
@@ -0,0 +1,154 @@
+"""
+Vector store backend selection.
+
+VECTOR_BACKEND=pinecone (default) uses the hosted Pinecone index;
+VECTOR_BACKEND=local uses the NumPy / memory-mapped store in
+local_vector_store.py under LOCAL_VECTOR_PATH. Both expose the same index
+API (upsert / query / delete / fetch / describe_index_stats) and a LangChain
+VectorStore, so ingestion, deletion, chat and the CLI scripts run unchanged
+against either backend.
+
+VECTOR_NAMESPACE_STRATEGY decides where a team's vectors live:
+- shared (default): every team in DEFAULT_NAMESPACE, isolated by a team_id
+  metadata filter;
+- per_team: each team in its own namespace (TEAM_NAMESPACE_PREFIX + team_id),
+  so queries and deletes only touch that team's vectors and need no filter.
+Existing shared data is moved with migrate_namespaces.py.
+"""
+
+import os
+import threading
+from typing import List, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Configuration
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone").lower()
+LOCAL_VECTOR_PATH = os.getenv("LOCAL_VECTOR_PATH", "vector_data")
+PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
+PINECONE_ENVIRONMENT = os.getenv("PINECONE_ENVIRONMENT", "us-east-1")
+PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME", "knoverse-index")
+PINECONE_DIMENSION = int(os.getenv("PINECONE_DIMENSION", "768"))  # nomic-embed-text
+DEFAULT_NAMESPACE = "pdf-documents"
+VECTOR_NAMESPACE_STRATEGY = os.getenv("VECTOR_NAMESPACE_STRATEGY", "shared").lower()
+TEAM_NAMESPACE_PREFIX = os.getenv("TEAM_NAMESPACE_PREFIX", "team-")
+
+SHARED = "shared"
+PER_TEAM = "per_team"
+
+if VECTOR_BACKEND not in ("pinecone", "local"):
+    raise ValueError(f"Unknown VECTOR_BACKEND {VECTOR_BACKEND!r}; expected 'pinecone' or 'local'")
+if VECTOR_NAMESPACE_STRATEGY not in (SHARED, PER_TEAM):
+    raise ValueError(f"Unknown VECTOR_NAMESPACE_STRATEGY {VECTOR_NAMESPACE_STRATEGY!r}; expected 'shared' or 'per_team'")
+
+_lock = threading.Lock()
+_index = None
+
+
+def is_local() -> bool:
+    return VECTOR_BACKEND == "local"
+
+
+def per_team() -> bool:
+    return VECTOR_NAMESPACE_STRATEGY == PER_TEAM
+
+
+def team_namespace(team_id: str) -> str:
+    """The team's own namespace (whatever the current strategy)."""
+    return f"{TEAM_NAMESPACE_PREFIX}{team_id}"
+
+
+def namespace_for(team_id: Optional[str]) -> str:
+    """Namespace holding `team_id`'s vectors under the configured strategy."""
+    if per_team() and team_id:
+        return team_namespace(team_id)
+    return DEFAULT_NAMESPACE
+
+
+def team_filter(team_id: Optional[str]) -> Optional[dict]:
+    """Metadata filter isolating the team inside its namespace, if one is needed."""
+    if per_team() and team_id:
+        return None
+    return {"team_id": team_id}
+
+
+def search_kwargs(team_id: str) -> dict:
+    """Vector store search arguments confining a search to the team's vectors."""
+    kwargs = {"namespace": namespace_for(team_id)}
+    metadata_filter = team_filter(team_id)
+    if metadata_filter is not None:
+        kwargs["filter"] = metadata_filter
+    return kwargs
+
+
+def namespaces() -> List[str]:
+    """Namespaces that currently hold vectors."""
+    return list((get_index().describe_index_stats().namespaces or {}).keys())
+
+
+def ensure_index() -> str:
+    """Make sure the index exists (creating the Pinecone index if needed).
+
+    The Pinecone check is done once per process (see connections.py).
+    """
+    if is_local():
+        return LOCAL_VECTOR_PATH
+
+    import connections
+
+    info = connections.pinecone_index_info(PINECONE_INDEX_NAME)
+    if info is None:
+        from pinecone import ServerlessSpec
+
+        print(f"Creating Pinecone index: {PINECONE_INDEX_NAME}")
+        connections.pinecone().create_index(
+            name=PINECONE_INDEX_NAME,
+            dimension=PINECONE_DIMENSION,
+            metric="cosine",
+            spec=ServerlessSpec(cloud="aws", region=PINECONE_ENVIRONMENT)
+        )
+        print(f"Index {PINECONE_INDEX_NAME} created successfully!")
+        connections.forget_index_info(PINECONE_INDEX_NAME)
+    elif info["dimension"] != PINECONE_DIMENSION:
+        print(f"Warning: index {PINECONE_INDEX_NAME} has dimension {info['dimension']}, "
+              f"PINECONE_DIMENSION is {PINECONE_DIMENSION}")
+
+    return PINECONE_INDEX_NAME
+
+
+def get_index():
+    """Shared index handle for the configured backend."""
+    global _index
+    if not is_local():
+        import connections
+
+        return connections.pinecone_index(PINECONE_INDEX_NAME)
+    if _index is not None:
+        return _index
+    with _lock:
+        if _index is None:
+            from local_vector_store import LocalIndex
+
+            _index = LocalIndex(LOCAL_VECTOR_PATH)
+        return _index
+
+
+def get_vector_store(embedding, namespace: str = DEFAULT_NAMESPACE):
+    """LangChain VectorStore over the configured backend."""
+    if is_local():
+        from local_vector_store import LocalVectorStore
+
+        return LocalVectorStore(get_index(), embedding, namespace=namespace)
+
+    from langchain_pinecone import PineconeVectorStore
+
+    # Reuse the shared index handle instead of a client per store
+    return PineconeVectorStore(index=get_index(), embedding=embedding, namespace=namespace)
+
+
+def stats() -> dict:
+    result = {"backend": VECTOR_BACKEND, "namespace_strategy": VECTOR_NAMESPACE_STRATEGY}
+    if is_local() and _index is not None:
+        result["ann"] = _index.ann_stats()
+    return result
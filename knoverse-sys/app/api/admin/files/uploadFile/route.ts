@@ -73,6 +73,7 @@ export async function POST(request: NextRequest) {
 
   let filePath = "";
   let fileId = "";
+  let jobId: string | undefined;
   // Upload file to Supabase Storage
   try {
     const uploadResponse = await supabaseUploadFile(teamId, newFile);
@@ -110,6 +111,7 @@ export async function POST(request: NextRequest) {
     }
 
     const pythonJson = await pythonResp.json().catch(() => ({}));
+    jobId = pythonJson.jobId;
   } catch (error: unknown) {
     console.error("Error calling python server:", error);
     return NextResponse.json(
@@ -120,5 +122,6 @@ export async function POST(request: NextRequest) {
 
   return NextResponse.json({
     message: `File ${filePath} uploaded successfully`,
+    jobId,
   });
 }